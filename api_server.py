@@ -1,9 +1,9 @@
 # api_server.py
-import uvicorn
+import asyncio
 import requests
 from fastapi import FastAPI
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
 import os
 import sys
 
@@ -15,6 +15,8 @@ if project_root not in sys.path:
 try:
     from app.core_engine import CoreEngine
     from app.config_loader import load_settings
+    from app.service_transport import run_server, SERVICE_CORE
+    from app.telegram_webhook import TelegramWebhook, make_webhook_router, DEFAULT_TELEGRAM_API_URL
 except ModuleNotFoundError:
     print("Ошибка: Не удалось импортировать модули.")
     sys.exit(1)
@@ -30,12 +32,21 @@ class TelegramCommandRequest(BaseModel):
 class VoiceCommandRequest(BaseModel):
     text: str
     is_voice: bool = True
+    session_id: Optional[str] = None  # Сессия потокового STT (см. /command/partial)
+    speech_ended_at: Optional[float] = None  # Unix-время конца речи, для замера задержки
+    room: Optional[str] = None  # Комната сателлита (см. interfaces/satellite_hub.py)
+
+# Частичный транскрипт, пока пользователь еще говорит
+class PartialCommandRequest(BaseModel):
+    session_id: str
+    text: str
 
 # --- Инициализация ---
 app = FastAPI(title="Nox Core API")
 core_engine = CoreEngine()
 settings = load_settings()
 TELEGRAM_TOKEN = settings.get("telegram_bot", {}).get("token")
+TELEGRAM_API_URL = settings.get("telegram_bot", {}).get("api_base_url", DEFAULT_TELEGRAM_API_URL).rstrip("/")
 FALLBACK_CHAT_ID = settings.get("telegram_bot", {}).get("allowed_user_ids", [])[0]
 print("API_Server: CoreEngine и конфигурация успешно инициализированы.")
 
@@ -45,7 +56,7 @@ def send_telegram_notification(chat_id: int, text: str):
         print("API_Server Warning: Telegram token is missing or text is empty")
         return
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
+    url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_TOKEN}/sendMessage"
     payload = {"chat_id": chat_id, "text": text}
     try:
         requests.post(url, json=payload, timeout=10)
@@ -54,8 +65,13 @@ def send_telegram_notification(chat_id: int, text: str):
         print(f"API_Server Error: Не удалось отправить сообщение в Telegram: {e}")
 
 # ИЗМЕНЕНИЕ: Обновляем общую логику обработки
-async def _process_and_respond(history: List[Dict[str, str]], is_voice: bool, response_chat_id: int):
-    """Общая логика обработки для всех источников."""
+def _run_command(history: List[Dict[str, str]], is_voice: bool, response_chat_id: int,
+                 session_id: Optional[str] = None, speech_ended_at: Optional[float] = None,
+                 room: Optional[str] = None) -> Optional[str]:
+    """
+    Общая логика обработки для всех источников. Блокирует (LLM, Home Assistant),
+    поэтому вызывается в пуле потоков. Возвращает ответ для пользователя.
+    """
     # Для NLU нам нужен последний запрос пользователя
     last_user_message = ""
     if history and history[-1]["role"] == "user":
@@ -68,13 +84,24 @@ async def _process_and_respond(history: List[Dict[str, str]], is_voice: bool, re
     # Надо (правильно):
     engine_response_dict = core_engine.process_user_command(
         history=history,
-        is_voice_command=is_voice
+        is_voice_command=is_voice,
+        # Поздние поправки (команда не подтвердилась устройством) уходят в тот же чат
+        notify=lambda text: send_telegram_notification(response_chat_id, text),
+        session_id=session_id,
+        speech_ended_at=speech_ended_at,
+        room=room,
     )
     
-    final_response = engine_response_dict.get("final_status_response")
-    
+    return engine_response_dict.get("final_status_response")
+
+async def _process_and_respond(history: List[Dict[str, str]], is_voice: bool, response_chat_id: int,
+                               session_id: Optional[str] = None, speech_ended_at: Optional[float] = None,
+                               room: Optional[str] = None):
+    """Команда и ответ в Telegram в пуле потоков: цикл событий сервера не блокируется."""
+    final_response = await asyncio.to_thread(_run_command, history, is_voice, response_chat_id,
+                                             session_id, speech_ended_at, room)
     if final_response:
-        send_telegram_notification(response_chat_id, final_response)
+        await asyncio.to_thread(send_telegram_notification, response_chat_id, final_response)
 
 # --- API Эндпоинты ---
 # ИЗМЕНЕНИЕ: Обновляем эндпоинт для приема нового формата
@@ -83,18 +110,37 @@ async def process_telegram_command_endpoint(request: TelegramCommandRequest):
     await _process_and_respond(request.history, request.is_voice, request.chat_id)
     return {"status": "telegram command processed"}
 
+# Режим telegram_bot.mode: webhook — Telegram присылает обновления прямо сюда, без процесса бота
+# Ответ на команду из webhook отправляет сам TelegramWebhook (асинхронно, через sendMessage)
+TELEGRAM_WEBHOOK = TelegramWebhook(settings, _run_command)
+if TELEGRAM_WEBHOOK.enabled:
+    app.include_router(make_webhook_router(TELEGRAM_WEBHOOK))
+
 @app.post("/command/microphone")
 async def process_microphone_command_endpoint(request: VoiceCommandRequest):
     # Для микрофона мы симулируем историю из одного сообщения
     history = [{"role": "user", "content": request.text}]
-    await _process_and_respond(history, request.is_voice, FALLBACK_CHAT_ID)
+    await _process_and_respond(history, request.is_voice, FALLBACK_CHAT_ID,
+                               session_id=request.session_id, speech_ended_at=request.speech_ended_at,
+                               room=request.room)
     return {"status": "microphone command processed"}
 
+@app.post("/command/partial")
+async def process_partial_command_endpoint(request: PartialCommandRequest):
+    """Частичный транскрипт: ядро заранее запускает триаж, финал придет в /command/microphone с тем же session_id."""
+    core_engine.prepare_partial_command(request.session_id, request.text)
+    return {"status": "partial accepted"}
+
+@app.get("/status")
+async def status_endpoint():
+    """Состояние ядра: версия и возраст реестра устройств (видно, если данные устарели)."""
+    return core_engine.get_status()
+
 # --- Точка входа для запуска сервера ---
 def start_api_server(host="127.0.0.1", port=8000):
-    """Запускает FastAPI сервер."""
-    print(f"Starting Nox Core API server at http://{host}:{port}")
-    uvicorn.run(app, host=host, port=port)
+    """Запускает FastAPI сервер (на TCP или Unix-сокете, по transport.mode)."""
+    print("Starting Nox Core API server...")
+    run_server(app, settings, SERVICE_CORE, host=host, port=port)
 
 if __name__ == "__main__":
     # Это для прямого запуска файла, например, для отладки
@@ -16,14 +16,41 @@ except (IndexError, NameError):
     if str(project_root) not in sys.path:
         sys.path.insert(0, str(project_root))
 
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
+from websockets.sync.client import connect as ws_connect
+from websockets.exceptions import WebSocketException
 
 from app.config_loader import load_settings
+from app.adapters.service_confirmation import ServiceConfirmationTracker
+
+# Пауза между попытками переподключения к WebSocket API (секунды)
+MIRROR_RECONNECT_DELAY_MIN = 1.0
+MIRROR_RECONNECT_DELAY_MAX = 30.0
+
+# Сервисы, для которых можно заранее сказать, в какое состояние перейдет устройство
+OPTIMISTIC_DOMAINS = {"light", "switch", "fan", "input_boolean"}
+OPTIMISTIC_TARGET_STATES = {"turn_on": "on", "turn_off": "off"}
+DEFAULT_CONFIRMATION_TIMEOUT = 5.0
+
 
 class HomeAssistantAdapter:
     def __init__(self):
         print("HA_Adapter: Инициализация...")
+        self.state_mirror_enabled = False
+        self._state_mirror: Dict[str, Dict[str, Any]] = {}
+        self._mirror_lock = threading.Lock()
+        self._mirror_ready = threading.Event()
+        self._mirror_stop = threading.Event()
+        self._mirror_thread = None
+        self._event_listeners: Dict[str, List[Callable[[dict], None]]] = {}
+        self.optimistic_execution = False
+        self.elide_noop_calls = False
+        self.confirmations = ServiceConfirmationTracker(DEFAULT_CONFIRMATION_TIMEOUT)
+        self._service_executor = None
         try:
             settings = load_settings()
             ha_config = settings.get("home_assistant", {})
@@ -35,34 +62,186 @@ class HomeAssistantAdapter:
                 "Authorization": f"Bearer {self.token}",
                 "Content-Type": "application/json",
             }
+            self.state_mirror_enabled = bool(ha_config.get("state_mirror", False))
+            self.optimistic_execution = bool(ha_config.get("optimistic_execution", False))
+            self.elide_noop_calls = bool(ha_config.get("elide_noop_calls", False))
+            self.confirmations.timeout_seconds = float(ha_config.get("confirmation_timeout_seconds", DEFAULT_CONFIRMATION_TIMEOUT))
             print("HA_Adapter: Конфигурация Home Assistant успешно загружена.")
         except (ValueError, FileNotFoundError) as e:
             print(f"HA_Adapter: КРИТИЧЕСКАЯ ОШИБКА - {e}")
             self.base_url = None
 
+        if self.optimistic_execution:
+            # Подтверждения приходят через события state_changed зеркала состояний
+            self._service_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ha-service")
+            self.add_event_listener("state_changed", self.confirmations.handle_state_changed)
+
+    @staticmethod
+    def _format_entity(entity: dict) -> Dict[str, Any]:
+        entity_id = entity.get("entity_id")
+        domain = entity_id.split('.')[0] if '.' in entity_id else 'unknown'
+        attributes = entity.get("attributes", {})
+        friendly_name = attributes.get("friendly_name", entity_id)
+        return {
+            "entity_id": entity_id, "domain": domain,
+            "friendly_name": friendly_name, "state": entity.get("state"),
+            "attributes": attributes,
+            "last_updated": entity.get("last_updated", ""),
+        }
+
     def get_all_entities(self) -> Optional[List[Dict[str, Any]]]:
         if not self.base_url: return None
         api_url = f"{self.base_url}/api/states"
         try:
             response = requests.get(api_url, headers=self.headers, timeout=15)
             response.raise_for_status()
-            formatted_entities = []
-            for entity in response.json():
-                entity_id = entity.get("entity_id")
-                domain = entity_id.split('.')[0] if '.' in entity_id else 'unknown'
-                attributes = entity.get("attributes", {})
-                friendly_name = attributes.get("friendly_name", entity_id)
-                formatted_entities.append({
-                    "entity_id": entity_id, "domain": domain,
-                    "friendly_name": friendly_name, "state": entity.get("state"), 
-                    "attributes": attributes
-                })
-            return formatted_entities
+            return [self._format_entity(entity) for entity in response.json()]
         except requests.exceptions.RequestException as e:
             print(f"HA_Adapter Error: Ошибка сети при получении сущностей: {e}")
             return None
 
-    def call_service(self, service_call_json: dict) -> dict:
+    def get_entity_state(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает состояние одной сущности. Если зеркало состояний синхронизировано,
+        ответ берется из памяти за O(1); иначе делается точечный GET /api/states/<entity_id>.
+        """
+        if self._mirror_ready.is_set():
+            with self._mirror_lock:
+                return self._state_mirror.get(entity_id)
+
+        if not self.base_url: return None
+        api_url = f"{self.base_url}/api/states/{entity_id}"
+        try:
+            response = requests.get(api_url, headers=self.headers, timeout=10)
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return self._format_entity(response.json())
+        except requests.exceptions.RequestException as e:
+            print(f"HA_Adapter Error: Ошибка сети при получении состояния {entity_id}: {e}")
+            return None
+
+    # --- ЗЕРКАЛО СОСТОЯНИЙ (WebSocket API) ---
+
+    @property
+    def websocket_url(self) -> str:
+        if self.base_url.startswith("https://"):
+            return "wss://" + self.base_url[len("https://"):] + "/api/websocket"
+        return "ws://" + self.base_url.removeprefix("http://") + "/api/websocket"
+
+    @property
+    def state_mirror_ready(self) -> bool:
+        return self._mirror_ready.is_set()
+
+    def start_state_mirror(self):
+        """Запускает фоновый поток, который держит зеркало состояний в актуальном виде."""
+        if not self.base_url or (self._mirror_thread and self._mirror_thread.is_alive()):
+            return
+        self._mirror_stop.clear()
+        self._mirror_thread = threading.Thread(target=self._run_state_mirror, name="ha-state-mirror", daemon=True)
+        self._mirror_thread.start()
+        print("HA_Adapter: Поток зеркала состояний запущен.")
+
+    def stop_state_mirror(self, timeout: float = 5.0):
+        self._mirror_stop.set()
+        if self._mirror_thread:
+            self._mirror_thread.join(timeout=timeout)
+        self._mirror_ready.clear()
+
+    def wait_for_state_mirror(self, timeout: float) -> bool:
+        return self._mirror_ready.wait(timeout)
+
+    def add_event_listener(self, event_type: str, callback: Callable[[dict], None]):
+        """
+        Подписывает callback на события HA указанного типа (приходят через поток зеркала).
+        Callback вызывается в потоке зеркала и должен быть быстрым. Подписка на новый
+        тип события вступает в силу при следующем (пере)подключении.
+        """
+        self._event_listeners.setdefault(event_type, []).append(callback)
+
+    def _run_state_mirror(self):
+        delay = MIRROR_RECONNECT_DELAY_MIN
+        while not self._mirror_stop.is_set():
+            try:
+                with ws_connect(self.websocket_url, open_timeout=10) as ws:
+                    self._authenticate_websocket(ws)
+                    event_types = ["state_changed"] + [t for t in self._event_listeners if t != "state_changed"]
+                    for message_id, event_type in enumerate(event_types, start=1):
+                        ws.send(json.dumps({"id": message_id, "type": "subscribe_events", "event_type": event_type}))
+                    # Подписываемся ДО ресинхронизации, чтобы не потерять изменения между GET и подпиской
+                    if not self._resync_state_mirror():
+                        raise ConnectionError("REST-ресинхронизация не удалась.")
+                    delay = MIRROR_RECONNECT_DELAY_MIN
+                    while not self._mirror_stop.is_set():
+                        try:
+                            raw_message = ws.recv(timeout=1.0)
+                        except TimeoutError:
+                            continue
+                        self._handle_websocket_message(json.loads(raw_message))
+            except (WebSocketException, OSError, ConnectionError, ValueError) as e:
+                print(f"HA_Adapter Warning: Соединение зеркала состояний потеряно: {e}. Переподключение через {delay:.0f} с.")
+            self._mirror_ready.clear()
+            if self._mirror_stop.wait(delay):
+                break
+            delay = min(delay * 2, MIRROR_RECONNECT_DELAY_MAX)
+
+    def _authenticate_websocket(self, ws):
+        greeting = json.loads(ws.recv(timeout=10))
+        if greeting.get("type") != "auth_required":
+            raise ConnectionError(f"Неожиданное приветствие WebSocket API: {greeting}")
+        ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+        reply = json.loads(ws.recv(timeout=10))
+        if reply.get("type") != "auth_ok":
+            raise ConnectionError(f"Авторизация в WebSocket API отклонена: {reply}")
+
+    def _resync_state_mirror(self) -> bool:
+        entities = self.get_all_entities()
+        if entities is None:
+            return False
+        with self._mirror_lock:
+            self._state_mirror = {entity["entity_id"]: entity for entity in entities}
+        self._mirror_ready.set()
+        print(f"HA_Adapter: Зеркало состояний синхронизировано ({len(entities)} сущностей).")
+        return True
+
+    def _handle_websocket_message(self, message: dict):
+        if message.get("type") != "event":
+            if message.get("type") == "result" and not message.get("success", True):
+                print(f"HA_Adapter Warning: WebSocket API вернул ошибку: {message}")
+            return
+        event = message.get("event", {})
+        event_type = event.get("event_type")
+        if event_type == "state_changed":
+            self._apply_state_changed(event.get("data", {}))
+        for callback in self._event_listeners.get(event_type, []):
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"HA_Adapter Error: Ошибка в обработчике события '{event_type}': {e}")
+
+    def _apply_state_changed(self, data: dict):
+        entity_id = data.get("entity_id")
+        new_state = data.get("new_state")
+        if not entity_id:
+            return
+        with self._mirror_lock:
+            if new_state is None:
+                self._state_mirror.pop(entity_id, None)
+                return
+            formatted = self._format_entity(new_state)
+            current = self._state_mirror.get(entity_id)
+            # События, пришедшие раньше REST-снимка, не должны откатывать состояние назад
+            if current and formatted["last_updated"] < current.get("last_updated", ""):
+                return
+            self._state_mirror[entity_id] = formatted
+
+    def call_service(self, service_call_json: dict, on_correction: Optional[Callable[[str], None]] = None) -> dict:
+        """
+        Вызывает сервис HA. В оптимистичном режиме (optimistic_execution) для
+        turn_on/turn_off/toggle успех возвращается сразу после того, как вызов принят,
+        а реальное подтверждение ждется по событию state_changed. Если устройство
+        не дошло до нужного состояния, on_correction получает текст для пользователя.
+        """
         if not self.base_url:
             return {"success": False, "error": "Адаптер HA не инициализирован."}
 
@@ -90,7 +269,77 @@ class HomeAssistantAdapter:
         if not payload.get("entity_id"):
              print(f"HA_Adapter Warning: В теле запроса отсутствует entity_id. Запрос может не сработать.")
 
+        elided = []
+        if self.elide_noop_calls:
+            payload, elided = self._elide_noop_entities(action, payload)
+            if elided and not payload.get("entity_id"):
+                print(f"HA_Adapter: Вызов {service} пропущен: все сущности уже в нужном состоянии {elided}.")
+                return self._elided_result(action, elided)
+
+        expected_states = self._expected_states(action, payload) if self._service_executor else None
+        if expected_states:
+            result = self._call_service_optimistic(api_url, service, payload, expected_states, on_correction)
+        else:
+            result = self._post_service(api_url, service, payload)
+        if elided:
+            result["elided_entities"] = elided
+        return result
+
+    # --- ПРОПУСК ВЫЗОВОВ БЕЗ ЭФФЕКТА ---
+
+    def _expand_entity_ids(self, entity_ids: List[str]) -> List[str]:
+        """Раскрывает группы (сущности с атрибутом entity_id, например люстра) в участников."""
+        expanded = []
+        for entity_id in entity_ids:
+            members = (self.get_entity_state(entity_id) or {}).get("attributes", {}).get("entity_id")
+            if isinstance(members, list) and members:
+                expanded.extend(m for m in members if m not in expanded)
+            elif entity_id not in expanded:
+                expanded.append(entity_id)
+        return expanded
+
+    def _elide_noop_entities(self, action: str, payload: dict) -> tuple:
+        """
+        Убирает из вызова turn_on/turn_off сущности, которые по зеркалу состояний
+        уже находятся в целевом состоянии.
+
+        Returns:
+            (payload для HA, список пропущенных entity_id)
+        """
+        target_state = OPTIMISTIC_TARGET_STATES.get(action)
+        if not target_state or not self._mirror_ready.is_set():
+            return payload, []
+        # turn_on с яркостью/цветом меняет атрибуты и у уже включенного света
+        if action == "turn_on" and set(payload) - {"entity_id"}:
+            return payload, []
+        entity_ids = payload.get("entity_id")
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        if not entity_ids:
+            return payload, []
 
+        remaining, elided = [], []
+        for entity_id in self._expand_entity_ids(entity_ids):
+            state = (self.get_entity_state(entity_id) or {}).get("state")
+            if entity_id.split('.')[0] in OPTIMISTIC_DOMAINS and state == target_state:
+                elided.append(entity_id)
+            else:
+                remaining.append(entity_id)
+        if not elided:
+            return payload, []
+        return {**payload, "entity_id": remaining}, elided
+
+    def _elided_result(self, action: str, elided: List[str]) -> dict:
+        names = ", ".join((self.get_entity_state(e) or {}).get("friendly_name", e) for e in elided)
+        state_word = "включено" if action == "turn_on" else "выключено"
+        return {
+            "success": True,
+            "elided": True,
+            "elided_entities": elided,
+            "message": f"Уже {state_word}: {names}.",
+        }
+
+    def _post_service(self, api_url: str, service: str, payload: dict) -> dict:
         try:
             response = requests.post(api_url, headers=self.headers, json=payload, timeout=10)
             response.raise_for_status()
@@ -103,3 +352,57 @@ class HomeAssistantAdapter:
         except requests.exceptions.RequestException as e:
             print(f"HA_Adapter Error: Ошибка сети при вызове сервиса: {e}")
             return {"success": False, "error": f"Ошибка сети: {e}"}
+
+    # --- ОПТИМИСТИЧНОЕ ВЫПОЛНЕНИЕ ---
+
+    def _expected_states(self, action: str, payload: dict) -> Optional[Dict[str, str]]:
+        """
+        Целевое состояние для каждой сущности вызова или None, если его нельзя
+        предсказать (неподходящий сервис/домен или зеркало состояний не готово).
+        """
+        if not self._mirror_ready.is_set():
+            return None
+        entity_ids = payload.get("entity_id")
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        if not entity_ids:
+            return None
+
+        expected = {}
+        for entity_id in entity_ids:
+            if entity_id.split('.')[0] not in OPTIMISTIC_DOMAINS:
+                return None
+            if action == "toggle":
+                current = (self.get_entity_state(entity_id) or {}).get("state")
+                if current not in ("on", "off"):
+                    return None
+                expected[entity_id] = "off" if current == "on" else "on"
+            elif action in OPTIMISTIC_TARGET_STATES:
+                expected[entity_id] = OPTIMISTIC_TARGET_STATES[action]
+            else:
+                return None
+        return expected
+
+    def _call_service_optimistic(self, api_url: str, service: str, payload: dict,
+                                 expected_states: Dict[str, str],
+                                 on_correction: Optional[Callable[[str], None]]) -> dict:
+        for entity_id, target_state in expected_states.items():
+            current = self.get_entity_state(entity_id) or {}
+            self.confirmations.expect(entity_id, target_state, current.get("friendly_name", entity_id), on_correction)
+            if current.get("state") == target_state:
+                # Устройство уже в нужном состоянии: state_changed не придет
+                self.confirmations.observe_state(entity_id, target_state)
+        self._service_executor.submit(self._post_service_in_background, api_url, service, payload, list(expected_states))
+        print(f"HA_Adapter: Сервис {service} принят (оптимистично), жду подтверждения для {list(expected_states)}.")
+        return {
+            "success": True,
+            "optimistic": True,
+            "pending_confirmation": list(expected_states),
+            "message": f"Сервис {service} для {payload.get('entity_id')} принят к выполнению.",
+        }
+
+    def _post_service_in_background(self, api_url: str, service: str, payload: dict, entity_ids: List[str]):
+        result = self._post_service(api_url, service, payload)
+        if not result.get("success"):
+            for entity_id in entity_ids:
+                self.confirmations.fail(entity_id, result.get("error", "ошибка вызова сервиса"))
@@ -0,0 +1,118 @@
+# app/adapters/service_confirmation.py
+"""
+Отслеживание подтверждений для оптимистичных вызовов сервисов Home Assistant.
+
+После того как вызов принят, адаптер регистрирует здесь ожидаемое состояние каждой
+сущности. Подтверждением считается событие state_changed с нужным состоянием;
+если оно не пришло за отведенное время (или HTTP-вызов упал), вызывается
+callback коррекции, чтобы сообщить пользователю, что команда не сработала.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+# Сколько последних замеров задержки хранить на одно устройство
+LATENCY_HISTORY_SIZE = 50
+
+
+class PendingConfirmation:
+    __slots__ = ("entity_id", "target_state", "name", "started", "on_correction", "timer")
+
+    def __init__(self, entity_id: str, target_state: str, name: str,
+                 on_correction: Optional[Callable[[str], None]]):
+        self.entity_id = entity_id
+        self.target_state = target_state
+        self.name = name
+        self.started = time.monotonic()
+        self.on_correction = on_correction
+        self.timer = None
+
+
+class ServiceConfirmationTracker:
+    def __init__(self, timeout_seconds: float = 5.0):
+        self.timeout_seconds = timeout_seconds
+        self._pending: Dict[str, PendingConfirmation] = {}
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = {}
+        self._timeouts: Dict[str, int] = {}
+
+    def expect(self, entity_id: str, target_state: str, name: str = "",
+               on_correction: Optional[Callable[[str], None]] = None):
+        """Регистрирует ожидание: entity_id должна перейти в target_state до таймаута."""
+        pending = PendingConfirmation(entity_id, target_state, name or entity_id, on_correction)
+        pending.timer = threading.Timer(self.timeout_seconds, self._on_timeout, args=(pending,))
+        pending.timer.daemon = True
+        with self._lock:
+            previous = self._pending.get(entity_id)
+            if previous:
+                # Новая команда для того же устройства отменяет ожидание предыдущей
+                previous.timer.cancel()
+            self._pending[entity_id] = pending
+        pending.timer.start()
+
+    def is_pending(self, entity_id: str) -> bool:
+        with self._lock:
+            return entity_id in self._pending
+
+    def handle_state_changed(self, event: dict):
+        """Listener для событий state_changed из зеркала состояний адаптера."""
+        data = event.get("data", {})
+        new_state = data.get("new_state") or {}
+        self.observe_state(data.get("entity_id"), new_state.get("state"))
+
+    def observe_state(self, entity_id: Optional[str], state: Optional[str]):
+        with self._lock:
+            pending = self._pending.get(entity_id)
+            if not pending or state != pending.target_state:
+                return
+            del self._pending[entity_id]
+        pending.timer.cancel()
+        latency_ms = (time.monotonic() - pending.started) * 1000
+        with self._lock:
+            self._latencies.setdefault(entity_id, deque(maxlen=LATENCY_HISTORY_SIZE)).append(latency_ms)
+        print(f"HA_Adapter: Подтверждено состояние '{state}' для {entity_id} за {latency_ms:.0f} мс.")
+
+    def fail(self, entity_id: str, reason: str):
+        """Немедленная коррекция (например, HA отклонил вызов)."""
+        with self._lock:
+            pending = self._pending.pop(entity_id, None)
+        if pending:
+            pending.timer.cancel()
+            self._send_correction(pending, f"Прости, не получилось: {pending.name} — {reason}.")
+
+    def _on_timeout(self, pending: PendingConfirmation):
+        with self._lock:
+            if self._pending.get(pending.entity_id) is not pending:
+                return
+            del self._pending[pending.entity_id]
+            self._timeouts[pending.entity_id] = self._timeouts.get(pending.entity_id, 0) + 1
+        print(f"HA_Adapter Warning: {pending.entity_id} не перешел в '{pending.target_state}' за {self.timeout_seconds} с.")
+        self._send_correction(
+            pending,
+            f"Похоже, {pending.name} так и не перешел в состояние '{pending.target_state}'. Проверь устройство."
+        )
+
+    def _send_correction(self, pending: PendingConfirmation, text: str):
+        if not pending.on_correction:
+            return
+        try:
+            pending.on_correction(text)
+        except Exception as e:
+            print(f"HA_Adapter Error: Не удалось отправить коррекцию пользователю: {e}")
+
+    def latency_stats(self) -> Dict[str, dict]:
+        """Статистика задержки подтверждения по устройствам (мс)."""
+        with self._lock:
+            entity_ids = set(self._latencies) | set(self._timeouts)
+            stats = {}
+            for entity_id in sorted(entity_ids):
+                samples = sorted(self._latencies.get(entity_id, ()))
+                stats[entity_id] = {
+                    "confirmed": len(samples),
+                    "timeouts": self._timeouts.get(entity_id, 0),
+                    "avg_ms": round(sum(samples) / len(samples), 1) if samples else None,
+                    "p50_ms": round(samples[len(samples) // 2], 1) if samples else None,
+                    "max_ms": round(samples[-1], 1) if samples else None,
+                }
+            return stats
@@ -0,0 +1,183 @@
+# app/audio_framing.py
+"""Compact binary framing for streamed audio.
+
+A stream is a sequence of frames, each with a 4-byte header::
+
+    kind (u8) | codec (u8) | payload length (u16, little-endian) | payload
+
+``KIND_AUDIO`` frames carry one chunk of audio: raw 16-bit PCM, or one Opus
+packet (20 ms at 16 kHz is 40-60 bytes at 16-24 kbps instead of 640 bytes of
+PCM). ``KIND_END`` marks the end of the utterance. Framing is what lets Opus
+travel over byte streams (the satellite hub's TCP connections) and lets one
+WebSocket message carry several packets.
+
+``FramedAudioDecoder`` turns such a stream back into 16-bit PCM bytes for the
+consumers that already take PCM (``StreamingTranscriber``, the hub).
+"""
+import struct
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .audio_io import SAMPLE_RATE, CODEC_OPUS, CODEC_PCM16, DEFAULT_OPUS_BITRATE, AudioDecodeError, AudioEncodeError, av
+
+FRAME_HEADER = struct.Struct("<BBH")
+MAX_PAYLOAD = 0xFFFF
+
+KIND_AUDIO = 1
+KIND_END = 2
+
+CODEC_IDS = {CODEC_PCM16: 0, CODEC_OPUS: 1}
+CODEC_NAMES = {value: key for key, value in CODEC_IDS.items()}
+OPUS_FRAME_MS = 20
+
+
+def pack_frame(kind: int, codec: str, payload: bytes = b"") -> bytes:
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"frame payload of {len(payload)} bytes exceeds {MAX_PAYLOAD}")
+    return FRAME_HEADER.pack(kind, CODEC_IDS[codec], len(payload)) + payload
+
+
+def pack_end(codec: str = CODEC_PCM16) -> bytes:
+    return pack_frame(KIND_END, codec)
+
+
+class FrameParser:
+    """Incremental parser: feed arbitrary byte chunks, get complete frames back."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Tuple[int, str, bytes]]:
+        """Returns (kind, codec name, payload) for every frame completed by ``data``."""
+        self._buffer += data
+        frames, offset = [], 0
+        while len(self._buffer) - offset >= FRAME_HEADER.size:
+            kind, codec_id, length = FRAME_HEADER.unpack_from(self._buffer, offset)
+            end = offset + FRAME_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            codec = CODEC_NAMES.get(codec_id)
+            if codec is None:
+                raise AudioDecodeError(f"unknown codec id {codec_id} in audio frame")
+            frames.append((kind, codec, bytes(self._buffer[offset + FRAME_HEADER.size:end])))
+            offset = end
+        del self._buffer[:offset]
+        return frames
+
+
+class OpusPacketEncoder:
+    """16-bit PCM -> raw Opus packets (PyAV), one packet per 20 ms."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, bitrate: int = DEFAULT_OPUS_BITRATE):
+        if av is None:
+            raise AudioEncodeError("PyAV is required to stream Opus")
+        self.sample_rate = sample_rate
+        self._context = av.CodecContext.create("libopus", "w")
+        self._context.sample_rate = sample_rate
+        self._context.layout = "mono"
+        self._context.format = "s16"
+        self._context.bit_rate = bitrate
+        self._pts = 0
+
+    def encode(self, samples: Optional[np.ndarray]) -> List[bytes]:
+        """Encode the next chunk (any length; the codec buffers partial 20 ms frames). None flushes."""
+        if samples is None:
+            return [bytes(packet) for packet in self._context.encode(None)]
+        frame = av.AudioFrame.from_ndarray(samples.astype(np.int16, copy=False).reshape(1, -1),
+                                           format="s16", layout="mono")
+        frame.sample_rate = self.sample_rate
+        frame.pts = self._pts
+        self._pts += len(samples)
+        return [bytes(packet) for packet in self._context.encode(frame)]
+
+
+class OpusPacketDecoder:
+    """Raw Opus packets -> 16-bit PCM at ``sample_rate`` (PyAV)."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        if av is None:
+            raise AudioDecodeError("PyAV is required to decode streamed Opus")
+        self._context = av.CodecContext.create("libopus", "r")
+        self._context.sample_rate = sample_rate
+        self._context.layout = "mono"
+        self._resampler = av.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+
+    def decode(self, packet: bytes) -> bytes:
+        try:
+            frames = self._context.decode(av.Packet(packet))
+        except (av.error.FFmpegError, ValueError) as e:
+            raise AudioDecodeError(f"bad Opus packet: {e}") from e
+        parts = [resampled.to_ndarray().reshape(-1)
+                 for frame in frames for resampled in self._resampler.resample(frame)]
+        return np.concatenate(parts).astype("<i2").tobytes() if parts else b""
+
+
+class FramedAudioEncoder:
+    """PCM chunks -> framed stream in the configured codec (the sending side)."""
+
+    def __init__(self, codec: str = CODEC_PCM16, sample_rate: int = SAMPLE_RATE,
+                 bitrate: int = DEFAULT_OPUS_BITRATE):
+        if codec not in CODEC_IDS:
+            raise AudioEncodeError(f"unknown codec '{codec}'")
+        self.codec = codec
+        self._opus = OpusPacketEncoder(sample_rate, bitrate) if codec == CODEC_OPUS else None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.encode_seconds = 0.0
+
+    def encode(self, samples: np.ndarray) -> bytes:
+        started = time.perf_counter()
+        if self._opus is None:
+            pcm = samples.astype("<i2", copy=False).tobytes()
+            payload = b"".join(pack_frame(KIND_AUDIO, self.codec, pcm[i:i + MAX_PAYLOAD - 1])
+                               for i in range(0, len(pcm), MAX_PAYLOAD - 1))
+        else:
+            payload = b"".join(pack_frame(KIND_AUDIO, self.codec, packet) for packet in self._opus.encode(samples))
+        self.encode_seconds += time.perf_counter() - started
+        self.bytes_in += len(samples) * 2
+        self.bytes_out += len(payload)
+        return payload
+
+    def end(self) -> bytes:
+        tail = b""
+        if self._opus is not None:
+            tail = b"".join(pack_frame(KIND_AUDIO, self.codec, packet) for packet in self._opus.encode(None))
+        payload = tail + pack_end(self.codec)
+        self.bytes_out += len(payload)
+        return payload
+
+
+class FramedAudioDecoder:
+    """Framed stream -> 16-bit PCM bytes (the receiving side)."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._parser = FrameParser()
+        self._opus: Optional[OpusPacketDecoder] = None
+        self.ended = False
+        self.bytes_in = 0
+        self.decode_seconds = 0.0
+        self.codecs = set()
+
+    def feed(self, data: bytes) -> bytes:
+        """Returns the PCM carried by the frames completed by ``data``; sets ``ended`` on an end frame."""
+        started = time.perf_counter()
+        self.bytes_in += len(data)
+        pcm = []
+        for kind, codec, payload in self._parser.feed(data):
+            if kind == KIND_END:
+                self.ended = True
+                break
+            if kind != KIND_AUDIO:
+                continue
+            self.codecs.add(codec)
+            if codec == CODEC_PCM16:
+                pcm.append(payload)
+            else:
+                if self._opus is None:
+                    self._opus = OpusPacketDecoder(self.sample_rate)
+                pcm.append(self._opus.decode(payload))
+        self.decode_seconds += time.perf_counter() - started
+        return b"".join(pcm)
@@ -0,0 +1,304 @@
+# app/audio_io.py
+"""In-memory audio decoding for the STT service.
+
+Uploads are turned into the 16 kHz mono float32 arrays Whisper consumes without
+touching the disk. WAV and raw 16-bit PCM are parsed with ``np.frombuffer``
+directly over the received bytes (no copy until the single float32
+conversion). Compressed formats (OGG/Opus from Telegram, MP3, ...) are decoded
+in-process with PyAV (``av`` in requirements.txt). If it cannot be imported,
+e.g. on a platform without prebuilt wheels, a single ``ffmpeg`` subprocess is
+fed through stdin/stdout pipes instead.
+
+The same two paths encode audio for the wire: clients (the microphone
+listener, the satellite hub) can upload OGG/Opus instead of WAV, which is
+about 20x smaller for speech. ``CodecStats`` counts bytes on the wire and the
+time spent encoding/decoding per codec.
+"""
+import io
+import struct
+import subprocess
+import threading
+import wave
+
+import numpy as np
+
+try:
+    import av  # In-process FFmpeg bindings (requirements.txt); the ffmpeg pipe is the fallback
+except ImportError:
+    av = None
+
+SAMPLE_RATE = 16000
+
+# WAVE format tags
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+RAW_PCM_EXTENSIONS = (".pcm", ".raw", ".s16le")
+RAW_PCM_CONTENT_TYPES = ("audio/l16", "audio/pcm")
+
+# Upload codecs: uncompressed 16-bit PCM in a WAV container, or Opus in OGG
+CODEC_PCM16 = "pcm16"
+CODEC_OPUS = "opus"
+CODECS = (CODEC_PCM16, CODEC_OPUS)
+DEFAULT_CODEC = CODEC_PCM16
+DEFAULT_OPUS_BITRATE = 24000
+UPLOAD_FORMATS = {  # codec -> (file extension, MIME type)
+    CODEC_PCM16: (".wav", "audio/wav"),
+    CODEC_OPUS: (".ogg", "audio/ogg"),
+}
+
+
+class AudioDecodeError(ValueError):
+    """The payload could not be decoded as audio."""
+
+
+class AudioEncodeError(ValueError):
+    """The samples could not be encoded with the requested codec."""
+
+
+class CodecStats:
+    """Per-codec counters: payloads, bytes on the wire, audio duration and codec time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codecs = {}
+
+    def record(self, codec: str, payload_bytes: int, audio_seconds: float, seconds: float):
+        with self._lock:
+            totals = self._codecs.setdefault(codec, [0, 0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += payload_bytes
+            totals[2] += audio_seconds
+            totals[3] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                codec: {
+                    "payloads": count,
+                    "bytes": payload_bytes,
+                    "audio_seconds": round(audio_seconds, 2),
+                    "kbps": round(payload_bytes * 8 / audio_seconds / 1000, 1) if audio_seconds else None,
+                    "avg_ms": round(seconds / count * 1000, 2) if count else None,
+                }
+                for codec, (count, payload_bytes, audio_seconds, seconds) in self._codecs.items()
+            }
+
+
+def pcm16_to_float32(pcm) -> np.ndarray:
+    """Little-endian 16-bit PCM (bytes or memoryview) -> float32 samples in [-1, 1]."""
+    usable = len(pcm) - len(pcm) % 2
+    return np.frombuffer(pcm, dtype="<i2", count=usable // 2).astype(np.float32) / 32768.0
+
+
+def to_mono_16k(samples: np.ndarray, sample_rate: int, channels: int = 1) -> np.ndarray:
+    """Downmix interleaved channels and resample (linear interpolation) to 16 kHz."""
+    if channels > 1:
+        usable = len(samples) - len(samples) % channels
+        samples = samples[:usable].reshape(-1, channels).mean(axis=1)
+    if sample_rate != SAMPLE_RATE and len(samples):
+        duration = len(samples) / sample_rate
+        target = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        samples = np.interp(target, np.arange(len(samples)) / sample_rate, samples)
+    return samples.astype(np.float32, copy=False)
+
+
+def parse_wav(data: bytes) -> np.ndarray:
+    """Parse a RIFF/WAVE payload into 16 kHz mono float32 samples."""
+    view = memoryview(data)
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise AudioDecodeError("not a RIFF/WAVE file")
+    offset, fmt = 12, None
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, offset)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            try:
+                fmt = struct.unpack_from("<HHIIHH", data, body)
+                if fmt[0] == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                    # The real format tag opens the SubFormat GUID
+                    fmt = (struct.unpack_from("<H", data, body + 24)[0],) + fmt[1:]
+            except struct.error as e:
+                raise AudioDecodeError(f"truncated WAV fmt chunk: {e}") from e
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioDecodeError("WAV data chunk before fmt chunk")
+            # Streaming writers leave the size at 0 / 0xFFFFFFFF: take the rest of the payload
+            end = len(data) if chunk_size in (0, 0xFFFFFFFF) else min(len(data), body + chunk_size)
+            return _wav_samples(view[body:end], fmt)
+        offset = body + chunk_size + (chunk_size & 1)
+    raise AudioDecodeError("WAV file has no data chunk")
+
+
+def _wav_samples(payload: memoryview, fmt: tuple) -> np.ndarray:
+    format_tag, channels, sample_rate, _, _, bits = fmt
+    if channels < 1 or sample_rate < 1:
+        raise AudioDecodeError(f"bad WAV header ({channels} channels at {sample_rate} Hz)")
+    if format_tag == WAVE_FORMAT_PCM and bits == 16:
+        samples = pcm16_to_float32(payload)
+    elif format_tag == WAVE_FORMAT_PCM and bits == 32:
+        usable = len(payload) - len(payload) % 4
+        samples = np.frombuffer(payload, dtype="<i4", count=usable // 4).astype(np.float32) / 2147483648.0
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        usable = len(payload) - len(payload) % 4
+        samples = np.frombuffer(payload, dtype="<f4", count=usable // 4)
+    else:
+        raise AudioDecodeError(f"unsupported WAV encoding (format {format_tag}, {bits} bit)")
+    return to_mono_16k(samples, sample_rate, channels)
+
+
+def decode_with_pyav(data: bytes) -> np.ndarray:
+    """Decode any FFmpeg-supported container in-process via PyAV."""
+    try:
+        with av.open(io.BytesIO(data), mode="r") as container:
+            resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+            parts = []
+            for frame in container.decode(audio=0):
+                for resampled in resampler.resample(frame):
+                    parts.append(resampled.to_ndarray().reshape(-1))
+            for resampled in resampler.resample(None):
+                parts.append(resampled.to_ndarray().reshape(-1))
+    except (av.error.FFmpegError, ValueError, IndexError) as e:
+        raise AudioDecodeError(f"PyAV could not decode audio: {e}") from e
+    if not parts:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(parts).astype(np.float32) / 32768.0
+
+
+def decode_with_ffmpeg_pipe(data: bytes) -> np.ndarray:
+    """Fallback without PyAV: one ffmpeg process fed through pipes (no temp files)."""
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+               "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+    try:
+        result = subprocess.run(command, input=data, capture_output=True, check=True)
+    except FileNotFoundError as e:
+        raise AudioDecodeError("neither PyAV nor ffmpeg is available to decode compressed audio") from e
+    except subprocess.CalledProcessError as e:
+        raise AudioDecodeError(f"ffmpeg could not decode audio: {e.stderr.decode(errors='replace').strip()}") from e
+    return pcm16_to_float32(result.stdout)
+
+
+def content_type_params(content_type: str | None) -> dict:
+    """'audio/l16; rate=16000; channels=1' -> {'rate': '16000', 'channels': '1'}."""
+    params = {}
+    for part in (content_type or "").split(";")[1:]:
+        key, _, value = part.partition("=")
+        if value:
+            params[key.strip().lower()] = value.strip().strip('"')
+    return params
+
+
+def payload_codec(data: bytes, filename: str | None = None, content_type: str | None = None) -> str:
+    """Short label of an upload's format for statistics: wav, pcm, ogg or other."""
+    if data[:4] == b"RIFF":
+        return "wav"
+    if data[:4] == b"OggS":
+        return "ogg"
+    name = (filename or "").lower()
+    mime = (content_type or "").lower().split(";")[0].strip()
+    if name.endswith(RAW_PCM_EXTENSIONS) or mime in RAW_PCM_CONTENT_TYPES:
+        return "pcm"
+    return "other"
+
+
+def decode_audio(data: bytes, filename: str | None = None, content_type: str | None = None) -> np.ndarray:
+    """
+    Decode an uploaded audio payload to 16 kHz mono float32 samples.
+
+    Args:
+        data (bytes): File contents.
+        filename (str | None): Original file name, used to recognise raw PCM.
+        content_type (str | None): MIME type of the upload, used to recognise raw PCM.
+
+    Returns:
+        np.ndarray: Samples in [-1, 1].
+
+    Raises:
+        AudioDecodeError: If the payload is not decodable audio.
+    """
+    if not data:
+        raise AudioDecodeError("empty audio payload")
+    if data[:4] == b"RIFF":
+        return parse_wav(data)
+    name = (filename or "").lower()
+    mime = (content_type or "").lower().split(";")[0].strip()
+    if name.endswith(RAW_PCM_EXTENSIONS) or mime in RAW_PCM_CONTENT_TYPES:
+        # audio/l16; rate=8000; channels=2 (RFC 2586); 16 kHz mono by default
+        params = content_type_params(content_type)
+        try:
+            rate, channels = int(params.get("rate", SAMPLE_RATE)), int(params.get("channels", 1))
+        except ValueError as e:
+            raise AudioDecodeError(f"bad raw PCM parameters in '{content_type}'") from e
+        samples = pcm16_to_float32(data)
+        return samples if (rate, channels) == (SAMPLE_RATE, 1) else to_mono_16k(samples, rate, channels)
+    if av is not None:
+        return decode_with_pyav(data)
+    return decode_with_ffmpeg_pipe(data)
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """16-bit mono WAV in memory."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(samples.astype("<i2", copy=False).tobytes())
+    return buffer.getvalue()
+
+
+def encode_opus_with_pyav(samples: np.ndarray, sample_rate: int, bitrate: int) -> bytes:
+    """OGG/Opus in memory via PyAV (libopus accepts 8/12/16/24/48 kHz directly)."""
+    buffer = io.BytesIO()
+    try:
+        with av.open(buffer, mode="w", format="ogg") as container:
+            stream = container.add_stream("libopus", rate=sample_rate)
+            stream.bit_rate = bitrate
+            stream.layout = "mono"
+            frame = av.AudioFrame.from_ndarray(samples.astype(np.int16, copy=False).reshape(1, -1),
+                                               format="s16", layout="mono")
+            frame.sample_rate = sample_rate
+            for packet in stream.encode(frame):
+                container.mux(packet)
+            for packet in stream.encode(None):
+                container.mux(packet)
+    except (av.error.FFmpegError, ValueError) as e:
+        raise AudioEncodeError(f"PyAV could not encode Opus: {e}") from e
+    return buffer.getvalue()
+
+
+def encode_opus_with_ffmpeg_pipe(samples: np.ndarray, sample_rate: int, bitrate: int) -> bytes:
+    """Fallback without PyAV: raw PCM into one ffmpeg process, OGG/Opus out of its stdout."""
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-f", "s16le", "-ac", "1", "-ar", str(sample_rate),
+               "-i", "pipe:0", "-c:a", "libopus", "-b:a", str(bitrate), "-f", "ogg", "pipe:1"]
+    try:
+        result = subprocess.run(command, input=samples.astype("<i2", copy=False).tobytes(),
+                                capture_output=True, check=True)
+    except FileNotFoundError as e:
+        raise AudioEncodeError("neither PyAV nor ffmpeg is available to encode Opus") from e
+    except subprocess.CalledProcessError as e:
+        raise AudioEncodeError(f"ffmpeg could not encode Opus: {e.stderr.decode(errors='replace').strip()}") from e
+    return result.stdout
+
+
+def encode_audio(samples: np.ndarray, sample_rate: int = SAMPLE_RATE, codec: str = DEFAULT_CODEC,
+                 bitrate: int = DEFAULT_OPUS_BITRATE) -> bytes:
+    """
+    Encode 16-bit mono samples for upload.
+
+    Args:
+        samples (np.ndarray): int16 samples.
+        codec (str): ``pcm16`` (WAV) or ``opus`` (OGG/Opus).
+        bitrate (int): Opus bits per second.
+
+    Raises:
+        AudioEncodeError: Unknown codec, or no Opus encoder available.
+    """
+    if codec == CODEC_PCM16:
+        return encode_wav(samples, sample_rate)
+    if codec == CODEC_OPUS:
+        if av is not None:
+            return encode_opus_with_pyav(samples, sample_rate, bitrate)
+        return encode_opus_with_ffmpeg_pipe(samples, sample_rate, bitrate)
+    raise AudioEncodeError(f"unknown codec '{codec}', expected one of {', '.join(CODECS)}")
@@ -3,7 +3,11 @@
 Модуль "Менеджер Возможностей".
 (Финальная версия с максимально строгими правилами для LLM)
 """
+import json
+import os
 import sys
+import threading
+import time
 from pathlib import Path
 
 # --- Блок для исправления путей ---
@@ -17,6 +21,20 @@ except (IndexError, NameError):
         sys.path.insert(0, str(project_root))
 
 from app.adapters.ha_adapter import HomeAssistantAdapter
+from app.config_loader import load_settings
+from app.entity_registry import EntityRecord, EntityRegistry, char_ngrams
+
+# Значения по умолчанию для отбора датчиков в промпт
+DEFAULT_PROMPT_TOP_K = 15
+DEFAULT_PROMPT_MIN_SCORE = 0.25
+# Период фоновой сверки реестра с Home Assistant (секунды, 0 - только по событиям)
+DEFAULT_REFRESH_INTERVAL = 300
+# Сколько вариантов списка устройств держать в кэше одной версии реестра
+PROMPT_CACHE_SIZE = 128
+# Снимок реестра на диске для быстрого холодного старта
+DEFAULT_SNAPSHOT_PATH = "cache/entity_snapshot.json"
+SNAPSHOT_FORMAT = 1
+
 
 class CapabilityManager:
     """
@@ -25,24 +43,239 @@ class CapabilityManager:
     def __init__(self, ha_adapter: HomeAssistantAdapter):
         print("CapabilityManager: Инициализация...")
         self.ha_adapter = ha_adapter
-        self.entities = []
-        self._load_entities()
-        print(f"CapabilityManager: Менеджер готов. Загружено {len(self.entities)} сущностей.")
+        self.registry = EntityRegistry()
+        self.version = 0
+        self.prompt_top_k = DEFAULT_PROMPT_TOP_K
+        self.prompt_min_score = DEFAULT_PROMPT_MIN_SCORE
+        self.refresh_interval = DEFAULT_REFRESH_INTERVAL
+        self._prompt_cache = {}
+        self._refresh_lock = threading.Lock()
+        self._refresh_requested = threading.Event()
+        self._refresh_stop = threading.Event()
+        self._refresh_thread = None
+        self.snapshot_path = project_root / DEFAULT_SNAPSHOT_PATH
+        self.synced_at = None  # Время последней успешной сверки с HA (unix time)
+        self._load_settings()
+        if self._load_snapshot():
+            # Обслуживаем запросы из снимка, а сверку с живым HA делает фоновый поток
+            self.request_refresh()
+        else:
+            self._load_entities()
+        print(f"CapabilityManager: Менеджер готов. Загружено {len(self.registry)} сущностей.")
+
+    def _load_settings(self):
+        try:
+            ha_config = load_settings().get("home_assistant", {})
+        except (ValueError, RuntimeError, FileNotFoundError) as e:
+            print(f"CapabilityManager Warning: Не удалось загрузить настройки промпта ({e}). Использую значения по умолчанию.")
+            return
+        self.prompt_top_k = int(ha_config.get("prompt_sensor_top_k", DEFAULT_PROMPT_TOP_K))
+        self.prompt_min_score = float(ha_config.get("prompt_min_score", DEFAULT_PROMPT_MIN_SCORE))
+        self.refresh_interval = float(ha_config.get("capability_refresh_seconds", DEFAULT_REFRESH_INTERVAL))
+        snapshot_path = Path(ha_config.get("snapshot_path", DEFAULT_SNAPSHOT_PATH))
+        self.snapshot_path = snapshot_path if snapshot_path.is_absolute() else project_root / snapshot_path
+        print(f"CapabilityManager: Отбор датчиков для промпта: top_k={self.prompt_top_k}, min_score={self.prompt_min_score}")
+
+    @property
+    def entities(self) -> EntityRegistry:
+        return self.registry
 
     def _load_entities(self):
+        if not self.ha_adapter:
+            return
+        entities = self.ha_adapter.get_all_entities()
+        if entities is None:
+            # HA недоступен при старте: реестр пуст, фоновый поток попробует еще раз
+            self.request_refresh()
+            return
+        self.registry = EntityRegistry.from_entities(entities)
+        self.synced_at = time.time()
+        self.save_snapshot()
+
+    # --- СНИМОК РЕЕСТРА НА ДИСКЕ ---
+
+    @property
+    def snapshot_age_seconds(self) -> float | None:
+        """Возраст данных реестра: сколько секунд прошло с последней сверки с HA."""
+        if self.synced_at is None:
+            return None
+        return max(0.0, time.time() - self.synced_at)
+
+    def save_snapshot(self) -> bool:
+        """Атомарно сохраняет реестр и полный список устройств для промпта в компактный JSON."""
+        snapshot = {
+            "format": SNAPSHOT_FORMAT,
+            "synced_at": self.synced_at,
+            "version": self.version,
+            "entities": [record.to_row() for record in self.registry],
+            "device_list": self.generate_device_list_string(),
+        }
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.snapshot_path)
+            return True
+        except OSError as e:
+            print(f"CapabilityManager Warning: Не удалось сохранить снимок реестра в {self.snapshot_path}: {e}")
+            return False
+
+    def _load_snapshot(self) -> bool:
+        if not self.snapshot_path.exists():
+            return False
+        started = time.perf_counter()
+        try:
+            with self.snapshot_path.open("r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if not isinstance(snapshot, dict):
+                raise ValueError(f"ожидался объект, получен {type(snapshot).__name__}")
+            if snapshot.get("format") != SNAPSHOT_FORMAT:
+                raise ValueError(f"неизвестный формат {snapshot.get('format')}")
+            registry = EntityRegistry(EntityRecord.from_row(row) for row in snapshot["entities"])
+            version = int(snapshot.get("version", 0))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"CapabilityManager Warning: Снимок реестра {self.snapshot_path} поврежден ({e}). Загружаю из HA.")
+            return False
+
+        self.registry = registry
+        self.version = version
+        self.synced_at = snapshot.get("synced_at")
+        device_list = snapshot.get("device_list")
+        if device_list:
+            all_sensor_ids = tuple(sensor.entity_id for sensor in registry.by_domain(['sensor']))
+            self._prompt_cache[(self.version, all_sensor_ids)] = device_list
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        age = self.snapshot_age_seconds
+        age_str = f"{age:.0f} с" if age is not None else "неизвестен"
+        print(f"CapabilityManager: Реестр загружен из снимка за {elapsed_ms:.1f} мс ({len(registry)} сущностей, возраст данных: {age_str}).")
+        return True
+
+    # --- ФОНОВОЕ ОБНОВЛЕНИЕ РЕЕСТРА ---
+
+    def refresh(self) -> bool:
+        """
+        Сверяет реестр с Home Assistant и применяет только изменения.
+        Новый реестр собирается на копии и подменяется одной операцией присваивания,
+        поэтому запросы, читающие self.registry, никогда не ждут обновления.
+
+        Returns:
+            True, если реестр изменился и версия была увеличена.
+        """
+        entities = self.ha_adapter.get_all_entities() if self.ha_adapter else None
+        if entities is None:
+            print("CapabilityManager Warning: Не удалось получить сущности для обновления. Оставляю текущий реестр.")
+            return False
+        fresh_records = [EntityRecord.from_entity(entity) for entity in entities if entity.get("entity_id")]
+
+        with self._refresh_lock:
+            self.synced_at = time.time()
+            added, changed, removed = self.registry.diff(fresh_records)
+            if not (added or changed or removed):
+                self.save_snapshot()
+                return False
+            new_registry = self.registry.copy()
+            for entity_id in removed:
+                new_registry.remove(entity_id)
+            for record in added + changed:
+                new_registry.add(record)
+            self.registry = new_registry
+            self.version += 1
+            self._prompt_cache = {}
+            self.save_snapshot()
+        print(f"CapabilityManager: Реестр обновлен до версии {self.version}: "
+              f"+{len(added)} / ~{len(changed)} / -{len(removed)} сущностей.")
+        return True
+
+    def request_refresh(self):
+        """Просит фоновый поток обновить реестр вне очереди (например, по событию HA)."""
+        self._refresh_requested.set()
+
+    def start_background_refresh(self):
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+        self._refresh_stop.clear()
         if self.ha_adapter:
-            self.entities = self.ha_adapter.get_all_entities() or []
+            self.ha_adapter.add_event_listener("entity_registry_updated", lambda event: self.request_refresh())
+        self._refresh_thread = threading.Thread(target=self._run_background_refresh, name="capability-refresh", daemon=True)
+        self._refresh_thread.start()
+        print(f"CapabilityManager: Фоновое обновление запущено (период: {self.refresh_interval or 'только события'} с).")
+
+    def stop_background_refresh(self, timeout: float = 5.0):
+        self._refresh_stop.set()
+        self._refresh_requested.set()
+        if self._refresh_thread:
+            self._refresh_thread.join(timeout=timeout)
+
+    def _run_background_refresh(self):
+        while not self._refresh_stop.is_set():
+            self._refresh_requested.wait(self.refresh_interval or None)
+            self._refresh_requested.clear()
+            if self._refresh_stop.is_set():
+                break
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"CapabilityManager Error: Ошибка фонового обновления реестра: {e}")
+
+    def get_entity(self, entity_id: str) -> EntityRecord | None:
+        return self.registry.get(entity_id)
 
     def get_entities_by_domain(self, domains: list) -> list:
-        return [e for e in self.entities if e.get("domain") in domains]
+        return self.registry.by_domain(domains)
+
+    def find_entities_by_alias(self, alias: str) -> list:
+        return self.registry.find_by_alias(alias)
+
+    def score_entity(self, command_grams: frozenset, entity: EntityRecord) -> float:
+        """
+        Оценивает релевантность сущности команде: доля n-грамм имени сущности,
+        найденных в команде (берется лучшее из friendly_name и object_id).
+        """
+        best = 0.0
+        for name_grams in entity.name_grams:
+            if name_grams:
+                best = max(best, len(name_grams & command_grams) / len(name_grams))
+        return best
 
-    def generate_device_list_string(self) -> str:
+    def select_relevant_entities(self, entities: list, user_command: str) -> list:
+        """
+        Возвращает top-k сущностей, наиболее похожих на команду пользователя.
+        Порядок исходного списка сохраняется при равных оценках.
+        """
+        command_grams = char_ngrams(user_command)
+        if not command_grams:
+            return []
+        scored = []
+        for index, entity in enumerate(entities):
+            score = self.score_entity(command_grams, entity)
+            if score >= self.prompt_min_score:
+                scored.append((-score, index, entity))
+        scored.sort(key=lambda item: (item[0], item[1]))
+        return [entity for _, _, entity in scored[:self.prompt_top_k]]
+
+    def generate_device_list_string(self, user_command: str | None = None) -> str:
         """
         Генерирует форматированную строку-список устройств для вставки в промпт.
+        Если передана команда пользователя и prompt_top_k > 0, в список попадают
+        только наиболее релевантные ей датчики; фиксированные группы света и розеток
+        включаются всегда.
         """
-        if not self.entities:
+        registry, version = self.registry, self.version
+        if not registry:
             return "Список устройств пуст."
 
+        sensors = registry.by_domain(['sensor'])
+        if user_command is not None and self.prompt_top_k > 0:
+            total_sensors = len(sensors)
+            sensors = self.select_relevant_entities(sensors, user_command)
+            print(f"CapabilityManager: В промпт отобрано {len(sensors)} из {total_sensors} датчиков (top_k={self.prompt_top_k}, min_score={self.prompt_min_score}).")
+
+        cache_key = (version, tuple(sensor.entity_id for sensor in sensors))
+        cached = self._prompt_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         prompt_parts = []
 
         # --- ЯВНОЕ ОПРЕДЕЛЕНИЕ УСТРОЙСТВ И ГРУПП ---
@@ -59,15 +292,19 @@ class CapabilityManager:
         prompt_parts.append("- УСТРОЙСТВО: РОЗЕТКА D666 2. Ключевые слова: ['d666 2', 'd666 розетка 2']. ID: [\"switch.d666_socket_2\"]")
         prompt_parts.append("- УСТРОЙСТВО: РОЗЕТКА D666 3. Ключевые слова: ['d666 3', 'd666 розетка 3']. ID: [\"switch.d666_socket_3\"]")
         prompt_parts.append("- УСТРОЙСТВО: РОЗЕТКА D666 4. Ключевые слова: ['d666 4', 'd666 розетка 4']. ID: [\"switch.d666_socket_4\"]")
-        
-        sensors = self.get_entities_by_domain(['sensor'])
+
         if sensors:
             prompt_parts.append("\n## ДАТЧИКИ (domain: sensor) - только чтение")
             prompt_parts.append("# Используй сервис 'sensor.report_state'")
+            prompt_parts.append("# Для истории (минимум/максимум/среднее за период) используй 'sensor.history_stats' с service_data: {'window_minutes': N} или {'period': 'night'|'morning'|'day'|'evening'}, можно добавить 'stat': 'min'|'max'|'avg'")
             for sensor in sensors:
-                search_names = f"\"{sensor['friendly_name']}\", \"{sensor['entity_id'].split('.')[1]}\""
-                prompt_parts.append(f"- Датчик {search_names}: [\"{sensor['entity_id']}\"]")
-
+                search_names = f"\"{sensor.friendly_name}\", \"{sensor.object_id}\""
+                prompt_parts.append(f"- Датчик {search_names}: [\"{sensor.entity_id}\"]")
 
-        return "\n".join(prompt_parts)
+        device_list = "\n".join(prompt_parts)
+        if version == self.version:
+            if len(self._prompt_cache) >= PROMPT_CACHE_SIZE:
+                self._prompt_cache.clear()
+            self._prompt_cache[cache_key] = device_list
+        return device_list
 
@@ -3,11 +3,15 @@
 Финальная версия CoreEngine с двухступенчатой обработкой.
 Сначала определяет намерение, потом действует.
 """
-from typing import List, Dict
+import time
+from pathlib import Path
+from typing import Callable, List, Dict, Optional
 
 from .adapters.ha_adapter import HomeAssistantAdapter
 from .capability_manager import CapabilityManager
 from .intent_handlers.ha_service_handler import HomeAssistantServiceHandler
+from .sensor_history import SensorHistoryStore, DEFAULT_RAW_CAPACITY, DEFAULT_TIERS
+from .speculative_triage import SpeculativeTriage
 from . import nlu_engine
 from . import dispatcher
 
@@ -28,7 +32,21 @@ class CoreEngine:
             if not self.ha_adapter.base_url:
                 raise ConnectionError("Не удалось инициализировать адаптер Home Assistant.")
             self.capability_manager = CapabilityManager(ha_adapter=self.ha_adapter)
-            self.ha_service_handler_instance = HomeAssistantServiceHandler(ha_adapter=self.ha_adapter)
+            self.capability_manager.start_background_refresh()
+            self.sensor_history = self._create_sensor_history()
+            self.rooms = (nlu_engine.CONFIG_DATA or {}).get("rooms", {}) or {}
+            # Зеркало запускаем после подписки менеджера на entity_registry_updated
+            if self.ha_adapter.state_mirror_enabled:
+                self.ha_adapter.start_state_mirror()
+            self.ha_service_handler_instance = HomeAssistantServiceHandler(
+                ha_adapter=self.ha_adapter, sensor_history=self.sensor_history
+            )
+            # Триаж и HA-промпт по частичным транскриптам, пока пользователь говорит
+            self.speculative_triage = SpeculativeTriage(
+                triage=self._triage,
+                prepare_ha_prompt=self._build_ha_prompt,
+                version=lambda: self.capability_manager.version,
+            )
 
             print("CoreEngine (v4): Все компоненты успешно инициализированы.")
 
@@ -36,23 +54,99 @@ class CoreEngine:
             print(f"CoreEngine (v4) CRITICAL: Ошибка при инициализации: {e}")
             self.ha_adapter = None # Флаг, что система не работает
 
-    def _build_ha_prompt(self) -> str:
-        device_list_str = self.capability_manager.generate_device_list_string()
+    def _create_sensor_history(self) -> SensorHistoryStore | None:
+        """Хранилище истории датчиков, которое пополняется из зеркала состояний HA."""
+        history_config = (nlu_engine.CONFIG_DATA or {}).get("sensor_history", {})
+        if not history_config.get("enabled", False):
+            return None
+        if not self.ha_adapter.state_mirror_enabled:
+            print("CoreEngine (v4) Warning: sensor_history требует home_assistant.state_mirror. История не ведется.")
+            return None
+        persist_dir = history_config.get("persist_dir")
+        if persist_dir and not Path(persist_dir).is_absolute():
+            persist_dir = Path(__file__).resolve().parent.parent / persist_dir
+        store = SensorHistoryStore(
+            raw_capacity=int(history_config.get("raw_capacity", DEFAULT_RAW_CAPACITY)),
+            tiers=history_config.get("tiers", DEFAULT_TIERS),
+            persist_dir=persist_dir or None,
+            # Пишем только датчики, которые знает CapabilityManager (O(1) по индексу реестра)
+            entity_filter=lambda entity_id: entity_id.startswith("sensor.") and self.capability_manager.get_entity(entity_id) is not None,
+        )
+        self.ha_adapter.add_event_listener("state_changed", store.handle_state_changed)
+        print("CoreEngine (v4): История датчиков включена.")
+        return store
+
+    def get_status(self) -> dict:
+        """Краткое состояние движка: актуальность реестра устройств и зеркала состояний."""
+        if not self.ha_adapter:
+            return {"ready": False}
+        age = self.capability_manager.snapshot_age_seconds
+        return {
+            "ready": True,
+            "registry_version": self.capability_manager.version,
+            "entities": len(self.capability_manager.registry),
+            "registry_age_seconds": round(age, 1) if age is not None else None,
+            "state_mirror_ready": self.ha_adapter.state_mirror_ready,
+            "confirmation_latency": self.ha_adapter.confirmations.latency_stats(),
+            "speculation": self.speculative_triage.stats(),
+        }
+
+    def _build_ha_prompt(self, user_command: str | None = None, room: str | None = None) -> str:
+        device_list_str = self.capability_manager.generate_device_list_string(user_command)
+        if room:
+            device_list_str += self._room_context(room)
         return self.ha_prompt_template.format(device_list=device_list_str)
 
-    def process_user_command(self, history: List[Dict[str, str]], is_voice_command: bool = False) -> dict:
+    def _room_context(self, room: str) -> str:
+        """Комната, где произнесена команда (от сателлита): чтобы «свет» без уточнения значил свет этой комнаты."""
+        room_config = self.rooms.get(room) or {}
+        name = room_config.get("name", room)
+        lines = ["\n## КОМНАТА", f"# Команда произнесена в комнате «{name}»."]
+        devices = room_config.get("devices") or []
+        if devices:
+            ids = ", ".join(f"\"{entity_id}\"" for entity_id in devices)
+            lines.append(f"# Если устройство не названо явно (например, «включи свет»), используй устройства этой комнаты: [{ids}]")
+        return "\n".join(lines)
+
+    def _triage(self, text: str) -> dict:
+        # Отправляем только последнее сообщение для быстрой классификации
+        return nlu_engine.get_json_from_llm(
+            system_prompt=self.triage_prompt,
+            history=[{"role": "user", "content": text}]
+        )
+
+    def prepare_partial_command(self, session_id: str, partial_text: str):
+        """Частичный транскрипт из потокового STT: спекулятивно запускает триаж, не дожидаясь конца речи."""
+        if not self.ha_adapter:
+            return
+        self.speculative_triage.speculate(session_id, partial_text)
+
+    def process_user_command(self, history: List[Dict[str, str]], is_voice_command: bool = False,
+                             notify: Optional[Callable[[str], None]] = None,
+                             session_id: Optional[str] = None,
+                             speech_ended_at: Optional[float] = None,
+                             room: Optional[str] = None) -> dict:
+        """
+        Args:
+            session_id: Сессия потокового STT, по частичным текстам которой мог идти спекулятивный триаж.
+            speech_ended_at: Unix-время конца речи (от клиента) для замера задержки до действия.
+            room: Комната сателлита, услышавшего команду (ключ секции rooms в settings.yaml).
+        """
         if not self.ha_adapter:
             return { "final_status_response": "Прости, Искра, мой основной модуль не смог запуститься." }
 
+        received_at = time.time()
         last_user_message = history[-1] if history else {"role": "user", "content": ""}
         print(f"\nCoreEngine (v4): Получена команда: '{last_user_message.get('content')}'")
 
         # --- ЭТАП 1: СОРТИРОВКА (ТРИАЖ) ---
-        print("CoreEngine (v4): Этап 1 - Определяю тип запроса...")
-        triage_result = nlu_engine.get_json_from_llm(
-            system_prompt=self.triage_prompt,
-            history=[last_user_message] # Отправляем только последнее сообщение для быстрой классификации
-        )
+        speculation = self.speculative_triage.take(session_id, last_user_message.get("content", ""))
+        if speculation:
+            print("CoreEngine (v4): Этап 1 - Тип запроса уже определен по частичному транскрипту.")
+            triage_result = speculation["triage_result"]
+        else:
+            print("CoreEngine (v4): Этап 1 - Определяю тип запроса...")
+            triage_result = self._triage(last_user_message.get("content", ""))
         intent = triage_result.get("intent", "general_chat") # По умолчанию считаем, что это чат
         print(f"CoreEngine (v4): Распознан интент: '{intent}'")
 
@@ -61,8 +155,9 @@ class CoreEngine:
             # --- ВЕТКА ДЛЯ HOME ASSISTANT ---
             print("CoreEngine (v4): Этап 2 (HA) - Запрос на управление умным домом.")
             
-            # 1. Собираем актуальный промпт для HA
-            final_ha_prompt = self._build_ha_prompt()
+            # 1. Собираем актуальный промпт для HA (или берем подготовленный спекулятивно, он без комнаты)
+            speculative_prompt = None if room else (speculation or {}).get("ha_prompt")
+            final_ha_prompt = speculative_prompt or self._build_ha_prompt(last_user_message.get("content", ""), room)
 
             # 2. Получаем JSON от LLM
             llm_response_json = nlu_engine.get_json_from_llm(
@@ -78,7 +173,12 @@ class CoreEngine:
             action_result = dispatcher.dispatch(
                 intent="home_assistant_service_call",
                 llm_json=llm_response_json,
-                handler_instance=self.ha_service_handler_instance
+                handler_instance=self.ha_service_handler_instance,
+                on_correction=notify
+            )
+            self.speculative_triage.record_latency(
+                speculative=speculation is not None,
+                seconds=time.time() - (speech_ended_at or received_at),
             )
         else:
             # --- ВЕТКА ДЛЯ ОБЫЧНОГО РАЗГОВОРА ---
@@ -86,12 +186,17 @@ class CoreEngine:
             action_result = {"success": True, "action_performed": "general_chat"}
 
         # --- ЭТАП 3: Генерация ответа ---
-        print(f"CoreEngine (v4): Этап 3 - Генерирую ответ...")
-        # Теперь для генерации ответа используется ВЕСЬ контекст, что позволяет Ноксу быть в курсе беседы
-        final_status_response = nlu_engine.generate_natural_response(
-            action_result=action_result,
-            history=history
-        )
+        if action_result.get("elided"):
+            # Устройства уже в нужном состоянии: HA не вызывался, ответ готов без LLM
+            print("CoreEngine (v4): Этап 3 - Команда без эффекта, отвечаю шаблоном.")
+            final_status_response = action_result.get("message_for_user")
+        else:
+            print(f"CoreEngine (v4): Этап 3 - Генерирую ответ...")
+            # Теперь для генерации ответа используется ВЕСЬ контекст, что позволяет Ноксу быть в курсе беседы
+            final_status_response = nlu_engine.generate_natural_response(
+                action_result=action_result,
+                history=history
+            )
         
         print(f"CoreEngine (v4): Финальный ответ для пользователя: '{final_status_response}'")
 
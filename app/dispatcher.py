@@ -15,7 +15,7 @@ INTENT_HANDLERS_MAP = {
 }
 
 
-def dispatch(intent: str, llm_json: dict, handler_instance) -> dict:
+def dispatch(intent: str, llm_json: dict, handler_instance, on_correction=None) -> dict:
     """
     Выбирает и вызывает соответствующий обработчик.
     В новой архитектуре он в основном работает с одним универсальным обработчиком.
@@ -24,6 +24,8 @@ def dispatch(intent: str, llm_json: dict, handler_instance) -> dict:
         intent (str): Название намерения, чтобы найти класс обработчика.
         llm_json (dict): JSON, сгенерированный LLM.
         handler_instance: Уже созданный экземпляр обработчика из CoreEngine.
+        on_correction: Необязательный callback для поздних сообщений пользователю
+            (например, если оптимистично выполненная команда не подтвердилась).
 
     Returns:
         Словарь с результатом выполнения.
@@ -36,7 +38,7 @@ def dispatch(intent: str, llm_json: dict, handler_instance) -> dict:
         print(f"Dispatcher: Найден обработчик для '{intent}'. Вызов метода handle...")
         try:
             # Вызываем метод handle у уже существующего экземпляра
-            result = handler_instance.handle(llm_json)
+            result = handler_instance.handle(llm_json, on_correction=on_correction)
             print(f"Dispatcher: Результат от обработчика: {result}")
             return result
         except Exception as e:
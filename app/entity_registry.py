@@ -0,0 +1,173 @@
+# app/entity_registry.py
+"""
+Компактный индексированный реестр сущностей Home Assistant.
+
+Вместо списка словарей с полным блоком `attributes` хранит записи на `__slots__`
+только с теми полями, которые реально использует Нокс, и держит словари-индексы
+по entity_id, домену и нормализованному псевдониму — все выборки O(1).
+"""
+import re
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+NGRAM_SIZE = 3
+
+
+def normalize_name(text: str) -> str:
+    """Приводит имя/команду к виду для сравнения: нижний регистр, 'ё' -> 'е', без пунктуации."""
+    text = text.lower().replace("ё", "е").replace("_", " ")
+    return " ".join(re.findall(r"\w+", text))
+
+
+def char_ngrams(text: str, n: int = NGRAM_SIZE) -> frozenset:
+    """Символьные n-граммы по каждому слову (с границами слова), устойчивы к падежным окончаниям."""
+    grams = set()
+    for word in normalize_name(text).split():
+        padded = f" {word} "
+        if len(padded) <= n:
+            grams.add(padded)
+            continue
+        grams.update(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return frozenset(grams)
+
+
+class EntityRecord:
+    """Сжатая запись о сущности: только используемые поля, строки интернированы."""
+    __slots__ = ("entity_id", "domain", "object_id", "friendly_name", "unit", "members", "_name_grams")
+
+    def __init__(self, entity_id: str, friendly_name: str = "", unit: str = "", members: tuple = ()):
+        domain, _, object_id = entity_id.partition(".")
+        self.entity_id = sys.intern(entity_id)
+        self.domain = sys.intern(domain if object_id else "unknown")
+        self.object_id = sys.intern(object_id or entity_id)
+        self.friendly_name = friendly_name or entity_id
+        self.unit = sys.intern(unit) if unit else ""
+        self.members = tuple(sys.intern(m) for m in members)
+        self._name_grams = None
+
+    @classmethod
+    def from_entity(cls, entity: dict) -> "EntityRecord":
+        """Строит запись из словаря, который возвращает HomeAssistantAdapter."""
+        attributes = entity.get("attributes") or {}
+        members = attributes.get("entity_id") or ()
+        if isinstance(members, str):
+            members = (members,)
+        return cls(
+            entity_id=entity["entity_id"],
+            friendly_name=entity.get("friendly_name") or attributes.get("friendly_name", ""),
+            unit=attributes.get("unit_of_measurement") or "",
+            members=tuple(members),
+        )
+
+    def to_row(self) -> list:
+        """Компактное представление для снимка на диске."""
+        return [self.entity_id, self.friendly_name, self.unit, list(self.members)]
+
+    @classmethod
+    def from_row(cls, row: list) -> "EntityRecord":
+        entity_id, friendly_name, unit, members = row
+        return cls(entity_id, friendly_name=friendly_name, unit=unit, members=tuple(members))
+
+    @property
+    def name_grams(self) -> tuple:
+        """n-граммы friendly_name и object_id; считаются один раз при первом обращении."""
+        if self._name_grams is None:
+            self._name_grams = (char_ngrams(self.friendly_name), char_ngrams(self.object_id))
+        return self._name_grams
+
+    @property
+    def aliases(self) -> set:
+        return {alias for alias in (normalize_name(self.friendly_name), normalize_name(self.object_id)) if alias}
+
+    def same_as(self, other: "EntityRecord") -> bool:
+        return (self.entity_id == other.entity_id and self.friendly_name == other.friendly_name
+                and self.unit == other.unit and self.members == other.members)
+
+    def __repr__(self) -> str:
+        return f"EntityRecord({self.entity_id!r}, friendly_name={self.friendly_name!r})"
+
+
+class EntityRegistry:
+    """Реестр записей с индексами по entity_id, домену и нормализованному псевдониму."""
+
+    def __init__(self, records: Iterable[EntityRecord] = ()):
+        self._by_id: Dict[str, EntityRecord] = {}
+        self._by_domain: Dict[str, Dict[str, EntityRecord]] = {}
+        self._by_alias: Dict[str, Dict[str, EntityRecord]] = {}
+        for record in records:
+            self.add(record)
+
+    @classmethod
+    def from_entities(cls, entities: Iterable[dict]) -> "EntityRegistry":
+        return cls(EntityRecord.from_entity(entity) for entity in entities if entity.get("entity_id"))
+
+    def add(self, record: EntityRecord):
+        """Добавляет запись или заменяет существующую с тем же entity_id."""
+        if record.entity_id in self._by_id:
+            self.remove(record.entity_id)
+        self._by_id[record.entity_id] = record
+        self._by_domain.setdefault(record.domain, {})[record.entity_id] = record
+        for alias in record.aliases:
+            self._by_alias.setdefault(alias, {})[record.entity_id] = record
+
+    def remove(self, entity_id: str) -> Optional[EntityRecord]:
+        record = self._by_id.pop(entity_id, None)
+        if record is None:
+            return None
+        domain_index = self._by_domain.get(record.domain, {})
+        domain_index.pop(entity_id, None)
+        if not domain_index:
+            self._by_domain.pop(record.domain, None)
+        for alias in record.aliases:
+            alias_index = self._by_alias.get(alias, {})
+            alias_index.pop(entity_id, None)
+            if not alias_index:
+                self._by_alias.pop(alias, None)
+        return record
+
+    def copy(self) -> "EntityRegistry":
+        """Поверхностная копия: записи общие, индексы свои (для copy-on-write обновлений)."""
+        clone = EntityRegistry()
+        clone._by_id = dict(self._by_id)
+        clone._by_domain = {domain: dict(index) for domain, index in self._by_domain.items()}
+        clone._by_alias = {alias: dict(index) for alias, index in self._by_alias.items()}
+        return clone
+
+    def diff(self, records: Iterable[EntityRecord]) -> Tuple[List[EntityRecord], List[EntityRecord], List[str]]:
+        """
+        Сравнивает реестр со свежим набором записей.
+
+        Returns:
+            (добавленные, измененные, entity_id удаленных)
+        """
+        added, changed, seen = [], [], set()
+        for record in records:
+            seen.add(record.entity_id)
+            current = self._by_id.get(record.entity_id)
+            if current is None:
+                added.append(record)
+            elif not current.same_as(record):
+                changed.append(record)
+        removed = [entity_id for entity_id in self._by_id if entity_id not in seen]
+        return added, changed, removed
+
+    def get(self, entity_id: str) -> Optional[EntityRecord]:
+        return self._by_id.get(entity_id)
+
+    def by_domain(self, domains: Iterable[str]) -> List[EntityRecord]:
+        result = []
+        for domain in domains:
+            result.extend(self._by_domain.get(domain, {}).values())
+        return result
+
+    def find_by_alias(self, alias: str) -> List[EntityRecord]:
+        return list(self._by_alias.get(normalize_name(alias), {}).values())
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._by_id
+
+    def __iter__(self) -> Iterator[EntityRecord]:
+        return iter(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
@@ -17,11 +17,13 @@ except (IndexError, NameError):
         sys.path.insert(0, str(project_root))
 
 from app.adapters.ha_adapter import HomeAssistantAdapter
+from app.sensor_history import SensorHistoryStore, resolve_time_window
 
 class HomeAssistantServiceHandler:
-    def __init__(self, ha_adapter: HomeAssistantAdapter):
+    def __init__(self, ha_adapter: HomeAssistantAdapter, sensor_history: SensorHistoryStore | None = None):
         print("HA_Service_Handler: Инициализация...")
         self.ha_adapter = ha_adapter
+        self.sensor_history = sensor_history
         if not self.ha_adapter or not self.ha_adapter.base_url:
              raise ValueError("HA_Service_Handler требует корректно инициализированного HA_Adapter.")
         print("HA_Service_Handler: Обработчик готов.")
@@ -33,7 +35,7 @@ class HomeAssistantServiceHandler:
                 return llm_json.get(key, {})
         return {}
 
-    def handle(self, llm_generated_json: dict) -> dict:
+    def handle(self, llm_generated_json: dict, on_correction=None) -> dict:
         service = llm_generated_json.get("service")
         
         # --- ИСПРАВЛЕНИЕ: ПЕРВЫМ ДЕЛОМ ПРОВЕРЯЕМ, НЕ ОБЩИЙ ЛИ ЭТО ЧАТ ---
@@ -56,13 +58,12 @@ class HomeAssistantServiceHandler:
             if not target_entities:
                 return {"success": False, "message_for_user": "Я не понял, о каком датчике идет речь."}
             
-            all_states = self.ha_adapter.get_all_entities()
-            if not all_states:
-                 return {"success": False, "message_for_user": "Не удалось получить статусы устройств."}
+            if isinstance(target_entities, str):
+                target_entities = [target_entities]
 
             statuses = []
             for entity_id in target_entities:
-                entity = next((e for e in all_states if e['entity_id'] == entity_id), None)
+                entity = self.ha_adapter.get_entity_state(entity_id)
                 if entity:
                     state = entity.get('state')
                     attributes = entity.get('attributes', {})
@@ -76,8 +77,44 @@ class HomeAssistantServiceHandler:
             final_report = "\n".join(statuses)
             return {"success": True, "message_for_user": f"Конечно, вот данные:\n{final_report}"}
 
+        if service == "sensor.history_stats":
+            return self._handle_history_stats(llm_generated_json)
+
         print(f"HA_Service_Handler: Вызов сервиса через адаптер с JSON: {llm_generated_json}")
-        result = self.ha_adapter.call_service(llm_generated_json)
+        result = self.ha_adapter.call_service(llm_generated_json, on_correction=on_correction)
         
         result["message_for_user"] = result.get("message") if result.get("success") else "Что-то пошло не так при выполнении команды."
         return result
+
+    def _handle_history_stats(self, llm_generated_json: dict) -> dict:
+        """min/max/среднее датчика за период из локального хранилища истории."""
+        print("HA_Service_Handler: Обнаружен запрос на историю датчика.")
+        if not self.sensor_history:
+            return {"success": False, "message_for_user": "История датчиков не ведется."}
+
+        target_entities = self._get_target_data(llm_generated_json).get("entity_id", [])
+        if isinstance(target_entities, str):
+            target_entities = [target_entities]
+        if not target_entities:
+            return {"success": False, "message_for_user": "Я не понял, о каком датчике идет речь."}
+
+        service_data = llm_generated_json.get("service_data", {}) or {}
+        start, end = resolve_time_window(service_data)
+        requested_stat = service_data.get("stat")
+        stat_names = {"min": "минимум", "max": "максимум", "avg": "в среднем"}
+
+        reports = []
+        for entity_id in target_entities:
+            entity = self.ha_adapter.get_entity_state(entity_id) or {}
+            name = entity.get("friendly_name", entity_id)
+            unit = entity.get("attributes", {}).get("unit_of_measurement", "")
+            stats = self.sensor_history.stats(entity_id, start, end)
+            if not stats:
+                reports.append(f"{name}: нет данных за этот период.")
+                continue
+            keys = [requested_stat] if requested_stat in stat_names else ["min", "max", "avg"]
+            values = ", ".join(f"{stat_names[key]} {stats[key]:.1f}{unit}" for key in keys)
+            reports.append(f"{name}: {values} (замеров: {stats['count']})")
+
+        final_report = "\n".join(reports)
+        return {"success": True, "message_for_user": f"Вот что было за этот период:\n{final_report}"}
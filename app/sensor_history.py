@@ -0,0 +1,249 @@
+# app/sensor_history.py
+"""
+Локальное хранилище временных рядов для датчиков Home Assistant.
+
+Для каждого датчика держит несколько уровней (tiers) кольцевых буферов NumPy:
+сырые замеры и агрегаты по корзинам (например, 1 мин и 15 мин). Каждая строка
+хранит min/max/sum/count корзины, поэтому min/max/avg за любое окно считаются
+векторно по одному уровню без обращения к API истории Home Assistant.
+Буферы могут жить в memory-mapped файлах .npy и переживать перезапуск.
+"""
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Одна строка уровня: начало корзины, агрегаты значений внутри нее
+ROW_DTYPE = np.dtype([("t", "f8"), ("min", "f4"), ("max", "f4"), ("sum", "f8"), ("n", "u4")])
+
+DEFAULT_RAW_CAPACITY = 1024
+# (разрешение корзины в секундах, емкость): сутки поминутно и месяц по 15 минут
+DEFAULT_TIERS = ((60, 1440), (900, 2976))
+
+# Промежутки суток, которые можно запросить словом
+PERIOD_HOURS = {"night": (0, 6), "morning": (6, 12), "day": (12, 18), "evening": (18, 24)}
+
+
+def _safe_filename(entity_id: str) -> str:
+    return re.sub(r"[^\w.-]", "_", entity_id)
+
+
+class RingBuffer:
+    """Кольцевой буфер строк ROW_DTYPE фиксированной емкости (в памяти или в memmap)."""
+
+    def __init__(self, capacity: int, path: Optional[Path] = None):
+        self.capacity = capacity
+        self.path = path
+        if path is None:
+            self.rows = np.zeros(capacity, dtype=ROW_DTYPE)
+            self._meta = np.zeros(2, dtype=np.int64)  # [head, count]
+            return
+        meta_path = path.with_suffix(".meta.npy")
+        if path.exists() and meta_path.exists():
+            self.rows = np.lib.format.open_memmap(path, mode="r+")
+            self._meta = np.lib.format.open_memmap(meta_path, mode="r+")
+            if self.rows.dtype == ROW_DTYPE and self.rows.shape == (capacity,):
+                return
+            print(f"SensorHistory Warning: Файл {path} не совпадает с конфигурацией, создаю заново.")
+        self.rows = np.lib.format.open_memmap(path, mode="w+", dtype=ROW_DTYPE, shape=(capacity,))
+        self._meta = np.lib.format.open_memmap(meta_path, mode="w+", dtype=np.int64, shape=(2,))
+
+    def __len__(self) -> int:
+        return int(self._meta[1])
+
+    def append(self, row: tuple):
+        head, count = int(self._meta[0]), int(self._meta[1])
+        self.rows[head] = row
+        self._meta[0] = (head + 1) % self.capacity
+        self._meta[1] = min(count + 1, self.capacity)
+
+    @property
+    def oldest_t(self) -> Optional[float]:
+        if not len(self):
+            return None
+        head, count = int(self._meta[0]), int(self._meta[1])
+        return float(self.rows["t"][(head - count) % self.capacity])
+
+    def ordered(self) -> np.ndarray:
+        """Строки от старой к новой (без копирования, пока буфер не заполнен)."""
+        head, count = int(self._meta[0]), int(self._meta[1])
+        if count < self.capacity:
+            return self.rows[:count]
+        return np.concatenate((self.rows[head:], self.rows[:head]))
+
+    def window(self, start: float, end: float) -> np.ndarray:
+        rows = self.ordered()
+        timestamps = rows["t"]
+        lo, hi = np.searchsorted(timestamps, [start, end], side="left")
+        return rows[lo:hi]
+
+    def flush(self):
+        if self.path is not None:
+            self.rows.flush()
+            self._meta.flush()
+
+
+class Tier:
+    """Уровень с корзинами фиксированного размера; resolution=0 - сырые замеры."""
+
+    def __init__(self, resolution: float, capacity: int, path: Optional[Path] = None):
+        self.resolution = resolution
+        self.buffer = RingBuffer(capacity, path)
+        self._open = None  # [начало корзины, min, max, sum, n] текущей незакрытой корзины
+
+    def add(self, timestamp: float, value: float):
+        if not self.resolution:
+            self.buffer.append((timestamp, value, value, value, 1))
+            return
+        bucket = timestamp - timestamp % self.resolution
+        if self._open and self._open[0] != bucket:
+            self.buffer.append(tuple(self._open))
+            self._open = None
+        if self._open is None:
+            self._open = [bucket, value, value, 0.0, 0]
+        self._open[1] = min(self._open[1], value)
+        self._open[2] = max(self._open[2], value)
+        self._open[3] += value
+        self._open[4] += 1
+
+    def covers(self, start: float) -> bool:
+        """True, если уровень помнит все замеры начиная с start (буфер еще не перезаписывался)."""
+        if len(self.buffer) < self.buffer.capacity:
+            return True
+        return self.buffer.oldest_t <= start
+
+    def window(self, start: float, end: float) -> np.ndarray:
+        # Корзина попадает в окно, если пересекается с ним: начало не раньше start - resolution
+        rows = self.buffer.window(start - self.resolution, end)
+        if self._open and start - self.resolution < self._open[0] < end:
+            rows = np.concatenate((rows, np.array([tuple(self._open)], dtype=ROW_DTYPE)))
+        return rows
+
+
+class SensorHistory:
+    def __init__(self, raw_capacity: int, tiers: Tuple[Tuple[float, int], ...], directory: Optional[Path] = None):
+        def path_for(name: str) -> Optional[Path]:
+            return directory / f"{name}.npy" if directory is not None else None
+
+        self.tiers: List[Tier] = [Tier(0, raw_capacity, path_for("raw"))]
+        self.tiers.extend(Tier(resolution, capacity, path_for(f"{int(resolution)}s")) for resolution, capacity in tiers)
+        self.last_t = max((t.buffer.ordered()["t"][-1] for t in self.tiers if len(t.buffer)), default=None)
+
+    def add(self, timestamp: float, value: float):
+        if self.last_t is not None and timestamp < self.last_t:
+            return  # Буферы упорядочены по времени; запоздалые замеры отбрасываем
+        self.last_t = timestamp
+        for tier in self.tiers:
+            tier.add(timestamp, value)
+
+    def stats(self, start: float, end: float) -> Optional[dict]:
+        # Берем самый подробный уровень, который еще помнит начало окна
+        tier = next((t for t in self.tiers if t.covers(start)), self.tiers[-1])
+        rows = tier.window(start, end)
+        if not len(rows):
+            return None
+        count = int(rows["n"].sum())
+        return {
+            "min": float(rows["min"].min()),
+            "max": float(rows["max"].max()),
+            "avg": float(rows["sum"].sum() / count),
+            "count": count,
+            "resolution_seconds": tier.resolution,
+        }
+
+    def flush(self):
+        for tier in self.tiers:
+            tier.buffer.flush()
+
+
+class SensorHistoryStore:
+    """Набор историй по датчикам; наполняется событиями state_changed из зеркала состояний."""
+
+    def __init__(self, raw_capacity: int = DEFAULT_RAW_CAPACITY, tiers=DEFAULT_TIERS,
+                 persist_dir: Optional[Path] = None,
+                 entity_filter: Optional[Callable[[str], bool]] = None):
+        self.raw_capacity = raw_capacity
+        self.tiers = tuple((float(resolution), int(capacity)) for resolution, capacity in tiers)
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.entity_filter = entity_filter
+        self._histories: Dict[str, SensorHistory] = {}
+        self._lock = threading.Lock()
+        if self.persist_dir is not None:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+            for directory in sorted(p for p in self.persist_dir.iterdir() if p.is_dir()):
+                self._histories[directory.name] = SensorHistory(self.raw_capacity, self.tiers, directory)
+            print(f"SensorHistory: Восстановлена история {len(self._histories)} датчиков из {self.persist_dir}.")
+
+    def _history_for(self, entity_id: str) -> SensorHistory:
+        history = self._histories.get(entity_id)
+        if history is None:
+            directory = None
+            if self.persist_dir is not None:
+                directory = self.persist_dir / _safe_filename(entity_id)
+                directory.mkdir(exist_ok=True)
+            history = self._histories[entity_id] = SensorHistory(self.raw_capacity, self.tiers, directory)
+        return history
+
+    def record(self, entity_id: str, timestamp: float, value: float):
+        with self._lock:
+            self._history_for(entity_id).add(timestamp, value)
+
+    def handle_state_changed(self, event: dict):
+        """Listener для событий state_changed: сохраняет числовые состояния отслеживаемых датчиков."""
+        data = event.get("data", {})
+        entity_id = data.get("entity_id")
+        new_state = data.get("new_state") or {}
+        if not entity_id or (self.entity_filter and not self.entity_filter(entity_id)):
+            return
+        try:
+            value = float(new_state.get("state"))
+        except (TypeError, ValueError):
+            return  # unavailable / unknown и нечисловые состояния не пишем
+        if not np.isfinite(value):
+            return
+        updated = new_state.get("last_updated")
+        try:
+            timestamp = datetime.fromisoformat(updated).timestamp() if updated else time.time()
+        except ValueError:
+            timestamp = time.time()
+        self.record(entity_id, timestamp, value)
+
+    def stats(self, entity_id: str, start: float, end: Optional[float] = None) -> Optional[dict]:
+        """min/max/avg/count значений датчика за [start, end) (unix time) или None, если данных нет."""
+        end = time.time() if end is None else end
+        with self._lock:
+            history = self._histories.get(entity_id)
+            if history is None:
+                return None
+            return history.stats(start, end)
+
+    def flush(self):
+        with self._lock:
+            for history in self._histories.values():
+                history.flush()
+
+
+def resolve_time_window(service_data: dict, now: Optional[float] = None) -> Tuple[float, float]:
+    """
+    Переводит параметры запроса в окно [start, end) в unix time.
+    Поддерживает {'window_minutes': N} и {'period': 'night'|'morning'|'day'|'evening'}
+    (последний завершившийся или текущий такой промежуток по локальному времени).
+    """
+    now = time.time() if now is None else now
+    period = service_data.get("period")
+    if period in PERIOD_HOURS:
+        start_hour, end_hour = PERIOD_HOURS[period]
+        current = datetime.fromtimestamp(now)
+        day = current.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = day + timedelta(hours=start_hour)
+        if start > current:
+            day -= timedelta(days=1)
+            start = day + timedelta(hours=start_hour)
+        end = day + timedelta(hours=end_hour)
+        return start.timestamp(), min(end.timestamp(), now)
+    window_minutes = float(service_data.get("window_minutes", 60))
+    return now - window_minutes * 60, now
@@ -0,0 +1,123 @@
+# app/service_transport.py
+"""
+Транспорт между сервисами Нокса на одной машине.
+
+По умолчанию api_server и stt_server слушают TCP (api_endpoints в
+settings.yaml). С transport.mode: uds оба сервера слушают Unix domain
+sockets, а клиенты (микрофон, хаб сателлитов, Telegram-бот) подключаются к
+ним через httpx: без loopback TCP, портов и Nagle. URL из api_endpoints при
+этом остаются как есть — из них берется только путь.
+
+Аудио в STT можно слать «сырым» телом запроса (POST /transcribe/raw,
+Content-Type: audio/l16; rate=16000 или audio/ogg) вместо multipart-формы:
+ни WAV-заголовка, ни multipart-разбора на сервере.
+
+Сокеты по умолчанию лежат в $XDG_RUNTIME_DIR/nox, а без него — в run/ в
+каталоге проекта, но не в общем /tmp: каталог создается с правами 0o700, и
+каталог чужого пользователя (или доступный другим на запись) не принимается,
+иначе кто-то мог бы подменить сокет Core API, который управляет домом.
+"""
+import os
+import stat
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import uvicorn
+
+TRANSPORT_TCP = "tcp"
+TRANSPORT_UDS = "uds"
+SERVICE_CORE = "nox_core"
+SERVICE_STT = "nox_stt"
+SOCKET_NAMES = {
+    SERVICE_CORE: "core.sock",
+    SERVICE_STT: "stt.sock",
+}
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+RAW_PCM_CONTENT_TYPE = "audio/l16"
+
+
+def transport_mode(config: dict) -> str:
+    mode = ((config or {}).get("transport") or {}).get("mode", TRANSPORT_TCP)
+    if mode not in (TRANSPORT_TCP, TRANSPORT_UDS):
+        raise ValueError(f"Неизвестный transport.mode '{mode}' (ожидается tcp или uds)")
+    return mode
+
+
+def default_socket_dir() -> Path:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    return Path(runtime_dir) / "nox" if runtime_dir else PROJECT_ROOT / "run"
+
+
+def socket_path(config: dict, service: str) -> Optional[str]:
+    """Путь сокета сервиса, если выбран транспорт uds; None для tcp. Относительный путь — от корня проекта."""
+    if transport_mode(config) != TRANSPORT_UDS:
+        return None
+    sockets = ((config or {}).get("transport") or {}).get("sockets") or {}
+    path = Path(sockets[service]) if sockets.get(service) else default_socket_dir() / SOCKET_NAMES[service]
+    return str(path if path.is_absolute() else PROJECT_ROOT / path)
+
+
+def check_socket_dir(directory: Path):
+    """
+    Каталог сокетов должен принадлежать текущему пользователю и не быть доступен другим на запись.
+
+    Raises:
+        PermissionError: Каталог чужой или открыт на запись группе/всем.
+    """
+    info = os.stat(directory)
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"Каталог сокетов {directory} принадлежит другому пользователю (uid {info.st_uid})")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"Каталог сокетов {directory} доступен на запись другим пользователям "
+                              f"(права {stat.S_IMODE(info.st_mode):o})")
+
+
+def raw_pcm_content_type(sample_rate: int) -> str:
+    return f"{RAW_PCM_CONTENT_TYPE}; rate={sample_rate}; channels=1"
+
+
+def client_socket_path(config: dict, service: str) -> Optional[str]:
+    """Путь сокета для клиента; каталог, если он уже есть, проверяется так же, как на сервере."""
+    path = socket_path(config, service)
+    if path and os.path.isdir(os.path.dirname(path)):
+        check_socket_dir(Path(path).parent)
+    return path
+
+
+def make_http_client(config: dict, service: str, timeout: float = 60.0, **kwargs) -> httpx.Client:
+    """Долгоживущий клиент с пулом соединений к сервису (через его сокет в режиме uds)."""
+    path = client_socket_path(config, service)
+    transport = httpx.HTTPTransport(uds=path) if path else None
+    return httpx.Client(transport=transport, timeout=timeout, **kwargs)
+
+
+def make_async_http_client(config: dict, service: str, timeout: float = 60.0, **kwargs) -> httpx.AsyncClient:
+    path = client_socket_path(config, service)
+    transport = httpx.AsyncHTTPTransport(uds=path) if path else None
+    return httpx.AsyncClient(transport=transport, timeout=timeout, **kwargs)
+
+
+def prepare_socket(path: str):
+    """Каталог для сокета (0o700, только свой) и удаление файла, оставшегося от прошлого запуска."""
+    socket_file = Path(path)
+    socket_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    check_socket_dir(socket_file.parent)
+    if socket_file.is_socket():
+        socket_file.unlink()
+
+
+def run_server(app, config: dict, service: str, host: str, port: int):
+    """uvicorn.run на TCP или на Unix-сокете сервиса, по transport.mode."""
+    path = socket_path(config, service)
+    if path:
+        prepare_socket(path)
+        print(f"Transport: {service} слушает Unix-сокет {path}")
+        try:
+            uvicorn.run(app, uds=path)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+    else:
+        print(f"Transport: {service} слушает http://{host}:{port}")
+        uvicorn.run(app, host=host, port=port)
@@ -0,0 +1,189 @@
+# app/speculative_triage.py
+"""
+Спекулятивный триаж по частичным транскриптам.
+
+Пока пользователь еще говорит, потоковый STT присылает частичные тексты.
+SpeculativeTriage сразу запускает по ним триаж (LLM) и подготовку HA-промпта
+в фоне. Когда приходит финальный транскрипт той же сессии, результат
+спекуляции используется, если нормализованный текст совпал (commit), иначе
+выбрасывается и обработка идет обычным путем (redo).
+
+Частичные тексты одной сессии обрабатываются по очереди, и в очереди стоит
+только самый новый: устаревший текст, который еще не начал обрабатываться,
+отменяется и в LLM не попадает. Уже идущий триаж прервать нельзя — после него
+сразу берется последний частичный текст сессии. Для каждой команды
+меряется задержка от финального текста (или от конца речи, если клиент его
+передал) до выполнения действия — отдельно для попаданий и промахов.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional
+
+from .entity_registry import normalize_name
+
+DEFAULT_SESSION_TTL = 60.0
+# Сколько финальная команда ждет еще идущую спекуляцию, прежде чем делать триаж сама
+DEFAULT_TAKE_TIMEOUT = 5.0
+LATENCY_HISTORY_SIZE = 100
+
+
+class Speculation:
+    __slots__ = ("text", "normalized", "future", "started", "version")
+
+    def __init__(self, text: str, version: Optional[int]):
+        self.text = text
+        self.normalized = normalize_name(text)
+        # Результат _prepare для этого текста; отменяется, пока обработка не началась
+        self.future = Future()
+        self.started = time.monotonic()
+        self.version = version
+
+
+class SpeculativeTriage:
+    def __init__(self, triage: Callable[[str], dict], prepare_ha_prompt: Callable[[str], str],
+                 version: Optional[Callable[[], int]] = None,
+                 max_workers: int = 2, session_ttl: float = DEFAULT_SESSION_TTL,
+                 take_timeout: float = DEFAULT_TAKE_TIMEOUT):
+        """
+        Args:
+            triage: Классификация команды (как этап 1 CoreEngine), возвращает dict с 'intent'.
+            prepare_ha_prompt: Сборка HA-промпта под текст команды.
+            version: Версия реестра устройств; промпт, собранный под старую версию, не используется.
+            take_timeout: Предел ожидания незавершенной спекуляции в take(), секунды.
+        """
+        self.triage = triage
+        self.prepare_ha_prompt = prepare_ha_prompt
+        self.version = version or (lambda: None)
+        self.session_ttl = session_ttl
+        self.take_timeout = take_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculation")
+        self._sessions: Dict[str, Speculation] = {}
+        # Самая новая еще не начатая спекуляция сессии (ее заберет обработчик сессии в пуле)
+        self._pending: Dict[str, Speculation] = {}
+        # Сессии, у которых уже есть обработчик в пуле, и спекуляция, которую он сейчас выполняет
+        self._running: Dict[str, Optional[Speculation]] = {}
+        self._lock = threading.Lock()
+        self._latencies = {True: deque(maxlen=LATENCY_HISTORY_SIZE), False: deque(maxlen=LATENCY_HISTORY_SIZE)}
+        self.committed = 0
+        self.redone = 0
+
+    def speculate(self, session_id: str, partial_text: str):
+        """Запускает триаж по частичному тексту; более новый текст сессии заменяет старый."""
+        normalized = normalize_name(partial_text)
+        if not normalized:
+            return
+        with self._lock:
+            self._drop_expired()
+            current = self._sessions.get(session_id)
+            if current and current.normalized == normalized:
+                return  # Тот же текст уже в работе
+            if current:
+                current.future.cancel()  # Если еще не начат — так и не запустится
+            speculation = Speculation(partial_text, self.version())
+            self._sessions[session_id] = self._pending[session_id] = speculation
+            if session_id not in self._running:
+                self._running[session_id] = None
+                self._executor.submit(self._run_session, session_id)
+        print(f"SpeculativeTriage: Сессия {session_id}: начат триаж по частичному тексту '{partial_text}'.")
+
+    def take(self, session_id: Optional[str], final_text: str) -> Optional[dict]:
+        """
+        Забирает спекуляцию сессии для финального текста.
+
+        Returns:
+            dict | None: {'triage_result', 'ha_prompt'} при совпадении текста (commit),
+            None — спекуляции нет или текст изменился (redo).
+        """
+        if not session_id:
+            return None
+        with self._lock:
+            speculation = self._sessions.pop(session_id, None)
+        if speculation is None:
+            return None
+        if speculation.normalized != normalize_name(final_text):
+            speculation.future.cancel()
+            self._count(committed=False)
+            print(f"SpeculativeTriage: Сессия {session_id}: финальный текст отличается, триаж заново.")
+            return None
+        with self._lock:
+            busy_with = self._running.get(session_id)
+        if busy_with is not None and busy_with is not speculation and speculation.future.cancel():
+            # Текст еще ждет, пока досчитается устаревший: обычный триаж будет быстрее
+            self._count(committed=False)
+            print(f"SpeculativeTriage: Сессия {session_id}: спекуляция еще не начата, триаж заново.")
+            return None
+        try:
+            prepared = speculation.future.result(timeout=self.take_timeout)
+        except FutureTimeoutError:
+            speculation.future.cancel()
+            self._count(committed=False)
+            print(f"SpeculativeTriage Warning: Спекуляция не успела за {self.take_timeout:.0f} с, триаж заново.")
+            return None
+        except Exception as e:
+            print(f"SpeculativeTriage Warning: Спекулятивный триаж упал ({e}), триаж заново.")
+            self._count(committed=False)
+            return None
+        if prepared.get("ha_prompt") is not None and speculation.version != self.version():
+            # Реестр устройств обновился после спекуляции — промпт пересоберем
+            prepared = dict(prepared, ha_prompt=None)
+        self._count(committed=True)
+        print(f"SpeculativeTriage: Сессия {session_id}: спекуляция подтверждена финальным текстом.")
+        return prepared
+
+    def _count(self, committed: bool):
+        with self._lock:
+            if committed:
+                self.committed += 1
+            else:
+                self.redone += 1
+
+    def record_latency(self, speculative: bool, seconds: float):
+        """Задержка от финального текста / конца речи до действия."""
+        with self._lock:
+            self._latencies[bool(speculative)].append(seconds * 1000)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latency = {}
+            for hit, key in ((True, "speculative"), (False, "regular")):
+                samples = sorted(self._latencies[hit])
+                latency[key] = {
+                    "count": len(samples),
+                    "p50_ms": round(samples[len(samples) // 2], 1) if samples else None,
+                    "max_ms": round(samples[-1], 1) if samples else None,
+                }
+            return {"committed": self.committed, "redone": self.redone,
+                    "pending_sessions": len(self._sessions), "speech_end_to_action": latency}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_session(self, session_id: str):
+        """Обработчик сессии в пуле: выполняет ее спекуляции по одной, всегда по самому новому тексту."""
+        while True:
+            with self._lock:
+                speculation = self._pending.pop(session_id, None)
+                if speculation is None:
+                    del self._running[session_id]
+                    return
+                if not speculation.future.set_running_or_notify_cancel():
+                    continue  # Устарела или отменена, пока ждала
+                self._running[session_id] = speculation
+            try:
+                speculation.future.set_result(self._prepare(speculation.text))
+            except Exception as e:
+                speculation.future.set_exception(e)
+
+    def _prepare(self, text: str) -> dict:
+        triage_result = self.triage(text)
+        ha_prompt = None
+        if triage_result.get("intent") == "home_assistant_action":
+            ha_prompt = self.prepare_ha_prompt(text)
+        return {"text": text, "triage_result": triage_result, "ha_prompt": ha_prompt}
+
+    def _drop_expired(self):
+        now = time.monotonic()
+        for session_id in [s for s, spec in self._sessions.items() if now - spec.started > self.session_ttl]:
+            self._sessions.pop(session_id).future.cancel()
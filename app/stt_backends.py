@@ -0,0 +1,252 @@
+# app/stt_backends.py
+"""Interchangeable speech-to-text backends.
+
+Every backend implements the same contract, ``transcribe(array) -> text``, on
+16 kHz mono float32 audio, so ``stt_engine`` and the STT server do not care
+which model runs underneath. The backend is chosen with ``stt_engine.backend``
+in ``configs/settings.yaml``:
+
+* ``whisper`` - openai-whisper on CPU in fp32 (the original engine);
+* ``faster_whisper`` - the same Whisper weights converted to CTranslate2 and
+  quantized to int8, several times faster on CPU at a small accuracy cost;
+* ``stub`` - no model at all: sleeps for a simulated real-time factor and
+  returns a fixed text (benchmarks and tests without weights or network).
+
+Each backend measures its real-time factor (processing time / audio duration).
+The counters live in shared memory created before the STT workers fork, so the
+numbers reported by the server include work done in every worker process.
+"""
+import multiprocessing
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Type
+
+import numpy as np
+
+from .audio_io import SAMPLE_RATE
+
+DEFAULT_BACKEND = "whisper"
+DEFAULT_LANGUAGE = "ru"
+# How many recent per-request RTF samples are kept for percentiles
+RTF_HISTORY_SIZE = 256
+
+
+class RTFStats:
+    """Real-time-factor counters in shared memory (visible across forked workers)."""
+
+    # Layout of the shared array: totals, then a ring of recent RTF samples
+    _REQUESTS, _AUDIO, _PROCESSING, _HEAD, _HISTORY = 0, 1, 2, 3, 4
+
+    def __init__(self, history_size: int = RTF_HISTORY_SIZE):
+        self.history_size = history_size
+        self._values = multiprocessing.Array("d", self._HISTORY + history_size)
+
+    def record(self, audio_seconds: float, processing_seconds: float):
+        with self._values.get_lock():
+            values = self._values.get_obj()
+            values[self._REQUESTS] += 1
+            values[self._AUDIO] += audio_seconds
+            values[self._PROCESSING] += processing_seconds
+            if audio_seconds > 0:
+                head = int(values[self._HEAD])
+                values[self._HISTORY + head % self.history_size] = processing_seconds / audio_seconds
+                values[self._HEAD] = head + 1
+
+    def snapshot(self) -> dict:
+        with self._values.get_lock():
+            values = np.frombuffer(self._values.get_obj(), dtype=np.float64).copy()
+        requests, audio, processing, head = values[:self._HISTORY]
+        samples = values[self._HISTORY:self._HISTORY + min(int(head), self.history_size)]
+        return {
+            "requests": int(requests),
+            "audio_seconds": round(float(audio), 2),
+            "processing_seconds": round(float(processing), 2),
+            "rtf": round(float(processing / audio), 3) if audio else None,
+            "rtf_p50": round(float(np.percentile(samples, 50)), 3) if len(samples) else None,
+            "rtf_p95": round(float(np.percentile(samples, 95)), 3) if len(samples) else None,
+        }
+
+
+class STTBackend(ABC):
+    """Base class: subclasses implement ``_transcribe`` (and optionally ``_transcribe_batch``)."""
+
+    name = "base"
+
+    def __init__(self, model_size: str, language: str = DEFAULT_LANGUAGE, **options):
+        self.model_size = model_size
+        self.language = language
+        self.options = options
+        self.stats = RTFStats()
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the exact model and decoding settings (used e.g. as a cache key part)."""
+        return f"{self.name}:{self.model_size}:{self.language}"
+
+    def transcribe(self, audio: np.ndarray) -> Optional[str]:
+        """Recognize 16 kHz mono float32 samples; returns None on error."""
+        started = time.perf_counter()
+        try:
+            text = self._transcribe(audio.astype(np.float32, copy=False))
+        except Exception as e:
+            print(f"STT_Engine Error: {self.name} backend failed to transcribe: {e}")
+            return None
+        self.stats.record(len(audio) / SAMPLE_RATE, time.perf_counter() - started)
+        return text.strip()
+
+    def transcribe_batch(self, audios: List[np.ndarray]) -> List[Optional[str]]:
+        """Recognize several clips; backends that can batch override ``_transcribe_batch``."""
+        if len(audios) <= 1:
+            return [self.transcribe(audio) for audio in audios]
+        started = time.perf_counter()
+        try:
+            texts = self._transcribe_batch([audio.astype(np.float32, copy=False) for audio in audios])
+        except Exception as e:
+            print(f"STT_Engine Error: Batched decoding failed ({e}), falling back to one-by-one transcription.")
+            return [self.transcribe(audio) for audio in audios]
+        if texts is None:
+            return [self.transcribe(audio) for audio in audios]
+        # One batched pass: its time is split over the clips in proportion to their length
+        elapsed = time.perf_counter() - started
+        total = sum(len(audio) for audio in audios) or 1
+        for audio in audios:
+            self.stats.record(len(audio) / SAMPLE_RATE, elapsed * len(audio) / total)
+        return [text.strip() if text is not None else None for text in texts]
+
+    def metrics(self) -> dict:
+        return {"backend": self.name, "model": self.model_size, **self.stats.snapshot()}
+
+    @abstractmethod
+    def _transcribe(self, audio: np.ndarray) -> str:
+        """Decode one clip of 16 kHz mono float32 audio."""
+
+    def _transcribe_batch(self, audios: List[np.ndarray]) -> Optional[List[Optional[str]]]:
+        """Return None to let the base class decode the clips one by one."""
+        return None
+
+
+class WhisperBackend(STTBackend):
+    """openai-whisper, fp32 on CPU."""
+
+    name = "whisper"
+
+    def __init__(self, model_size: str, language: str = DEFAULT_LANGUAGE, device: Optional[str] = None,
+                 download_root: Optional[str] = None, **options):
+        super().__init__(model_size, language, **options)
+        import whisper
+
+        self._whisper = whisper
+        # download_root pointing at already downloaded weights keeps loading offline
+        self.model = whisper.load_model(model_size, device=device, download_root=download_root)
+
+    def _transcribe(self, audio: np.ndarray) -> str:
+        return self.model.transcribe(audio, language=self.language, fp16=False)["text"]
+
+    def _transcribe_batch(self, audios: List[np.ndarray]) -> Optional[List[Optional[str]]]:
+        """
+        Pads each clip to Whisper's 30-second window, stacks the log-mel features
+        and decodes them in one pass. Clips longer than the window (which need
+        Whisper's sliding transcription) are transcribed one by one.
+        """
+        import torch
+
+        whisper = self._whisper
+        texts: List[Optional[str]] = [None] * len(audios)
+        short = []
+        for i, audio in enumerate(audios):
+            if len(audio) <= whisper.audio.N_SAMPLES:
+                short.append(i)
+            else:
+                texts[i] = self._transcribe(audio)
+        if len(short) == 1:
+            # Nothing to batch with: keep Whisper's full transcribe() (temperature fallback etc.)
+            texts[short[0]] = self._transcribe(audios[short[0]])
+        elif short:
+            mels = [whisper.log_mel_spectrogram(whisper.pad_or_trim(audios[i]), n_mels=self.model.dims.n_mels)
+                    for i in short]
+            options = whisper.DecodingOptions(language=self.language, fp16=False, without_timestamps=True)
+            decoded = whisper.decode(self.model, torch.stack(mels).to(self.model.device), options)
+            for i, result in zip(short, decoded):
+                texts[i] = result.text
+        return texts
+
+
+class FasterWhisperBackend(STTBackend):
+    """
+    Whisper on CTranslate2 (faster-whisper), int8-quantized for CPU by default.
+
+    CTranslate2 thread pools do not survive ``fork``, so a worker process that
+    inherits the model from the server loads its own copy on first use.
+    """
+
+    name = "faster_whisper"
+
+    def __init__(self, model_size: str, language: str = DEFAULT_LANGUAGE, compute_type: str = "int8",
+                 cpu_threads: int = 0, beam_size: int = 5, download_root: Optional[str] = None,
+                 local_files_only: bool = False, **options):
+        super().__init__(model_size, language, **options)
+        from faster_whisper import WhisperModel
+
+        self._model_class = WhisperModel
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.beam_size = beam_size
+        self.download_root = download_root
+        self.local_files_only = local_files_only
+        self._model = None
+        self._model_pid = None
+        self._load()
+
+    @property
+    def model_id(self) -> str:
+        return f"{super().model_id}:{self.compute_type}"
+
+    def _load(self):
+        self._model = self._model_class(self.model_size, device="cpu", compute_type=self.compute_type,
+                                        cpu_threads=self.cpu_threads, download_root=self.download_root,
+                                        local_files_only=self.local_files_only)
+        self._model_pid = os.getpid()
+
+    def _transcribe(self, audio: np.ndarray) -> str:
+        if self._model_pid != os.getpid():
+            self._load()
+        segments, _ = self._model.transcribe(audio, language=self.language, beam_size=self.beam_size)
+        return "".join(segment.text for segment in segments)
+
+
+class StubBackend(STTBackend):
+    """Model-free backend: spends ``rtf`` x audio duration and returns ``text``."""
+
+    name = "stub"
+
+    def __init__(self, model_size: str = "stub", language: str = DEFAULT_LANGUAGE, rtf: float = 0.0,
+                 text: str = "", **options):
+        super().__init__(model_size, language, **options)
+        self.rtf = rtf
+        self.text = text
+
+    def _transcribe(self, audio: np.ndarray) -> str:
+        time.sleep(len(audio) / SAMPLE_RATE * self.rtf)
+        return self.text
+
+
+BACKENDS: Dict[str, Type[STTBackend]] = {
+    WhisperBackend.name: WhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def create_backend(name: str, model_size: str, **options) -> STTBackend:
+    """
+    Instantiate a backend by its settings name.
+
+    Raises:
+        ValueError: Unknown backend name.
+        ImportError: The backend's package is not installed.
+    """
+    backend_class = BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"Unknown STT backend '{name}'. Available: {', '.join(sorted(BACKENDS))}")
+    return backend_class(model_size, **options)
@@ -0,0 +1,79 @@
+# app/stt_batching.py
+"""Micro-batching of concurrent transcription requests.
+
+:class:`MicroBatcher` holds each incoming clip for at most ``max_wait_ms``
+milliseconds. Clips that arrive within that window (up to ``max_batch_size``)
+are handed to ``run_batch`` together, so a burst of voice messages costs one
+batched decoder pass instead of one forward pass per request. A full batch is
+dispatched immediately; a lone request waits only the configured few
+milliseconds.
+"""
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_MAX_BATCH_SIZE = 4
+DEFAULT_MAX_WAIT_MS = 10.0
+
+
+class MicroBatcher:
+    def __init__(self, run_batch: Callable[[List[np.ndarray]], Awaitable[List[Optional[str]]]],
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        """
+        Args:
+            run_batch: Coroutine function decoding a list of clips, returning texts in the same order.
+            max_batch_size: Largest batch passed to ``run_batch``.
+            max_wait_ms: How long the first clip of a batch may wait for company.
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+
+    async def transcribe(self, audio: np.ndarray) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((audio, future))
+        if len(self._queue) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    async def transcribe_many(self, audios: List[np.ndarray]) -> List[Optional[str]]:
+        """Submit several clips at once (they may share batches with concurrent requests)."""
+        return list(await asyncio.gather(*(self.transcribe(audio) for audio in audios)))
+
+    @property
+    def average_batch_size(self) -> float:
+        return round(self.items / self.batches, 2) if self.batches else 0.0
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            batch, self._queue = self._queue[:self.max_batch_size], self._queue[self.max_batch_size:]
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[np.ndarray, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            texts = await self.run_batch([audio for audio, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), text in zip(batch, texts):
+            if not future.done():
+                future.set_result(text)
@@ -1,19 +1,30 @@
 # app/stt_engine.py
 """Speech-to-text engine based on the Whisper model.
 
-This module loads a Whisper model according to ``configs/settings.yaml`` and
-provides :func:`transcribe_audio_to_text` for converting audio files to text. It
-is utilized by the Telegram bot for voice command recognition and can be run
-standalone for debugging.
+This module loads the STT backend selected in ``configs/settings.yaml`` (see
+:mod:`app.stt_backends`) and provides :func:`transcribe_audio_to_text` for
+converting audio files to text and :func:`transcribe_audio_array` for audio that
+is already in memory. It is utilized by the Telegram bot for voice command
+recognition and can be run standalone for debugging.
 """
 
-import whisper
+import json
 import os
+import threading
+import numpy as np
 from .config_loader import load_settings
+from .audio_io import SAMPLE_RATE, AudioDecodeError, decode_audio
+from .stt_backends import DEFAULT_BACKEND, DEFAULT_LANGUAGE, STTBackend, create_backend
+from .vad import split_speech
 
 # --- Load STT configuration (model size) ---
 STT_CONFIG_DATA = None
 MODEL_SIZE_FROM_CONFIG = "base"  # Default value if the config fails to load
+BACKEND_FROM_CONFIG = DEFAULT_BACKEND
+LANGUAGE_FROM_CONFIG = DEFAULT_LANGUAGE
+BACKEND_OPTIONS = {}
+VAD_ENABLED = True
+VAD_OPTIONS = {}
 
 try:
     STT_CONFIG_DATA = load_settings()
@@ -28,6 +39,15 @@ try:
             f"'{MODEL_SIZE_FROM_CONFIG}'"
         )
 
+    stt_section = (STT_CONFIG_DATA or {}).get("stt_engine") or {}
+    BACKEND_FROM_CONFIG = stt_section.get("backend", DEFAULT_BACKEND)
+    LANGUAGE_FROM_CONFIG = stt_section.get("language", DEFAULT_LANGUAGE)
+    # Backend-specific options, e.g. compute_type / cpu_threads / beam_size for faster_whisper
+    BACKEND_OPTIONS = dict(stt_section.get("backend_options") or {})
+    # Silence trimming before decoding: {enabled: bool, <app.vad.speech_segments options>}
+    VAD_OPTIONS = dict(stt_section.get("vad") or {})
+    VAD_ENABLED = bool(VAD_OPTIONS.pop("enabled", True))
+
 except FileNotFoundError:
     print(
         f"STT_Engine: configs/settings.yaml not found. Using default Whisper model '{MODEL_SIZE_FROM_CONFIG}'"
@@ -41,30 +61,27 @@ except Exception as e_conf:
 # --- End of STT configuration loading ---
 
 
-# --- Whisper model loading ---
-STT_MODEL = None
+# --- Backend loading ---
+STT_BACKEND: STTBackend | None = None
 # Use MODEL_SIZE_FROM_CONFIG
 MODEL_TO_LOAD = MODEL_SIZE_FROM_CONFIG
 
 try:
-    print(f"STT_Engine: Loading Whisper model '{MODEL_TO_LOAD}'...")
-    # download_root could also come from config if needed
-    # download_root_path = STT_CONFIG_DATA.get('stt_engine', {}).get('download_root') if STT_CONFIG_DATA else None
-    # STT_MODEL = whisper.load_model(MODEL_TO_LOAD, download_root=download_root_path if download_root_path else None)
-    # Specify device="cpu" for explicit CPU usage
-    STT_MODEL = whisper.load_model(MODEL_TO_LOAD)
-    # To use a GPU specify device="cuda" or "cuda:0" for the first available GPU
-    print(f"STT_Engine: Whisper model '{MODEL_TO_LOAD}' loaded successfully.")
+    print(f"STT_Engine: Loading '{BACKEND_FROM_CONFIG}' backend with model '{MODEL_TO_LOAD}'...")
+    STT_BACKEND = create_backend(BACKEND_FROM_CONFIG, MODEL_TO_LOAD, language=LANGUAGE_FROM_CONFIG, **BACKEND_OPTIONS)
+    print(f"STT_Engine: Model '{MODEL_TO_LOAD}' loaded successfully ({STT_BACKEND.model_id}).")
 except Exception as e:
-    # ... error handling for model loading remains the same, mentioning MODEL_TO_LOAD
-    print(f"Critical STT_Engine error: failed to load Whisper model '{MODEL_TO_LOAD}': {e}")
-    STT_MODEL = None
-# --- End of model loading ---
+    print(f"Critical STT_Engine error: failed to load '{BACKEND_FROM_CONFIG}' backend with model '{MODEL_TO_LOAD}': {e}")
+    STT_BACKEND = None
+
+# The underlying openai-whisper model, kept for scripts that check it directly
+STT_MODEL = getattr(STT_BACKEND, "model", None) if STT_BACKEND else None
+# --- End of backend loading ---
 
 
 def transcribe_audio_to_text(audio_file_path: str) -> str | None:
     """
-    Recognize speech from an audio file using Whisper.
+    Recognize speech from an audio file.
 
     Args:
         audio_file_path (str): Path to the audio file.
@@ -72,8 +89,8 @@ def transcribe_audio_to_text(audio_file_path: str) -> str | None:
     Returns:
         str | None: The recognized text or None on error.
     """
-    if not STT_MODEL:
-        print("STT_Engine Error: Whisper model not loaded. Cannot transcribe.")
+    if not STT_BACKEND:
+        print("STT_Engine Error: STT backend not loaded. Cannot transcribe.")
         return None
 
     if not os.path.exists(audio_file_path):
@@ -82,23 +99,112 @@ def transcribe_audio_to_text(audio_file_path: str) -> str | None:
 
     print(f"STT_Engine: Starting transcription of audio file: {audio_file_path}")
     try:
-        # Perform recognition.
-        # We can specify the language upfront (language="ru")
-        # or let Whisper detect it automatically.
-        # For better accuracy with Russian it's preferable to set it.
-        result = STT_MODEL.transcribe(audio_file_path, language="ru", fp16=False)
-        # fp16=False may help if precision issues arise on GPU.
-        # On CPU it is less relevant. Remove if using GPU and encountering issues.
-
-        recognized_text = result["text"]
+        with open(audio_file_path, "rb") as audio_file:
+            audio = decode_audio(audio_file.read(), filename=audio_file_path)
+    except (OSError, AudioDecodeError) as e:
+        print(f"STT_Engine Error: Could not read audio file {audio_file_path}: {e}")
+        return None
+
+    recognized_text = transcribe_speech(audio)["text"]
+    if recognized_text is not None:
         print(f"STT_Engine: Recognized text: '{recognized_text}'")
-        return recognized_text.strip()  # Strip extra spaces
+    return recognized_text
+
+
+# Totals of the VAD stage in this process; apply_vad runs in worker threads, so updates take the lock
+VAD_STATS = {"clips": 0, "silent_clips": 0, "audio_seconds": 0.0, "removed_seconds": 0.0}
+_VAD_STATS_LOCK = threading.Lock()
+
+
+def apply_vad(audio: np.ndarray) -> tuple[list[np.ndarray], float]:
+    """
+    Trim leading/trailing silence and split the clip on long pauses.
+
+    Returns:
+        tuple[list[np.ndarray], float]: Speech segments to decode (empty for an
+        all-silence clip) and the seconds of audio removed.
+    """
+    if not VAD_ENABLED:
+        return [audio], 0.0
+    segments, removed_seconds = split_speech(audio, **VAD_OPTIONS)
+    with _VAD_STATS_LOCK:
+        VAD_STATS["clips"] += 1
+        VAD_STATS["silent_clips"] += not segments
+        VAD_STATS["audio_seconds"] += len(audio) / SAMPLE_RATE
+        VAD_STATS["removed_seconds"] += removed_seconds
+    return segments, removed_seconds
+
+
+def join_segment_texts(texts: list[str | None]) -> str | None:
+    """Joins per-segment transcripts; None only if every segment failed."""
+    if texts and all(text is None for text in texts):
+        return None
+    return " ".join(text for text in texts if text)
+
+
+def transcribe_speech(audio: np.ndarray) -> dict:
+    """
+    VAD + recognition of a whole clip in the current process.
+
+    Returns:
+        dict: ``text`` (None on error, "" for silence), ``audio_seconds`` and
+        ``trimmed_seconds`` (silence removed before decoding).
+    """
+    segments, trimmed_seconds = apply_vad(audio)
+    if not segments:
+        print(f"STT_Engine: No speech detected in {len(audio) / SAMPLE_RATE:.1f} s of audio, skipping decoding.")
+    text = join_segment_texts(transcribe_audio_batch(segments)) if segments else ""
+    return {"text": text, "audio_seconds": round(len(audio) / SAMPLE_RATE, 3), "trimmed_seconds": trimmed_seconds}
 
-    except Exception as e:
-        print(f"STT_Engine Error: An exception occurred during transcription: {e}")
-        import traceback
 
-        traceback.print_exc()  # Print full traceback for debugging
+def transcribe_audio_array(audio: np.ndarray) -> str | None:
+    """
+    Recognize speech from 16 kHz mono float32 samples in the range [-1, 1].
+
+    Args:
+        audio (np.ndarray): Audio samples.
+
+    Returns:
+        str | None: The recognized text or None on error.
+    """
+    if not STT_BACKEND:
+        print("STT_Engine Error: STT backend not loaded. Cannot transcribe.")
         return None
+    return STT_BACKEND.transcribe(audio)
+
+
+def transcribe_audio_batch(audios: list[np.ndarray]) -> list[str | None]:
+    """
+    Recognize several short clips at once. Backends that support it (openai-whisper)
+    decode the clips in one batched forward pass.
+
+    Args:
+        audios (list[np.ndarray]): 16 kHz mono float32 clips.
+
+    Returns:
+        list[str | None]: Texts in the order of ``audios`` (None for failed clips).
+    """
+    if not STT_BACKEND:
+        print("STT_Engine Error: STT backend not loaded. Cannot transcribe.")
+        return [None] * len(audios)
+    return STT_BACKEND.transcribe_batch(audios)
+
+
+def get_backend_metrics() -> dict | None:
+    """Real-time-factor metrics of the active backend (aggregated over all worker processes)."""
+    return STT_BACKEND.metrics() if STT_BACKEND else None
+
+
+def get_transcription_fingerprint() -> str:
+    """Everything that changes the transcript of the same audio: backend, model, language, VAD settings."""
+    model_id = STT_BACKEND.model_id if STT_BACKEND else f"{BACKEND_FROM_CONFIG}:{MODEL_TO_LOAD}:{LANGUAGE_FROM_CONFIG}"
+    vad = json.dumps(VAD_OPTIONS, sort_keys=True) if VAD_ENABLED else "off"
+    return f"{model_id}|vad={vad}"
 
 
+def get_vad_metrics() -> dict:
+    with _VAD_STATS_LOCK:
+        stats = dict(VAD_STATS)
+    return {"enabled": VAD_ENABLED, **stats,
+            "audio_seconds": round(stats["audio_seconds"], 2),
+            "removed_seconds": round(stats["removed_seconds"], 2)}
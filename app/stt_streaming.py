@@ -0,0 +1,154 @@
+# app/stt_streaming.py
+"""Incremental transcription of a live 16-bit PCM stream.
+
+:class:`StreamingTranscriber` accumulates chunks as they are recorded and
+re-decodes the not yet committed audio (the sliding window) every
+``partial_interval`` seconds, producing partial transcripts while the user is
+still talking. When the window grows past ``window_seconds`` its text is
+committed and the audio dropped, so each decode stays bounded. The utterance is
+finalized on end-of-stream or after ``silence_seconds`` of trailing silence
+following speech.
+
+The transcriber is synchronous and model-agnostic: it receives a
+``transcribe(float32 array) -> str | None`` callable, normally
+:func:`app.stt_engine.transcribe_audio_array`.
+"""
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from .audio_io import SAMPLE_RATE, pcm16_to_float32
+
+# Silence detection works on 30 ms frames
+FRAME_SECONDS = 0.03
+
+DEFAULT_PARTIAL_INTERVAL = 0.5
+DEFAULT_WINDOW_SECONDS = 20.0
+DEFAULT_SILENCE_SECONDS = 0.8
+# RMS of int16 samples below which a frame counts as silence
+DEFAULT_SILENCE_THRESHOLD = 500.0
+
+
+def frame_rms(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """RMS of every complete frame of int16 samples (a trailing partial frame is ignored)."""
+    usable = len(samples) - len(samples) % frame_length
+    if not usable:
+        return np.empty(0, dtype=np.float64)
+    frames = samples[:usable].astype(np.float64).reshape(-1, frame_length)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+class StreamingTranscriber:
+    """One streaming utterance: feed PCM chunks, collect partial/final transcript events."""
+
+    def __init__(self, transcribe: Callable[[np.ndarray], Optional[str]],
+                 sample_rate: int = SAMPLE_RATE,
+                 partial_interval: float = DEFAULT_PARTIAL_INTERVAL,
+                 window_seconds: float = DEFAULT_WINDOW_SECONDS,
+                 silence_seconds: float = DEFAULT_SILENCE_SECONDS,
+                 silence_threshold: float = DEFAULT_SILENCE_THRESHOLD):
+        self.transcribe = transcribe
+        self.sample_rate = sample_rate
+        self.partial_samples = int(partial_interval * sample_rate)
+        self.window_samples = int(window_seconds * sample_rate)
+        self.silence_samples = int(silence_seconds * sample_rate)
+        self.silence_threshold = silence_threshold
+        self.frame_length = max(1, int(FRAME_SECONDS * sample_rate))
+
+        self.finished = False
+        self.total_samples = 0
+        self._window = bytearray()   # PCM not yet committed to text
+        self._pending = b""          # Unprocessed bytes (odd byte / partial frame)
+        self._committed: List[str] = []
+        self._last_partial = ""
+        self._since_partial = 0
+        self._speech_seen = False
+        self._trailing_silence = 0
+
+    @property
+    def text(self) -> str:
+        return " ".join(t for t in (*self._committed, self._last_partial) if t)
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        """
+        Add a chunk of 16-bit mono PCM.
+
+        Returns:
+            list[dict]: Events produced by this chunk: ``{"type": "partial", "text": ...}``
+            and, when trailing silence ended the utterance, a final event (see :meth:`finish`).
+        """
+        if self.finished:
+            return []
+        data = self._pending + chunk
+        # Only whole frames are consumed so frame boundaries stay aligned across chunks
+        usable = len(data) - len(data) % (2 * self.frame_length)
+        self._pending = data[usable:]
+        if not usable:
+            return []
+        samples = np.frombuffer(data[:usable], dtype="<i2")
+        self._window += data[:usable]
+        self.total_samples += len(samples)
+        self._since_partial += len(samples)
+        self._update_silence(samples)
+
+        events = []
+        if self._speech_seen and self._trailing_silence >= self.silence_samples:
+            events.append(self.finish())
+        elif len(self._window) // 2 >= self.window_samples:
+            self._commit_window()
+            events.append(self._partial_event())
+        elif self._speech_seen and self._since_partial >= self.partial_samples:
+            if self._decode_partial():
+                events.append(self._partial_event())
+        return events
+
+    def finish(self) -> dict:
+        """Finalize the utterance (end-of-stream or silence) and return the final event."""
+        if self.finished:
+            return {"type": "final", "text": self.text, "audio_seconds": self.audio_seconds}
+        self.finished = True
+        remainder = self._pending[:len(self._pending) - len(self._pending) % 2]
+        self._window += remainder
+        self.total_samples += len(remainder) // 2
+        self._pending = b""
+        if self._speech_seen and self._window:
+            text = self.transcribe(pcm16_to_float32(bytes(self._window)))
+            if text is None:
+                return {"type": "error", "error": "transcription failed", "text": self.text}
+            self._last_partial = ""
+            if text:
+                self._committed.append(text)
+            self._window.clear()
+        return {"type": "final", "text": self.text, "audio_seconds": self.audio_seconds}
+
+    @property
+    def audio_seconds(self) -> float:
+        return round(self.total_samples / self.sample_rate, 3)
+
+    def _update_silence(self, samples: np.ndarray):
+        loud = frame_rms(samples, self.frame_length) >= self.silence_threshold
+        if not loud.any():
+            self._trailing_silence += len(samples)
+            return
+        self._speech_seen = True
+        last_loud = len(loud) - 1 - int(np.argmax(loud[::-1]))
+        self._trailing_silence = (len(loud) - 1 - last_loud) * self.frame_length
+
+    def _decode_partial(self) -> bool:
+        self._since_partial = 0
+        text = self.transcribe(pcm16_to_float32(bytes(self._window)))
+        if text is None or text == self._last_partial:
+            return False
+        self._last_partial = text
+        return True
+
+    def _commit_window(self):
+        self._since_partial = 0
+        text = self.transcribe(pcm16_to_float32(bytes(self._window))) if self._speech_seen else ""
+        if text:
+            self._committed.append(text)
+        self._last_partial = ""
+        self._window.clear()
+
+    def _partial_event(self) -> dict:
+        return {"type": "partial", "text": self.text}
@@ -0,0 +1,208 @@
+# app/stt_worker_pool.py
+"""Pool of pre-forked STT worker processes.
+
+The model is loaded once in the server process (``app.stt_engine`` loads it at
+import). :class:`STTWorkerPool` then forks all workers up front, so every child
+shares the already loaded, read-only weights through copy-on-write pages
+instead of loading its own copy. Each worker pins torch to a fixed number of
+threads, so N workers use N x ``torch_threads`` cores instead of oversubscribing
+them.
+
+Async callers await :meth:`STTWorkerPool.transcribe`, which wraps the executor
+future (a micro-batch from :meth:`STTWorkerPool.transcribe_many` is split
+across the workers), so the FastAPI event loop never blocks on decoding; synchronous callers
+(streaming sessions running in a thread) use :meth:`STTWorkerPool.transcribe_blocking`.
+At most ``workers + queue_size`` requests are accepted at once; beyond that
+:meth:`STTWorkerPool.submit` raises :class:`STTPoolBusyError` and the server
+answers 503 (backpressure).
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import numpy as np
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_TORCH_THREADS = 1
+# How long start() waits for every worker to come up
+STARTUP_TIMEOUT_SECONDS = 30.0
+
+# Inherited by the forked workers (set in _init_worker), used only by the startup handshake
+_startup_barrier = None
+
+
+class STTPoolBusyError(RuntimeError):
+    """All workers are busy and the waiting queue is full."""
+
+
+def _init_worker(torch_threads: int, startup_barrier=None):
+    """Runs once in every forked worker before it takes requests."""
+    global _startup_barrier
+    _startup_barrier = startup_barrier
+    os.environ["OMP_NUM_THREADS"] = str(torch_threads)
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(torch_threads)
+
+
+def _transcribe_each(transcribe: Callable, audios: List[np.ndarray]) -> List[Optional[str]]:
+    return [transcribe(audio) for audio in audios]
+
+
+def _worker_pid(_=None) -> int:
+    """Startup handshake: each task holds its worker until all workers hold one, so every pid is reported."""
+    if _startup_barrier is not None:
+        _startup_barrier.wait(STARTUP_TIMEOUT_SECONDS)
+    return os.getpid()
+
+
+class STTWorkerPool:
+    def __init__(self, transcribe: Callable[[np.ndarray], Optional[str]],
+                 transcribe_batch: Optional[Callable[[List[np.ndarray]], List[Optional[str]]]] = None,
+                 workers: int = DEFAULT_WORKERS,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 torch_threads: int = DEFAULT_TORCH_THREADS):
+        """
+        Args:
+            transcribe: Module-level function run in the workers (must be importable by reference).
+            transcribe_batch: Optional module-level function decoding a list of arrays at once;
+                a whole batch occupies one slot of the pool.
+            workers: Number of worker processes; 0 runs transcription in a single
+                background thread of the current process (platforms without fork).
+            queue_size: Requests allowed to wait for a free worker.
+            torch_threads: torch intra-op threads per worker.
+        """
+        self.transcribe_fn = transcribe
+        self.transcribe_batch_fn = transcribe_batch
+        self.workers = workers
+        self.queue_size = queue_size
+        self.torch_threads = torch_threads
+        self.capacity = max(workers, 1) + queue_size
+        self._in_flight = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        self.worker_pids = []
+
+    def start(self):
+        """Fork the workers now (while the process holds only the loaded model)."""
+        if self._executor is not None:
+            return
+        if self.workers > 0 and "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.torch_threads, context.Barrier(self.workers)),
+            )
+            # With the fork start method the executor launches all workers on the
+            # first submit; wait until every one of them answers so no request pays for the fork
+            self.worker_pids = sorted(set(self._executor.map(_worker_pid, range(self.workers))))
+            print(f"STT_Pool: Запущено {self.workers} процессов распознавания (pid {self.worker_pids}), "
+                  f"torch-потоков на процесс: {self.torch_threads}, очередь: {self.queue_size}.")
+        else:
+            if self.workers > 0:
+                print("STT_Pool Warning: fork недоступен на этой платформе, распознавание идет в одном потоке.")
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, audio: np.ndarray) -> Future:
+        """Queue audio for a worker; raises STTPoolBusyError when the pool is full."""
+        return self._submit(self.transcribe_fn, audio)
+
+    def submit_batch(self, audios: List[np.ndarray]) -> Future:
+        """Queue a batch for one worker (falls back to one-by-one decoding without transcribe_batch)."""
+        if self.transcribe_batch_fn is None:
+            return self._submit(_transcribe_each, self.transcribe_fn, audios)
+        return self._submit(self.transcribe_batch_fn, audios)
+
+    async def transcribe(self, audio: np.ndarray) -> Optional[str]:
+        """Transcribe in a worker without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(audio))
+
+    async def transcribe_many(self, audios: List[np.ndarray]) -> List[Optional[str]]:
+        """
+        Decode a micro-batch split evenly across the workers: a burst is batched and still uses every core.
+
+        Queue slots for all chunks are reserved before anything is submitted, so a
+        full pool rejects the whole batch instead of leaving part of it decoding.
+        A busy pool gets fewer, larger chunks rather than a rejection.
+        """
+        if not audios:
+            return []
+        if self._executor is None:
+            self.start()
+        parts = self._reserve(min(len(audios), max(self.workers, 1)))
+        size, extra = divmod(len(audios), parts)
+        chunks, start = [], 0
+        for i in range(parts):
+            end = start + size + (i < extra)
+            chunks.append(audios[start:end])
+            start = end
+        if self.transcribe_batch_fn is None:
+            calls = [(_transcribe_each, self.transcribe_fn, chunk) for chunk in chunks]
+        else:
+            calls = [(self.transcribe_batch_fn, chunk) for chunk in chunks]
+        futures = self._submit_reserved(calls)
+        results = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        return [text for texts in results for text in texts]
+
+    def transcribe_blocking(self, audio: np.ndarray) -> Optional[str]:
+        return self.submit(audio).result()
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        if self._executor is None:
+            self.start()
+        self._reserve(1)
+        return self._submit_reserved([(fn, *args)])[0]
+
+    def _reserve(self, wanted: int) -> int:
+        """Take up to ``wanted`` free slots (at least one); raises STTPoolBusyError when none are free."""
+        with self._lock:
+            free = self.capacity - self._in_flight
+            if free < 1:
+                self._rejected += 1
+                raise STTPoolBusyError(f"STT queue is full ({self._in_flight} requests in flight)")
+            reserved = min(wanted, free)
+            self._in_flight += reserved
+        return reserved
+
+    def _submit_reserved(self, calls: List[tuple]) -> List[Future]:
+        """Submit calls whose slots are already reserved; on failure cancel what was queued and free every slot."""
+        futures = []
+        try:
+            for fn, *args in calls:
+                futures.append(self._executor.submit(fn, *args))
+        except Exception:
+            for future in futures:
+                future.cancel()
+            with self._lock:
+                self._in_flight -= len(calls)
+            raise
+        for future in futures:
+            future.add_done_callback(self._release)
+        return futures
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+            }
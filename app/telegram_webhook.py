@@ -0,0 +1,235 @@
+# app/telegram_webhook.py
+"""
+Telegram webhook внутри Nox Core API.
+
+С telegram_bot.mode: webhook Telegram сам присылает обновления в api_server
+(POST /telegram/webhook), и они сразу идут в CoreEngine: без отдельного
+процесса бота, long polling и HTTP-прыжка бот -> Core API. Подлинность
+запроса проверяется по заголовку X-Telegram-Bot-Api-Secret-Token (secret_token
+из setWebhook). Ответ 200 уходит сразу, а команда обрабатывается в фоне, так
+что Telegram не ждет Ollama и не повторяет доставку по таймауту. Синхронный
+CoreEngine выполняется в пуле потоков, чтобы не блокировать цикл событий
+сервера, а ответ уходит асинхронно через sendMessage.
+
+Режим polling (interfaces/telegram_bot.py) остается для машин без публичного
+HTTPS-адреса.
+"""
+import asyncio
+import hmac
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, List, Dict, Optional
+
+import httpx
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+
+from .service_transport import make_async_http_client, SERVICE_STT
+
+TELEGRAM_MODE_POLLING = "polling"
+TELEGRAM_MODE_WEBHOOK = "webhook"
+DEFAULT_TELEGRAM_API_URL = "https://api.telegram.org"
+WEBHOOK_PATH = "/telegram/webhook"
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+VOICE_CONTENT_TYPE = "audio/ogg"
+# Telegram повторяет доставку, если не получил ответ: помним последние update_id
+SEEN_UPDATES_LIMIT = 1000
+
+# Синхронный обработчик команды (history, is_voice, chat_id) -> ответ пользователю или None
+CommandHandler = Callable[[List[Dict[str, str]], bool, int], Optional[str]]
+
+
+def telegram_mode(config: dict) -> str:
+    return ((config or {}).get("telegram_bot") or {}).get("mode", TELEGRAM_MODE_POLLING)
+
+
+async def transcribe_voice_note(stt_client: httpx.AsyncClient, audio_data: bytes, content_type: Optional[str],
+                                stt_url: str, stt_raw_url: Optional[str] = None) -> Optional[str]:
+    """
+    Распознает голосовое сообщение из памяти: сырым телом на stt_raw_url
+    (/transcribe/raw), если он задан, иначе multipart-формой на stt_url.
+
+    Returns:
+        Текст ('' — речь не распознана) или None, если STT вернул ошибку.
+
+    Raises:
+        httpx.HTTPError: Сетевая ошибка.
+    """
+    content_type = content_type or VOICE_CONTENT_TYPE
+    if stt_raw_url:
+        response = await stt_client.post(stt_raw_url, content=audio_data, headers={"Content-Type": content_type})
+    else:
+        response = await stt_client.post(stt_url, files={"file": ("voice.ogg", audio_data, content_type)})
+    if response.status_code != 200:
+        print(f"Telegram Error: STT Server вернул ошибку: {response.status_code} - {response.text}")
+        return None
+    return response.json().get("text") or ""
+
+
+class TelegramWebhook:
+    """
+    Обработка обновлений, которые Telegram присылает на webhook: проверка
+    секрета, голосовые (скачиваются в память и распознаются в STT) и текст
+    передаются в handle_command(history, is_voice, chat_id) — в api_server это
+    та же логика, что у /command/telegram. handle_command блокирует (LLM,
+    Home Assistant), поэтому вызывается в пуле потоков; возвращенный ответ
+    отправляется в чат через send_message.
+    """
+
+    def __init__(self, config: dict, handle_command: CommandHandler):
+        bot_config = config.get("telegram_bot", {}) or {}
+        webhook_config = bot_config.get("webhook", {}) or {}
+        endpoints = config.get("api_endpoints", {}) or {}
+        self.config = config
+        self.handle_command = handle_command
+        self.enabled = telegram_mode(config) == TELEGRAM_MODE_WEBHOOK
+        self.token = bot_config.get("token")
+        self.api_url = bot_config.get("api_base_url", DEFAULT_TELEGRAM_API_URL).rstrip("/")
+        self.webhook_url = webhook_config.get("url")
+        self.secret_token = webhook_config.get("secret_token")
+        self.allowed_user_ids = bot_config.get("allowed_user_ids", [])
+        self.stt_url = endpoints.get("nox_stt")
+        self.stt_raw_url = endpoints.get("nox_stt_raw")
+        self._seen_updates = deque(maxlen=SEEN_UPDATES_LIMIT)
+        self._telegram_client: Optional[httpx.AsyncClient] = None
+        self._stt_client: Optional[httpx.AsyncClient] = None
+
+    def verify(self, secret_token: Optional[str]) -> bool:
+        """Запрос от Telegram, только если секрет настроен и совпал (сравнение за постоянное время)."""
+        if not self.secret_token or secret_token is None:
+            return False
+        return hmac.compare_digest(secret_token.encode("utf-8"), self.secret_token.encode("utf-8"))
+
+    def is_duplicate(self, update: dict) -> bool:
+        update_id = update.get("update_id")
+        if update_id is None:
+            return False
+        if update_id in self._seen_updates:
+            return True
+        self._seen_updates.append(update_id)
+        return False
+
+    # --- Клиенты (создаются в цикле событий сервера при первом использовании) ---
+
+    @property
+    def telegram_client(self) -> httpx.AsyncClient:
+        if self._telegram_client is None:
+            self._telegram_client = httpx.AsyncClient(base_url=self.api_url, timeout=30.0)
+        return self._telegram_client
+
+    @property
+    def stt_client(self) -> httpx.AsyncClient:
+        if self._stt_client is None:
+            self._stt_client = make_async_http_client(self.config, SERVICE_STT, timeout=60.0)
+        return self._stt_client
+
+    async def close(self):
+        for client in (self._telegram_client, self._stt_client):
+            if client is not None:
+                await client.aclose()
+        self._telegram_client = self._stt_client = None
+
+    # --- Bot API ---
+
+    async def _call(self, method: str, **params) -> dict:
+        response = await self.telegram_client.post(f"/bot{self.token}/{method}", json=params)
+        try:
+            body = response.json()
+        except ValueError:  # Не JSON: например, 502 от прокси перед Bot API
+            body = {"ok": False, "description": f"HTTP {response.status_code}"}
+        if not body.get("ok"):
+            raise httpx.HTTPStatusError(f"Telegram {method}: {body.get('description')}",
+                                        request=response.request, response=response)
+        return body.get("result")
+
+    async def register(self):
+        """setWebhook с URL и секретом из настроек (при старте api_server)."""
+        if not self.enabled or not self.webhook_url:
+            return
+        try:
+            await self._call("setWebhook", url=self.webhook_url, secret_token=self.secret_token,
+                             allowed_updates=["message"])
+            print(f"Telegram: Webhook зарегистрирован: {self.webhook_url}")
+        except httpx.HTTPError as e:
+            print(f"Telegram Error: Не удалось зарегистрировать webhook: {e}")
+
+    async def send_message(self, chat_id: int, text: str):
+        try:
+            await self._call("sendMessage", chat_id=chat_id, text=text)
+        except httpx.HTTPError as e:
+            print(f"Telegram Error: Не удалось отправить сообщение в Telegram: {e}")
+
+    async def download_file(self, file_id: str) -> bytes:
+        """Файл по file_id в память (getFile + скачивание), без записи на диск."""
+        telegram_file = await self._call("getFile", file_id=file_id)
+        response = await self.telegram_client.get(f"/file/bot{self.token}/{telegram_file['file_path']}")
+        response.raise_for_status()
+        return response.content
+
+    # --- Обработка обновлений ---
+
+    async def process(self, update: dict):
+        """Фоновая обработка одного обновления (после того, как webhook уже ответил 200)."""
+        message = update.get("message") or {}
+        chat_id = (message.get("chat") or {}).get("id")
+        user_id = (message.get("from") or {}).get("id")
+        if chat_id is None or (self.allowed_user_ids and user_id not in self.allowed_user_ids):
+            return
+
+        if "voice" in message:
+            print(f"Telegram: Получено ГОЛОСОВОЕ сообщение от chat_id: {chat_id}")
+            voice = message["voice"]
+            try:
+                audio_data = await self.download_file(voice["file_id"])
+                text = await transcribe_voice_note(self.stt_client, audio_data, voice.get("mime_type"),
+                                                   self.stt_url, self.stt_raw_url)
+            except httpx.HTTPError as e:
+                print(f"Telegram Error: Ошибка при обработке голосового сообщения: {e}")
+                await self.send_message(chat_id, "Ой, что-то пошло не так при обработке твоего голоса.")
+                return
+            if text is None:
+                await self.send_message(chat_id, "Прости, мое 'ухо' сейчас барахлит.")
+                return
+            if not text:
+                await self.send_message(chat_id, "Прости, Искра, я не смог разобрать твое голосовое сообщение.")
+                return
+            is_voice = True
+        elif message.get("text") and not message["text"].startswith("/"):
+            text, is_voice = message["text"], False
+        else:
+            return
+
+        print(f"Telegram: Команда из webhook: '{text}' (chat_id: {chat_id}, голос: {is_voice})")
+        try:
+            reply = await asyncio.to_thread(self.handle_command, [{"role": "user", "content": text}], is_voice, chat_id)
+        except Exception as e:
+            print(f"Telegram Error: Ошибка при обработке команды из webhook: {e}")
+            await self.send_message(chat_id, "Ой, что-то пошло не так.")
+            return
+        if reply:
+            await self.send_message(chat_id, reply)
+
+
+def make_webhook_router(webhook: TelegramWebhook) -> APIRouter:
+    """Маршрут POST /telegram/webhook; setWebhook при старте, закрытие клиентов при остановке."""
+    @asynccontextmanager
+    async def lifespan(app):
+        await webhook.register()
+        yield
+        await webhook.close()
+
+    router = APIRouter(lifespan=lifespan)
+
+    @router.post(WEBHOOK_PATH)
+    async def telegram_webhook_endpoint(request: Request, background_tasks: BackgroundTasks):
+        if not webhook.verify(request.headers.get(SECRET_TOKEN_HEADER)):
+            raise HTTPException(status_code=403, detail="Неверный secret token")
+        try:
+            update = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Ожидается JSON-обновление Telegram")
+        if not webhook.is_duplicate(update):
+            # Выполнится после отправки ответа: Telegram получает 200 сразу
+            background_tasks.add_task(webhook.process, update)
+        return {"ok": True}
+
+    return router
@@ -0,0 +1,114 @@
+# app/transcription_cache.py
+"""Content-addressed cache of transcripts.
+
+Forwarded and re-sent voice notes, and uploads retried by the Telegram bot,
+arrive as byte-identical files. The cache key is a BLAKE2 hash of the uploaded
+bytes combined with a fingerprint of everything that affects the output
+(backend, model, language, VAD settings), so a hit skips both decoding and
+recognition. Entries live in a bounded LRU; optionally they are written to a
+JSON file (atomically, like the entity snapshot) and restored on startup.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_MAX_ENTRIES = 2048
+# Persist after this many new entries (and on shutdown)
+DEFAULT_SAVE_EVERY = 50
+CACHE_FORMAT = 1
+
+
+class TranscriptionCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, persist_path: Optional[str] = None,
+                 save_every: int = DEFAULT_SAVE_EVERY):
+        self.max_entries = max_entries
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.save_every = save_every
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        if self.persist_path is not None:
+            self._load()
+
+    @staticmethod
+    def make_key(data: bytes, fingerprint: str) -> str:
+        digest = hashlib.blake2b(data, digest_size=16)
+        digest.update(b"\0" + fingerprint.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key: str, text: Optional[str]):
+        """Stores a successful transcript (None results are never cached)."""
+        if text is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            should_save = self.persist_path is not None and self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+    def save(self) -> bool:
+        if self.persist_path is None:
+            return False
+        with self._lock:
+            payload = {"format": CACHE_FORMAT, "entries": list(self._entries.items())}
+            self._unsaved = 0
+        tmp_path = self.persist_path.with_suffix(".tmp")
+        try:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.persist_path)
+            return True
+        except OSError as e:
+            print(f"STT_Cache Warning: Не удалось сохранить кэш распознавания в {self.persist_path}: {e}")
+            return False
+
+    def _load(self):
+        if not self.persist_path.exists():
+            return
+        try:
+            with self.persist_path.open("r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if payload.get("format") != CACHE_FORMAT:
+                raise ValueError(f"неизвестный формат {payload.get('format')}")
+            entries = [(str(key), str(text)) for key, text in payload["entries"]]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"STT_Cache Warning: Кэш распознавания {self.persist_path} поврежден ({e}), начинаю с пустого.")
+            return
+        # Keep the most recently used entries if the limit shrank
+        self._entries = OrderedDict(entries[-self.max_entries:] if self.max_entries > 0 else [])
+        print(f"STT_Cache: Загружено {len(self._entries)} распознанных записей из {self.persist_path}.")
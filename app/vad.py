@@ -0,0 +1,98 @@
+# app/vad.py
+"""Energy + zero-crossing-rate voice activity detection in NumPy.
+
+The whole clip is framed with one reshape, and per-frame RMS energy and
+zero-crossing rate are computed vectorized. A frame is speech when its energy
+clears an adaptive threshold (a multiple of the clip's noise floor), or when it
+is moderately loud with a high zero-crossing rate (unvoiced consonants such as
+"с" or "ш" are quiet but noisy). Speech runs separated by less than
+``max_pause_seconds`` are merged; longer pauses split the clip. Each segment
+keeps ``padding_ms`` of context on both sides so Whisper does not lose word
+edges.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+from .audio_io import SAMPLE_RATE
+
+DEFAULT_FRAME_MS = 30
+DEFAULT_ENERGY_RATIO = 3.0
+# Absolute floor for the speech threshold (RMS of float samples, about -46 dBFS)
+DEFAULT_MIN_ENERGY = 0.005
+DEFAULT_ZCR_THRESHOLD = 0.25
+DEFAULT_MAX_PAUSE_SECONDS = 1.0
+DEFAULT_PADDING_MS = 200
+DEFAULT_MIN_SPEECH_MS = 90
+
+
+def frame_features(audio: np.ndarray, frame_length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-frame RMS energy and zero-crossing rate (a trailing partial frame is zero-padded)."""
+    padded_length = -(-len(audio) // frame_length) * frame_length
+    frames = np.zeros(padded_length, dtype=np.float32)
+    frames[:len(audio)] = audio
+    frames = frames.reshape(-1, frame_length)
+    energy = np.sqrt(np.mean(frames * frames, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_length - 1)
+    return energy, zcr
+
+
+def speech_segments(audio: np.ndarray, sample_rate: int = SAMPLE_RATE,
+                    frame_ms: int = DEFAULT_FRAME_MS,
+                    energy_ratio: float = DEFAULT_ENERGY_RATIO,
+                    min_energy: float = DEFAULT_MIN_ENERGY,
+                    zcr_threshold: float = DEFAULT_ZCR_THRESHOLD,
+                    max_pause_seconds: float = DEFAULT_MAX_PAUSE_SECONDS,
+                    padding_ms: int = DEFAULT_PADDING_MS,
+                    min_speech_ms: int = DEFAULT_MIN_SPEECH_MS) -> List[Tuple[int, int]]:
+    """
+    Find speech in a float32 clip.
+
+    Returns:
+        list[tuple[int, int]]: ``[start, end)`` sample ranges of speech segments
+        (with padding), empty if the clip is all silence.
+    """
+    frame_length = max(2, int(sample_rate * frame_ms / 1000))
+    if len(audio) < frame_length:
+        return []
+    energy, zcr = frame_features(audio, frame_length)
+
+    # Noise floor: the quietest tenth of the clip; capped so that a clip with
+    # no pauses at all is not measured against its own speech level
+    noise_floor = float(np.percentile(energy, 10))
+    threshold = max(min_energy, min(noise_floor * energy_ratio, float(energy.max()) * 0.25))
+    speech = (energy >= threshold) | ((energy >= threshold / 2) & (zcr >= zcr_threshold))
+    if not speech.any():
+        return []
+
+    # Runs of speech frames as [start, end) frame indices
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.view(np.int8), [0]))))
+    runs = edges.reshape(-1, 2)
+
+    # Merge runs separated by short pauses, then drop blips too short to be words
+    max_pause = int(max_pause_seconds * 1000 / frame_ms)
+    gaps = runs[1:, 0] - runs[:-1, 1]
+    split_after = np.flatnonzero(gaps >= max_pause)
+    starts = runs[np.concatenate(([0], split_after + 1)), 0]
+    ends = runs[np.concatenate((split_after, [len(runs) - 1])), 1]
+    min_frames = max(1, int(min_speech_ms / frame_ms))
+    keep = (ends - starts) >= min_frames
+
+    padding = int(sample_rate * padding_ms / 1000)
+    return [(max(0, int(s) * frame_length - padding), min(len(audio), int(e) * frame_length + padding))
+            for s, e in zip(starts[keep], ends[keep])]
+
+
+def split_speech(audio: np.ndarray, **options) -> Tuple[List[np.ndarray], float]:
+    """
+    Trim silence and split on long pauses.
+
+    Returns:
+        tuple[list[np.ndarray], float]: Speech segments (views into ``audio``)
+        and the seconds of audio removed.
+    """
+    sample_rate = options.get("sample_rate", SAMPLE_RATE)
+    segments = [audio[start:end] for start, end in speech_segments(audio, **options)]
+    removed = (len(audio) - sum(len(segment) for segment in segments)) / sample_rate
+    return segments, round(removed, 3)
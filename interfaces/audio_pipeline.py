@@ -0,0 +1,489 @@
+# interfaces/audio_pipeline.py
+"""
+Обработка звука с микрофона без зависимости от PyAudio/Porcupine.
+
+Захват, распознавание wake-word и отправка команд разнесены по потокам:
+CaptureThread только читает кадры с устройства и пишет их в заранее
+выделенный кольцевой буфер NumPy (RingBuffer); потребитель читает из буфера
+со своей позиции (wake-word, затем запись команды с самого момента
+срабатывания, так что сказанное во время звукового сигнала не теряется);
+готовая команда уходит в CommandWorker, который делает
+медленные HTTP-запросы, пока микрофон продолжает слушать.
+
+StreamingSTTSession стримит команду в потоковый STT прямо во время записи:
+частичные тексты уходят в Nox Core (/command/partial), и ядро начинает триаж,
+пока пользователь еще говорит; финальная команда приходит с тем же session_id.
+
+Endpointer решает, когда пользователь закончил говорить: запись команды
+останавливается после заданной паузы тишины после речи, но не раньше
+минимальной и не позже максимальной длительности. Порог речи считается от
+уровня шума, откалиброванного при старте. Энергия (RMS) считается
+векторизованно в NumPy по целому кадру Porcupine (frame_length сэмплов).
+"""
+import json
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+from websockets.exceptions import WebSocketException
+from websockets.sync.client import connect as ws_connect, unix_connect as ws_unix_connect
+
+from app.audio_io import (
+    CodecStats, AudioEncodeError, encode_audio, encode_wav, CODEC_PCM16, DEFAULT_CODEC, DEFAULT_OPUS_BITRATE, UPLOAD_FORMATS,
+)
+from app.service_transport import client_socket_path, make_http_client, raw_pcm_content_type, SERVICE_STT
+
+DEFAULT_SILENCE_SECONDS = 0.6
+DEFAULT_MIN_SECONDS = 0.8
+DEFAULT_MAX_SECONDS = 8.0
+# Если после wake-word речь так и не началась — не ждем max_seconds
+DEFAULT_NO_SPEECH_SECONDS = 3.0
+DEFAULT_THRESHOLD_RATIO = 3.0
+# Нижняя граница порога речи (RMS 16-битных сэмплов), если в комнате совсем тихо
+DEFAULT_MIN_THRESHOLD = 300.0
+DEFAULT_CALIBRATION_SECONDS = 1.0
+DEFAULT_RING_BUFFER_SECONDS = 10.0
+DEFAULT_PRE_ROLL_SECONDS = 0.2
+# Сколько тишины после речи оставить в команде как контекст для STT
+DEFAULT_KEEP_TRAILING_SECONDS = 0.2
+DEFAULT_MAX_PENDING_COMMANDS = 4
+# Сколько ждать финальный текст потокового STT после конца записи
+DEFAULT_STREAM_FINAL_TIMEOUT = 10.0
+
+# Причины остановки записи
+END_SILENCE = "silence"
+END_MAX_DURATION = "max_duration"
+END_NO_SPEECH = "no_speech"
+
+
+def frame_energies(pcm: Union[bytes, np.ndarray], frame_length: int) -> np.ndarray:
+    """RMS каждого полного кадра из frame_length 16-битных сэмплов (неполный хвост отбрасывается)."""
+    samples = np.frombuffer(pcm, dtype=np.int16) if isinstance(pcm, (bytes, bytearray, memoryview)) else pcm
+    usable = len(samples) // frame_length * frame_length
+    frames = samples[:usable].reshape(-1, frame_length).astype(np.float32)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+class Endpointer:
+    def __init__(self, sample_rate: int, frame_length: int,
+                 silence_seconds: float = DEFAULT_SILENCE_SECONDS,
+                 min_seconds: float = DEFAULT_MIN_SECONDS,
+                 max_seconds: float = DEFAULT_MAX_SECONDS,
+                 no_speech_seconds: float = DEFAULT_NO_SPEECH_SECONDS,
+                 threshold_ratio: float = DEFAULT_THRESHOLD_RATIO,
+                 min_threshold: float = DEFAULT_MIN_THRESHOLD):
+        """
+        Args:
+            sample_rate, frame_length: Параметры потока (у Porcupine: 16000 и 512).
+            silence_seconds: Пауза после речи, после которой запись заканчивается.
+            min_seconds / max_seconds: Границы длительности записи.
+            no_speech_seconds: Сколько ждать начала речи после wake-word.
+            threshold_ratio: Во сколько раз кадр речи громче уровня шума.
+            min_threshold: Минимальный порог речи (RMS 16-битных сэмплов).
+        """
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.frame_seconds = frame_length / sample_rate
+        self.silence_seconds = silence_seconds
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.no_speech_seconds = no_speech_seconds
+        self.threshold_ratio = threshold_ratio
+        self.min_threshold = min_threshold
+        self.noise_floor = 0.0
+        self.reset()
+
+    @property
+    def threshold(self) -> float:
+        return max(self.min_threshold, self.noise_floor * self.threshold_ratio)
+
+    @property
+    def duration(self) -> float:
+        return self._frames * self.frame_seconds
+
+    @property
+    def trailing_silence(self) -> float:
+        return self._silent_frames * self.frame_seconds
+
+    def calibrate(self, pcm: Union[bytes, np.ndarray]) -> float:
+        """
+        Уровень шума по записи тишины: медиана RMS кадров, чтобы случайный
+        щелчок или кашель не завысил порог.
+        """
+        energies = frame_energies(pcm, self.frame_length)
+        if len(energies):
+            self.noise_floor = float(np.median(energies))
+        return self.noise_floor
+
+    def reset(self, ignore_samples: int = 0):
+        """
+        Начало новой записи.
+
+        Args:
+            ignore_samples: Начало записи, громкость которого не учитывается
+                (звуковой сигнал после wake-word): эти кадры остаются в команде,
+                но не считаются ни речью, ни тишиной.
+        """
+        self._frames = 0
+        self._silent_frames = 0
+        self._ignored_frames = -(-ignore_samples // self.frame_length)
+        self.speech_detected = False
+
+    def process(self, frame: Union[bytes, np.ndarray]) -> Optional[str]:
+        """
+        Учитывает очередной кадр записи.
+
+        Returns:
+            str | None: Причина остановки (END_SILENCE, END_MAX_DURATION,
+            END_NO_SPEECH) или None, если запись продолжается.
+        """
+        self._frames += 1
+        if self._ignored_frames > 0:
+            self._ignored_frames -= 1
+            return END_MAX_DURATION if self.duration >= self.max_seconds else None
+
+        samples = np.frombuffer(frame, dtype=np.int16) if isinstance(frame, (bytes, bytearray, memoryview)) else frame
+        samples = samples.astype(np.float32)
+        energy = float(np.sqrt(np.dot(samples, samples) / len(samples))) if len(samples) else 0.0
+
+        if energy >= self.threshold:
+            self.speech_detected = True
+            self._silent_frames = 0
+        else:
+            self._silent_frames += 1
+
+        duration = self.duration
+        if duration >= self.max_seconds:
+            return END_MAX_DURATION
+        if not self.speech_detected:
+            return END_NO_SPEECH if duration >= self.no_speech_seconds else None
+        if duration >= self.min_seconds and self.trailing_silence >= self.silence_seconds:
+            return END_SILENCE
+        return None
+
+    def trim_trailing(self, frames: List[np.ndarray], keep_seconds: float = DEFAULT_KEEP_TRAILING_SECONDS) -> List[np.ndarray]:
+        """
+        Хвост тишины не нужен STT: отрезает последние тихие кадры записи,
+        оставляя от них keep_seconds контекста. frames — кадры, прошедшие через process.
+        """
+        trailing_frames = int(max(0.0, self.trailing_silence - keep_seconds) / self.frame_seconds)
+        return frames[:-trailing_frames] if trailing_frames else frames
+
+
+class RingBuffer:
+    """
+    Кольцевой буфер 16-битных сэмплов фиксированного размера (память выделяется один раз).
+
+    Позиции абсолютные: номер сэмпла с начала записи. Один писатель (поток
+    захвата) и любые читатели, каждый со своей позицией. Если читатель отстал
+    больше чем на емкость буфера, старый звук уже перезаписан: чтение
+    продолжается с самого старого доступного сэмпла, потеря считается в lost_samples.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=np.int16)
+        self._condition = threading.Condition()
+        self.written = 0
+        self.lost_samples = 0
+
+    def write(self, samples: np.ndarray):
+        total = len(samples)
+        # Блок больше буфера: сохранится только его конец
+        samples = samples[-self.capacity:]
+        count = len(samples)
+        with self._condition:
+            start = (self.written + total - count) % self.capacity
+            first = min(count, self.capacity - start)
+            self._buffer[start:start + first] = samples[:first]
+            self._buffer[:count - first] = samples[first:]
+            self.written += total
+            self._condition.notify_all()
+
+    def read(self, position: int, count: int, timeout: Optional[float] = None) -> Tuple[Optional[np.ndarray], int]:
+        """
+        Ждет, пока в буфере появятся count сэмплов начиная с position.
+
+        Returns:
+            (сэмплы или None по таймауту, позиция для следующего чтения).
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.written >= position + count, timeout=timeout):
+                return None, position
+            oldest = self.written - self.capacity
+            if position < oldest:
+                self.lost_samples += oldest - position
+                position = oldest
+            start = position % self.capacity
+            first = min(count, self.capacity - start)
+            samples = np.concatenate([self._buffer[start:start + first], self._buffer[:count - first]])
+        return samples, position + count
+
+
+class CaptureThread(threading.Thread):
+    """Только читает кадры с устройства и складывает их в RingBuffer — больше ничего не блокирует чтение."""
+
+    def __init__(self, read_frame: Callable[[], bytes], ring: RingBuffer):
+        """
+        Args:
+            read_frame: Блокирующее чтение одного кадра (например, stream.read у PyAudio).
+                OSError при переполнении входного буфера устройства учитывается в overflows.
+        """
+        super().__init__(name="mic-capture", daemon=True)
+        self.read_frame = read_frame
+        self.ring = ring
+        self.overflows = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                data = self.read_frame()
+            except OSError:
+                self.overflows += 1
+                continue
+            self.ring.write(np.frombuffer(data, dtype=np.int16))
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        self.join(timeout)
+
+
+class CommandWorker(threading.Thread):
+    """
+    Обрабатывает записанные команды по очереди в фоне (STT и Core API).
+
+    Очередь ограничена: если сервера не успевают, новая команда отбрасывается,
+    а не копится бесконечно.
+    """
+
+    def __init__(self, handler: Callable[[object], None], max_pending: int = DEFAULT_MAX_PENDING_COMMANDS):
+        super().__init__(name="mic-commands", daemon=True)
+        self.handler = handler
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self.processed = 0
+        self.dropped = 0
+
+    def submit(self, command) -> bool:
+        try:
+            self._queue.put_nowait(command)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def run(self):
+        while True:
+            command = self._queue.get()
+            if command is None:
+                break
+            try:
+                self.handler(command)
+            except Exception as e:
+                print(f"MicrophoneListener Error: Ошибка обработки команды: {e}")
+            finally:
+                self.processed += 1
+                self._queue.task_done()
+
+    def join_pending(self):
+        """Дожидается обработки всех команд в очереди."""
+        self._queue.join()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._queue.put(None)
+        self.join(timeout)
+
+
+def pcm_to_wav_bytes(samples: np.ndarray, sample_rate: int) -> bytes:
+    """WAV (16 бит, моно) в памяти — для отправки в STT без временного файла."""
+    return encode_wav(samples, sample_rate)
+
+
+class UploadEncoder:
+    """
+    Кодирует записанную команду для отправки в STT кодеком из настроек
+    (секция audio_transport): Opus в OGG или WAV. Если Opus-кодировщика нет
+    (ни PyAV, ни ffmpeg), один раз предупреждает и дальше шлет WAV.
+    """
+
+    def __init__(self, codec: str = DEFAULT_CODEC, bitrate: int = DEFAULT_OPUS_BITRATE, raw_pcm: bool = False):
+        """
+        Args:
+            raw_pcm: pcm16 отдавать сырыми сэмплами (audio/l16) без WAV-заголовка — для /transcribe/raw.
+        """
+        self.codec = codec
+        self.bitrate = bitrate
+        self.raw_pcm = raw_pcm
+        self.stats = CodecStats()
+
+    @classmethod
+    def from_config(cls, config: dict, raw_pcm: bool = False) -> "UploadEncoder":
+        transport = config.get("audio_transport", {}) or {}
+        return cls(transport.get("codec", DEFAULT_CODEC), int(transport.get("bitrate", DEFAULT_OPUS_BITRATE)), raw_pcm)
+
+    def encode(self, samples: np.ndarray, sample_rate: int) -> Tuple[bytes, str, str]:
+        """Returns (данные, имя файла, MIME-тип) для загрузки."""
+        if self.codec == CODEC_PCM16 and self.raw_pcm:
+            payload = samples.astype("<i2", copy=False).tobytes()
+            self.stats.record("l16", len(payload), len(samples) / sample_rate, 0.0)
+            return payload, "command.pcm", raw_pcm_content_type(sample_rate)
+        started = time.perf_counter()
+        try:
+            payload = encode_audio(samples, sample_rate, self.codec, self.bitrate)
+        except AudioEncodeError as e:
+            if self.codec == CODEC_PCM16:
+                raise
+            print(f"AudioUpload Warning: Кодек {self.codec} недоступен ({e}), отправляю WAV.")
+            self.codec = CODEC_PCM16
+            payload = encode_wav(samples, sample_rate)
+        elapsed = time.perf_counter() - started
+        audio_seconds = len(samples) / sample_rate
+        self.stats.record(self.codec, len(payload), audio_seconds, elapsed)
+        raw_bytes = len(samples) * 2
+        print(f"AudioUpload: Аудио {audio_seconds:.1f} с: {self.codec}, {len(payload)} байт "
+              f"(PCM {raw_bytes}, в {raw_bytes / max(len(payload), 1):.1f} раз меньше), кодирование {elapsed * 1000:.1f} мс.")
+        extension, content_type = UPLOAD_FORMATS[self.codec]
+        return payload, f"command{extension}", content_type
+
+
+class STTUploader:
+    """
+    Отправляет записанную команду в STT через долгоживущий клиент (TCP или
+    Unix-сокет, по transport.mode): сырым телом на /transcribe/raw, если
+    api_endpoints.nox_stt_raw настроен, иначе multipart-формой на /transcribe.
+    """
+
+    def __init__(self, config: dict):
+        endpoints = config.get("api_endpoints", {})
+        self.url = endpoints.get("nox_stt")
+        self.raw_url = endpoints.get("nox_stt_raw")
+        self.encoder = UploadEncoder.from_config(config, raw_pcm=bool(self.raw_url))
+        self.client = make_http_client(config, SERVICE_STT, timeout=60.0)
+
+    def transcribe(self, samples: np.ndarray, sample_rate: int, name: str = "command") -> Optional[str]:
+        """
+        Returns:
+            Распознанный текст ('' — речи нет) или None, если STT вернул ошибку.
+
+        Raises:
+            httpx.HTTPError: Сетевая ошибка.
+        """
+        audio_data, filename, content_type = self.encoder.encode(samples, sample_rate)
+        if self.raw_url:
+            response = self.client.post(self.raw_url, content=audio_data, headers={"Content-Type": content_type})
+        else:
+            files = {"file": (f"{name}_{filename}", audio_data, content_type)}
+            response = self.client.post(self.url, files=files)
+        if response.status_code != 200:
+            print(f"AudioUpload Error: STT Server вернул ошибку: {response.status_code} - {response.text}")
+            return None
+        return response.json().get("text") or ""
+
+    def close(self):
+        self.client.close()
+
+
+class StreamingSTTSession:
+    """
+    Одна команда, которая стримится в /transcribe/stream во время записи.
+
+    Цикл записи только кладет кадры в очередь (send); соединение, отправка и
+    прием событий идут в своих потоках. Каждый частичный текст передается в
+    on_partial(session_id, text); finish() дожидается финального текста.
+    Если потоковый STT недоступен, finish() вернет None — тогда команда
+    отправляется обычной загрузкой (STTUploader).
+    """
+
+    def __init__(self, url: str, on_partial: Callable[[str, str], None], uds_path: Optional[str] = None,
+                 final_timeout: float = DEFAULT_STREAM_FINAL_TIMEOUT):
+        self.url = url
+        self.on_partial = on_partial
+        self.uds_path = uds_path
+        self.final_timeout = final_timeout
+        self.session_id = uuid.uuid4().hex
+        self.text: Optional[str] = None
+        self.error: Optional[str] = None
+        self.partials = 0
+        self._chunks: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self._done = threading.Event()
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._run, name="stt-stream", daemon=True)
+
+    @classmethod
+    def from_config(cls, config: dict, on_partial: Callable[[str, str], None]) -> Optional["StreamingSTTSession"]:
+        """Сессия, если api_endpoints.nox_stt_stream задан и microphone.streaming включен; иначе None."""
+        url = config.get("api_endpoints", {}).get("nox_stt_stream")
+        if not url or not config.get("microphone", {}).get("streaming", False):
+            return None
+        return cls(url, on_partial, uds_path=client_socket_path(config, SERVICE_STT))
+
+    def start(self) -> "StreamingSTTSession":
+        self._thread.start()
+        return self
+
+    def send(self, samples: np.ndarray):
+        """Кадр 16-битного PCM (не блокирует цикл записи)."""
+        self._chunks.put(samples.astype("<i2", copy=False).tobytes())
+
+    def finish(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Конец речи: возвращает финальный текст ('' — речи нет) или None, если поток не сработал."""
+        self._chunks.put(None)
+        if not self._done.wait(self.final_timeout if timeout is None else timeout):
+            self.error = self.error or "нет финального текста"
+            return None
+        return self.text
+
+    def cancel(self):
+        """Команда не нужна (например, речь не услышана): закрываем поток, не дожидаясь финала."""
+        self._cancelled = True
+        self._chunks.put(None)
+
+    def _connect(self):
+        if self.uds_path:
+            return ws_unix_connect(self.uds_path, self.url, open_timeout=5)
+        return ws_connect(self.url, open_timeout=5)
+
+    def _run(self):
+        try:
+            with self._connect() as ws:
+                receiver = threading.Thread(target=self._receive, args=(ws,), name="stt-stream-events", daemon=True)
+                receiver.start()
+                while (chunk := self._chunks.get()) is not None:
+                    if self._done.is_set():
+                        break  # Сервер уже закончил сам (тишина после речи)
+                    ws.send(chunk)
+                if not self._cancelled and not self._done.is_set():
+                    ws.send("end")
+                    receiver.join(self.final_timeout)
+        except (OSError, WebSocketException) as e:
+            if self.text is None and not self._cancelled:
+                self.error = str(e)
+                print(f"AudioStream Warning: Потоковый STT недоступен ({e}), команда уйдет обычной загрузкой.")
+        finally:
+            self._done.set()
+
+    def _receive(self, ws):
+        try:
+            for message in ws:
+                event = json.loads(message)
+                if event.get("type") == "partial" and event.get("text"):
+                    self.partials += 1
+                    try:
+                        self.on_partial(self.session_id, event["text"])
+                    except Exception as e:
+                        print(f"AudioStream Warning: Частичный текст не передан: {e}")
+                elif event.get("type") == "final":
+                    self.text = event.get("text") or ""
+                    break
+                elif event.get("type") == "error":
+                    self.error = event.get("error")
+                    break
+        except (OSError, WebSocketException, ValueError) as e:
+            self.error = self.error or str(e)
+        finally:
+            if self.text is None:
+                self.error = self.error or "поток закрыт без финального текста"
+            self._done.set()
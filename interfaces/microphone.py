@@ -3,12 +3,10 @@ import os
 import sys
 from pathlib import Path
 import logging
-import uuid
-import struct
-import requests
+import time
+import httpx
 import pyaudio
 import pvporcupine
-import wave
 import numpy as np
 
 # --- Явное добавление корня проекта в sys.path ---
@@ -26,10 +24,19 @@ except NameError:
         sys.path.insert(0, str(project_root))
 
 from app.config_loader import load_settings
+from app.service_transport import make_http_client, SERVICE_CORE
+from interfaces.audio_pipeline import (
+    CaptureThread, CommandWorker, Endpointer, RingBuffer, STTUploader, StreamingSTTSession, END_NO_SPEECH,
+    DEFAULT_CALIBRATION_SECONDS, DEFAULT_MAX_PENDING_COMMANDS, DEFAULT_RING_BUFFER_SECONDS,
+)
 
 # --- Глобальные переменные для конфигурации API ---
 NOX_CORE_API_URL = None
+NOX_CORE_PARTIAL_API_URL = None
 NOX_STT_API_URL = None
+# Долгоживущие клиенты (TCP или Unix-сокет): соединения с STT и Core API переиспользуются
+STT_UPLOADER = None
+CORE_CLIENT = None
 
 # --- Настройка логирования ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -45,9 +52,51 @@ def play_beep(p, volume=0.2, frequency=880, duration=0.15):
     stream.stop_stream()
     stream.close()
 
+def send_partial(session_id: str, text: str):
+    """Частичный текст из потокового STT: ядро начинает триаж, пока пользователь договаривает."""
+    CORE_CLIENT.post(NOX_CORE_PARTIAL_API_URL, json={"session_id": session_id, "text": text})
+
+
+def send_command(command: dict):
+    """Выполняется в CommandWorker: распознает записанную команду и передает текст в Nox Core."""
+    try:
+        stream = command.get("stream")
+        recognized_text = stream.finish() if stream else None
+        if recognized_text is None:
+            logger.info("Отправка аудио на STT API...")
+            recognized_text = STT_UPLOADER.transcribe(command["pcm"], command["sample_rate"], name="mic")
+
+        if recognized_text:
+            logger.info(f"Распознанный текст: '{recognized_text}'")
+            payload = {"text": recognized_text, "is_voice": True, "speech_ended_at": command["speech_ended_at"]}
+            if stream:
+                # По этой сессии ядро найдет триаж, начатый по частичным текстам
+                payload["session_id"] = stream.session_id
+            logger.info(f"Отправка запроса на Nox Core API: {payload}")
+
+            # Отправляем команду и просто проверяем, что сервер ее принял
+            core_response = CORE_CLIENT.post(NOX_CORE_API_URL, json=payload)
+            if core_response.status_code == 200:
+                print("\n>>> Команда успешно принята в обработку. Ответ Нокса будет в Telegram.")
+            else:
+                print(f"\n>>> Ошибка от Core API: {core_response.status_code} - {core_response.text}")
+        else:
+            print("\n>>> Не удалось распознать речь в команде.")
+
+    except httpx.HTTPError as e:
+        logger.error(f"MicrophoneListener: Ошибка сети при обращении к API: {e}")
+        print("\n>>> Сетевая ошибка. Не удалось связаться с серверами Нокса.")
+
+
 def run_microphone_listener():
-    """Основная функция, которая слушает wake-word и обрабатывает команды."""
-    global NOX_CORE_API_URL, NOX_STT_API_URL
+    """
+    Основная функция, которая слушает wake-word и обрабатывает команды.
+
+    Звук читает отдельный поток захвата в кольцевой буфер; этот цикл ищет в нем
+    wake-word и записывает команду, а STT и Core API вызываются в CommandWorker,
+    так что во время их обработки микрофон не глохнет и звук не теряется.
+    """
+    global NOX_CORE_API_URL, NOX_CORE_PARTIAL_API_URL, NOX_STT_API_URL, STT_UPLOADER, CORE_CLIENT
     try:
         config = load_settings()
         ACCESS_KEY = config.get("picovoice", {}).get("access_key")
@@ -57,6 +106,14 @@ def run_microphone_listener():
         # Правильный ключ из settings.yaml - 'nox_core_microphone'
         NOX_CORE_API_URL = config.get("api_endpoints", {}).get("nox_core_microphone")
         NOX_STT_API_URL = config.get("api_endpoints", {}).get("nox_stt")
+        NOX_CORE_PARTIAL_API_URL = config.get("api_endpoints", {}).get("nox_core_partial")
+        STT_UPLOADER = STTUploader(config)
+        CORE_CLIENT = make_http_client(config, SERVICE_CORE, timeout=10.0)
+        MICROPHONE_CONFIG = config.get("microphone", {})
+        ENDPOINTING = dict(MICROPHONE_CONFIG.get("endpointing", {}))
+        CALIBRATION_SECONDS = float(ENDPOINTING.pop("calibration_seconds", DEFAULT_CALIBRATION_SECONDS))
+        RING_BUFFER_SECONDS = float(MICROPHONE_CONFIG.get("ring_buffer_seconds", DEFAULT_RING_BUFFER_SECONDS))
+        MAX_PENDING_COMMANDS = int(MICROPHONE_CONFIG.get("max_pending_commands", DEFAULT_MAX_PENDING_COMMANDS))
         
         if not ACCESS_KEY:
             raise ValueError("Picovoice access_key не найден в settings.yaml")
@@ -73,78 +130,91 @@ def run_microphone_listener():
     porcupine = None
     pa = None
     audio_stream = None
+    capture = None
+    worker = None
     try:
         porcupine = pvporcupine.create(access_key=ACCESS_KEY, keyword_paths=[WAKE_WORD_MODEL_PATH])
         pa = pyaudio.PyAudio()
         audio_stream = pa.open(rate=porcupine.sample_rate, channels=1, format=pyaudio.paInt16, input=True, frames_per_buffer=porcupine.frame_length)
+        rate, frame_length = porcupine.sample_rate, porcupine.frame_length
+
+        ring = RingBuffer(int(RING_BUFFER_SECONDS * rate))
+        # Переполнение входного буфера устройства теперь не прячется, а считается в capture.overflows
+        capture = CaptureThread(lambda: audio_stream.read(frame_length, exception_on_overflow=True), ring)
+        capture.start()
+        worker = CommandWorker(send_command, max_pending=MAX_PENDING_COMMANDS)
+        worker.start()
+
+        # Калибровка уровня шума: порог речи для окончания записи считается от него
+        endpointer = Endpointer(rate, frame_length, **ENDPOINTING)
+        calibration, position = ring.read(ring.written, max(frame_length, int(CALIBRATION_SECONDS * rate)))
+        noise_floor = endpointer.calibrate(calibration)
+        logger.info(f"MicrophoneListener: Уровень шума {noise_floor:.0f}, порог речи {endpointer.threshold:.0f}.")
         
         logger.info("\nMicrophoneListener: Нокс слушает... Произнеси 'Hey Nox'.\n")
 
         while True:
-            pcm = audio_stream.read(porcupine.frame_length, exception_on_overflow=False)
-            pcm = struct.unpack_from("h" * porcupine.frame_length, pcm)
+            pcm, position = ring.read(position, frame_length, timeout=1.0)
+            if pcm is None:
+                continue
             if porcupine.process(pcm) >= 0:
                 logger.info("*** Wake-Word 'Hey Nox' ОБНАРУЖЕНО! ***")
+                # Захват идет в своем потоке: пока звучит сигнал, буфер продолжает наполняться
                 play_beep(pa)
                 
-                RECORD_SECONDS = 5
-                logger.info(f"Начинаю запись команды ({RECORD_SECONDS} секунд)... Говори!")
+                logger.info(f"Начинаю запись команды (до {endpointer.max_seconds:.0f} секунд)... Говори!")
+                # Запись идет с момента срабатывания: все, что сказано сразу за wake-word и во
+                # время сигнала, уже лежит в буфере и попадет в команду. Сам сигнал (плюс кадр на
+                # задержку вывода) Endpointer не считает речью, иначе END_NO_SPEECH не сработал бы.
+                endpointer.reset(ignore_samples=ring.written - position + frame_length)
                 frames = []
-                for _ in range(0, int(porcupine.sample_rate / porcupine.frame_length * RECORD_SECONDS)):
-                    data = audio_stream.read(porcupine.frame_length, exception_on_overflow=False)
-                    frames.append(data)
-                logger.info("...Запись окончена.")
-                
-                temp_dir = Path(project_root) / "temp_audio_mic"
-                temp_dir.mkdir(parents=True, exist_ok=True)
-                wave_output_path = temp_dir / f"{uuid.uuid4()}_mic_command.wav"
-                
-                with wave.open(str(wave_output_path), 'wb') as wf:
-                    wf.setnchannels(1)
-                    wf.setsampwidth(pa.get_sample_size(pyaudio.paInt16))
-                    wf.setframerate(porcupine.sample_rate)
-                    wf.writeframes(b''.join(frames))
-                
-                try:
-                    logger.info("Отправка аудио на STT API...")
-                    recognized_text = None
-                    with open(wave_output_path, "rb") as audio_file:
-                        files = {"file": (wave_output_path.name, audio_file)}
-                        stt_response = requests.post(NOX_STT_API_URL, files=files, timeout=60)
-                        if stt_response.status_code == 200:
-                            recognized_text = stt_response.json().get("text")
-                        else:
-                             logger.error(f"STT Server вернул ошибку: {stt_response.status_code} - {stt_response.text}")
-
-                    if recognized_text:
-                        logger.info(f"Распознанный текст: '{recognized_text}'")
-                        payload = {"text": recognized_text, "is_voice": True} 
-                        logger.info(f"Отправка запроса на Nox Core API: {payload}")
-                        
-                        # --- ИСПРАВЛЕНИЕ ЛОГИКИ ОТВЕТА ---
-                        # Отправляем команду и просто проверяем, что сервер ее принял
-                        core_response = requests.post(NOX_CORE_API_URL, json=payload, timeout=10)
-                        if core_response.status_code == 200:
-                            print("\n>>> Команда успешно принята в обработку. Ответ Нокса будет в Telegram.")
-                        else:
-                            print(f"\n>>> Ошибка от Core API: {core_response.status_code} - {core_response.text}")
-                            
-                    else:
-                        print("\n>>> Не удалось распознать речь в команде.")
-
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"MicrophoneListener: Ошибка сети при обращении к API: {e}")
-                    print("\n>>> Сетевая ошибка. Не удалось связаться с серверами Нокса.")
-                finally:
-                    # Удаляем временный файл
-                    if os.path.exists(wave_output_path): 
-                        os.remove(wave_output_path)
+                # С microphone.streaming команда идет в потоковый STT уже во время записи
+                stream = StreamingSTTSession.from_config(config, send_partial) if NOX_CORE_PARTIAL_API_URL else None
+                if stream:
+                    stream.start()
+                end_reason = None
+                while end_reason is None:
+                    pcm, position = ring.read(position, frame_length, timeout=1.0)
+                    if pcm is None:
+                        continue
+                    frames.append(pcm)
+                    if stream:
+                        stream.send(pcm)
+                    end_reason = endpointer.process(pcm)
+                # Момент конца речи: отставание чтения от захвата плюс хвост тишины
+                speech_ended_at = time.time() - (ring.written - position) / rate - endpointer.trailing_silence
+                logger.info(f"...Запись окончена ({end_reason}, {endpointer.duration:.1f} с).")
+
+                if end_reason == END_NO_SPEECH:
+                    if stream:
+                        stream.cancel()
+                    print("\n>>> Речь после wake-word не услышана.")
+                    print("\nСнова слушаю wake-word...")
+                    continue
+                frames = endpointer.trim_trailing(frames)
+
+                command = {"pcm": np.concatenate(frames), "sample_rate": rate, "speech_ended_at": speech_ended_at,
+                           "stream": stream}
+                if not worker.submit(command):
+                    logger.error("MicrophoneListener: Очередь команд переполнена, команда отброшена.")
+                    if stream:
+                        stream.cancel()
                 
                 print("\nСнова слушаю wake-word...")
     except KeyboardInterrupt:
         logger.info("Получен сигнал остановки. Завершение работы...")
     finally:
         # Корректное освобождение ресурсов
+        if capture:
+            capture.stop(timeout=1.0)
+            logger.info(f"MicrophoneListener: переполнений входного буфера: {capture.overflows}, "
+                        f"потеряно в кольцевом буфере: {ring.lost_samples} сэмплов.")
+        if worker:
+            worker.stop(timeout=5.0)
+        if STT_UPLOADER:
+            STT_UPLOADER.close()
+        if CORE_CLIENT:
+            CORE_CLIENT.close()
         if porcupine: 
             porcupine.delete()
         if audio_stream:
@@ -157,4 +227,3 @@ def run_microphone_listener():
 
 if __name__ == "__main__":
     run_microphone_listener()
-
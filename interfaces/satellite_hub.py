@@ -0,0 +1,408 @@
+# interfaces/satellite_hub.py
+"""
+Хаб сателлитов: один процесс слушает микрофоны всех комнат.
+
+Сателлит (Raspberry Pi Zero с микрофоном, см. satellite_replay.py как пример)
+открывает TCP-соединение и шлет одну строку JSON-заголовка, затем сырой
+PCM (16 бит, моно, 16 кГц):
+
+    {"room": "kitchen", "sample_rate": 16000}\\n<PCM...>
+
+С "framing": true в заголовке дальше идут кадры app.audio_framing — так по
+Wi-Fi можно слать пакеты Opus вместо сырого PCM.
+
+Хаб ведет для каждого потока свой экземпляр wake-word (Porcupine хранит
+состояние потока), но все потоки обрабатываются в одном процессе и одном
+event loop: без отдельного слушателя, загрузки конфигурации и HTTP-клиентов
+на каждую комнату. После wake-word запись команды заканчивается по тишине
+(Endpointer), команда уходит в STT и затем в Nox Core вместе с комнатой.
+
+Если фразу услышали несколько соседних комнат, срабатывания в пределах
+dedupe_window_seconds считаются одним: команду отправляет только комната, где
+wake-word прозвучал громче всего относительно ее собственного шума.
+
+В ответ сателлит получает строки JSON-событий: ready, wake, command,
+duplicate, no_speech, error.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+# --- Явное добавление корня проекта в sys.path ---
+project_root = Path(__file__).resolve().parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from app.config_loader import load_settings
+from app.audio_framing import FramedAudioDecoder
+from app.service_transport import make_http_client, SERVICE_CORE
+from interfaces.audio_pipeline import (
+    CommandWorker, Endpointer, STTUploader, frame_energies, END_NO_SPEECH,
+    DEFAULT_CALIBRATION_SECONDS, DEFAULT_MAX_PENDING_COMMANDS, DEFAULT_PRE_ROLL_SECONDS,
+)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_DEDUPE_WINDOW_SECONDS = 0.5
+# Сколько последних секунд звука до срабатывания оценивают громкость wake-word
+WAKE_SCORE_SECONDS = 0.5
+HEADER_TIMEOUT_SECONDS = 5.0
+TRIGGER_HISTORY_SIZE = 32
+
+
+class TriggerArbiter:
+    """
+    Склеивает срабатывания wake-word из разных комнат, случившиеся почти
+    одновременно, в одну группу; победитель группы — комната с наибольшей оценкой.
+    """
+
+    def __init__(self, window_seconds: float = DEFAULT_DEDUPE_WINDOW_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self._groups: "OrderedDict[int, Dict[str, float]]" = OrderedDict()
+        self._current: Optional[int] = None
+        self._current_started = 0.0
+        self._next_id = 0
+
+    def claim(self, room: str, score: float) -> int:
+        """Регистрирует срабатывание; возвращает id группы."""
+        now = self.clock()
+        if self._current is None or now - self._current_started > self.window_seconds:
+            self._current, self._current_started = self._next_id, now
+            self._next_id += 1
+            self._groups[self._current] = {}
+            while len(self._groups) > TRIGGER_HISTORY_SIZE:
+                self._groups.popitem(last=False)
+        claims = self._groups[self._current]
+        claims[room] = max(score, claims.get(room, score))
+        return self._current
+
+    def is_winner(self, room: str, group_id: int) -> bool:
+        claims = self._groups.get(group_id)
+        if not claims:
+            return True
+        return max(claims, key=claims.get) == room
+
+
+class SatelliteSession:
+    """
+    Состояние одного потока: wake-word, калибровка шума, запись команды.
+
+    feed() синхронный и ничего не ждет — его можно гонять в тестах без сети.
+    """
+
+    def __init__(self, room: str, detector, endpointing: Optional[dict] = None,
+                 pre_roll_seconds: float = DEFAULT_PRE_ROLL_SECONDS):
+        """
+        Args:
+            detector: Wake-word детектор с интерфейсом Porcupine:
+                frame_length, sample_rate, process(frame) -> int (>= 0 — срабатывание), delete().
+            endpointing: Параметры Endpointer (секция microphone.endpointing).
+        """
+        endpointing = dict(endpointing or {})
+        calibration_seconds = float(endpointing.pop("calibration_seconds", DEFAULT_CALIBRATION_SECONDS))
+        self.room = room
+        self.detector = detector
+        self.frame_length = detector.frame_length
+        self.sample_rate = detector.sample_rate
+        self.endpointer = Endpointer(self.sample_rate, self.frame_length, **endpointing)
+        frame_seconds = self.frame_length / self.sample_rate
+        self._calibration_frames = max(1, int(calibration_seconds / frame_seconds))
+        self._calibration: List[np.ndarray] = []
+        self._pre_roll = deque(maxlen=int(pre_roll_seconds / frame_seconds))
+        self._recent_energy = deque(maxlen=max(1, int(WAKE_SCORE_SECONDS / frame_seconds)))
+        self._pending = b""
+        self.recording: Optional[List[np.ndarray]] = None
+        self.trigger_group: Optional[int] = None
+        self.triggers = 0
+
+    @property
+    def calibrated(self) -> bool:
+        return self._calibration is None
+
+    def feed(self, data: bytes) -> List[dict]:
+        """
+        Принимает очередной кусок PCM.
+
+        Returns:
+            События: {"type": "wake", "score"}, {"type": "command", "pcm", "reason",
+            "speech_ended_at"}, {"type": "no_speech"}.
+        """
+        data = self._pending + data
+        frame_bytes = self.frame_length * 2
+        usable = len(data) // frame_bytes * frame_bytes
+        self._pending = data[usable:]
+        if not usable:
+            return []
+        samples = np.frombuffer(data[:usable], dtype=np.int16)
+        # Энергия всех кадров куска одним вызовом
+        energies = frame_energies(samples, self.frame_length)
+        frames = samples.reshape(-1, self.frame_length)
+
+        events = []
+        for frame, energy in zip(frames, energies):
+            if self._calibration is not None:
+                self._calibration.append(frame)
+                if len(self._calibration) >= self._calibration_frames:
+                    self.endpointer.calibrate(np.concatenate(self._calibration))
+                    self._calibration = None
+            if self.recording is not None:
+                event = self._record(frame)
+                if event:
+                    events.append(event)
+                continue
+            self._recent_energy.append(energy)
+            if self.detector.process(frame) >= 0:
+                events.append(self._start_recording())
+            else:
+                self._pre_roll.append(frame)
+        return events
+
+    def finish(self) -> Optional[dict]:
+        """Поток закрыт: недописанная команда отправляется как есть."""
+        if self.recording is None or not self.endpointer.speech_detected:
+            self.recording = None
+            return None
+        return self._complete("stream_closed")
+
+    def close(self):
+        self.detector.delete()
+
+    def _start_recording(self) -> dict:
+        self.triggers += 1
+        self.recording = list(self._pre_roll)
+        self._pre_roll.clear()
+        self.endpointer.reset()
+        noise_floor = max(self.endpointer.noise_floor, 1.0)
+        # Оценка близости к говорящему: громкость wake-word относительно шума этой комнаты
+        score = float(np.mean(self._recent_energy)) / noise_floor if self._recent_energy else 0.0
+        self._recent_energy.clear()
+        return {"type": "wake", "score": score}
+
+    def _record(self, frame: np.ndarray) -> Optional[dict]:
+        self.recording.append(frame)
+        reason = self.endpointer.process(frame)
+        if reason is None:
+            return None
+        if reason == END_NO_SPEECH:
+            self.recording = None
+            return {"type": "no_speech"}
+        return self._complete(reason)
+
+    def _complete(self, reason: str) -> dict:
+        frames = self.endpointer.trim_trailing(self.recording)
+        self.recording = None
+        return {
+            "type": "command",
+            "pcm": np.concatenate(frames),
+            "reason": reason,
+            "speech_ended_at": time.time() - self.endpointer.trailing_silence,
+        }
+
+
+class SatelliteHub:
+    def __init__(self, detector_factory: Callable[[], object], submit: Callable[[dict], None],
+                 endpointing: Optional[dict] = None,
+                 dedupe_window_seconds: float = DEFAULT_DEDUPE_WINDOW_SECONDS,
+                 pre_roll_seconds: float = DEFAULT_PRE_ROLL_SECONDS,
+                 max_pending_commands: int = DEFAULT_MAX_PENDING_COMMANDS):
+        """
+        Args:
+            detector_factory: Создает wake-word детектор для нового потока (например, pvporcupine.create).
+            submit: Обработка команды {'room', 'pcm', 'sample_rate', 'speech_ended_at'} — вызывается в фоновом потоке.
+        """
+        self.detector_factory = detector_factory
+        self.endpointing = endpointing or {}
+        self.pre_roll_seconds = pre_roll_seconds
+        self.arbiter = TriggerArbiter(dedupe_window_seconds)
+        self.worker = CommandWorker(submit, max_pending=max_pending_commands)
+        self.sessions: Dict[str, SatelliteSession] = {}
+        self.commands = 0
+        self.duplicates = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.worker.start()
+        self._server = await asyncio.start_server(self.handle_connection, host, port)
+        sockets = ", ".join(str(sock.getsockname()) for sock in self._server.sockets)
+        print(f"SatelliteHub: Слушаю сателлиты на {sockets}.")
+        return self._server
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        await asyncio.to_thread(self.worker.stop, 5.0)
+
+    def stats(self) -> dict:
+        return {
+            "satellites": sorted(self.sessions),
+            "triggers": sum(session.triggers for session in self.sessions.values()),
+            "commands": self.commands,
+            "duplicates": self.duplicates,
+            "dropped": self.worker.dropped,
+        }
+
+    def open_session(self, header: dict) -> SatelliteSession:
+        room = str(header.get("room") or "").strip()
+        if not room:
+            raise ValueError("в заголовке нет 'room'")
+        if room in self.sessions:
+            raise ValueError(f"сателлит комнаты '{room}' уже подключен")
+        detector = self.detector_factory()
+        sample_rate = int(header.get("sample_rate", detector.sample_rate))
+        if sample_rate != detector.sample_rate:
+            detector.delete()
+            raise ValueError(f"нужна частота {detector.sample_rate} Гц, получено {sample_rate}")
+        session = SatelliteSession(room, detector, self.endpointing, self.pre_roll_seconds)
+        self.sessions[room] = session
+        return session
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            header = json.loads(await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT_SECONDS))
+            session = self.open_session(header)
+        except (ValueError, TypeError, AttributeError, asyncio.TimeoutError) as e:
+            print(f"SatelliteHub Warning: Отклонено подключение: {e}")
+            await self._send(writer, {"event": "error", "message": str(e)})
+            writer.close()
+            return
+
+        print(f"SatelliteHub: Подключен сателлит '{session.room}'.")
+        await self._send(writer, {"event": "ready", "frame_length": session.frame_length,
+                                  "sample_rate": session.sample_rate})
+        decoder = FramedAudioDecoder(session.sample_rate) if header.get("framing") else None
+        try:
+            while decoder is None or not decoder.ended:
+                data = await reader.read(session.frame_length * 2 * 8)
+                if not data:
+                    break
+                if decoder is not None:
+                    # Декодирование Opus блокирующее, но пакеты по 20 мс: дешевле, чем уход в поток
+                    data = decoder.feed(data)
+                for event in session.feed(data):
+                    await self._send(writer, self._handle_event(session, event))
+            event = session.finish()
+            if event:
+                await self._send(writer, self._handle_event(session, event))
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            print(f"SatelliteHub Warning: Сателлит '{session.room}' отключился: {e}")
+        except ValueError as e:  # AudioDecodeError: битый кадр или пакет
+            print(f"SatelliteHub Warning: Битый аудиопоток от '{session.room}': {e}")
+            await self._send(writer, {"event": "error", "message": str(e)})
+        finally:
+            if decoder is not None and decoder.codecs:
+                print(f"SatelliteHub: '{session.room}': получено {decoder.bytes_in} байт "
+                      f"({'+'.join(sorted(decoder.codecs))}), декодирование {decoder.decode_seconds * 1000:.1f} мс.")
+            self.sessions.pop(session.room, None)
+            session.close()
+            writer.close()
+            print(f"SatelliteHub: Сателлит '{session.room}' отключен.")
+
+    def _handle_event(self, session: SatelliteSession, event: dict) -> dict:
+        if event["type"] == "wake":
+            session.trigger_group = self.arbiter.claim(session.room, event["score"])
+            print(f"SatelliteHub: Wake-word в комнате '{session.room}' (оценка {event['score']:.1f}).")
+            return {"event": "wake"}
+        if event["type"] == "command":
+            if not self.arbiter.is_winner(session.room, session.trigger_group):
+                self.duplicates += 1
+                print(f"SatelliteHub: Команда из '{session.room}' отброшена: ее лучше услышали в другой комнате.")
+                return {"event": "duplicate"}
+            command = {"room": session.room, "pcm": event["pcm"], "sample_rate": session.sample_rate,
+                       "speech_ended_at": event["speech_ended_at"]}
+            accepted = self.worker.submit(command)
+            if accepted:
+                self.commands += 1
+            else:
+                print("SatelliteHub Error: Очередь команд переполнена, команда отброшена.")
+            return {"event": "command", "accepted": accepted, "reason": event["reason"],
+                    "seconds": round(len(event["pcm"]) / session.sample_rate, 2)}
+        return {"event": event["type"]}
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, message: dict):
+        try:
+            writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def make_http_submitter(config: dict) -> Callable[[dict], None]:
+    """Отправка команды: аудио из памяти (кодек audio_transport) в STT, текст с комнатой — в Nox Core."""
+    uploader = STTUploader(config)
+    core_client = make_http_client(config, SERVICE_CORE, timeout=10.0)
+    core_url = config.get("api_endpoints", {}).get("nox_core_microphone")
+
+    def submit(command: dict):
+        try:
+            text = uploader.transcribe(command["pcm"], command["sample_rate"], name=command["room"])
+            if text is None:
+                return
+            if not text:
+                print(f"SatelliteHub: В команде из '{command['room']}' речь не распознана.")
+                return
+            print(f"SatelliteHub: '{command['room']}': '{text}'")
+            payload = {"text": text, "is_voice": True, "room": command["room"],
+                       "speech_ended_at": command["speech_ended_at"]}
+            core_response = core_client.post(core_url, json=payload)
+            if core_response.status_code != 200:
+                print(f"SatelliteHub Error: Ошибка от Core API: {core_response.status_code} - {core_response.text}")
+        except httpx.HTTPError as e:
+            print(f"SatelliteHub Error: Ошибка сети при обращении к API: {e}")
+
+    return submit
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Хаб сателлитов: wake-word и команды из нескольких комнат.")
+    parser.add_argument("--host", help="Адрес (по умолчанию из satellite_hub.host)")
+    parser.add_argument("--port", type=int, help="Порт (по умолчанию из satellite_hub.port)")
+    args = parser.parse_args(argv)
+
+    config = load_settings()
+    hub_config = config.get("satellite_hub", {})
+    access_key = config.get("picovoice", {}).get("access_key")
+    keyword_path = str(project_root / "configs" / "Hey-Nox_linux.ppn")
+    if not access_key or not os.path.exists(keyword_path):
+        print("SatelliteHub CRITICAL: Нужны picovoice.access_key и модель wake-word configs/Hey-Nox_linux.ppn.")
+        return
+
+    import pvporcupine
+
+    hub = SatelliteHub(
+        detector_factory=lambda: pvporcupine.create(access_key=access_key, keyword_paths=[keyword_path]),
+        submit=make_http_submitter(config),
+        endpointing=config.get("microphone", {}).get("endpointing", {}),
+        dedupe_window_seconds=float(hub_config.get("dedupe_window_seconds", DEFAULT_DEDUPE_WINDOW_SECONDS)),
+        pre_roll_seconds=float(hub_config.get("pre_roll_seconds", DEFAULT_PRE_ROLL_SECONDS)),
+        max_pending_commands=int(hub_config.get("max_pending_commands", DEFAULT_MAX_PENDING_COMMANDS)),
+    )
+
+    async def serve():
+        server = await hub.start(args.host or hub_config.get("host", DEFAULT_HOST),
+                                 args.port or int(hub_config.get("port", DEFAULT_PORT)))
+        try:
+            await server.serve_forever()
+        finally:
+            await hub.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("SatelliteHub: Остановлен.")
+
+
+if __name__ == "__main__":
+    main()
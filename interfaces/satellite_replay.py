@@ -0,0 +1,104 @@
+# interfaces/satellite_replay.py
+"""
+Сателлит-заглушка: вместо микрофона проигрывает WAV-файлы в хаб.
+
+Нужен для тестов и отладки хаба без железа. Файлы приводятся к 16 кГц моно
+(app.audio_io), режутся на кадры и отправляются в темпе реального времени
+(или быстрее, --speed). События хаба печатаются и возвращаются списком.
+С --codec поток идет кадрами app.audio_framing (pcm16 или opus), в конце
+печатается, сколько байт ушло по сети и сколько заняло кодирование.
+
+    python interfaces/satellite_replay.py --room kitchen --codec opus command.wav
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# --- Явное добавление корня проекта в sys.path ---
+project_root = Path(__file__).resolve().parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from app.audio_framing import FramedAudioEncoder
+from app.audio_io import SAMPLE_RATE, CODECS, DEFAULT_OPUS_BITRATE, decode_audio
+from interfaces.satellite_hub import DEFAULT_HOST, DEFAULT_PORT
+
+CHUNK_SECONDS = 0.032
+# Тишина после последнего файла, чтобы хаб успел закончить запись по паузе
+DEFAULT_TAIL_SECONDS = 1.5
+
+
+def load_pcm(paths: Sequence[Path]) -> np.ndarray:
+    """WAV-файлы подряд как один поток 16-битного PCM."""
+    parts = [decode_audio(Path(path).read_bytes(), Path(path).name) for path in paths]
+    audio = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+
+
+async def replay(pcm: np.ndarray, room: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 speed: float = 1.0, tail_seconds: float = DEFAULT_TAIL_SECONDS,
+                 codec: Optional[str] = None, bitrate: int = DEFAULT_OPUS_BITRATE) -> List[dict]:
+    """
+    Отправляет поток в хаб.
+
+    Args:
+        speed: Во сколько раз быстрее реального времени (0 — без пауз).
+        codec: None — сырой PCM; pcm16 / opus — кадрированный поток.
+    """
+    encoder = FramedAudioEncoder(codec, SAMPLE_RATE, bitrate) if codec else None
+    reader, writer = await asyncio.open_connection(host, port)
+    events: List[dict] = []
+
+    async def read_events():
+        while line := await reader.readline():
+            event = json.loads(line)
+            print(f"SatelliteReplay [{room}]: {event}")
+            events.append(event)
+
+    events_task = asyncio.create_task(read_events())
+    header = {"room": room, "sample_rate": SAMPLE_RATE}
+    if encoder is not None:
+        header["framing"] = True
+    writer.write(json.dumps(header).encode("utf-8") + b"\n")
+    stream = np.concatenate([pcm, np.zeros(int(tail_seconds * SAMPLE_RATE), dtype="<i2")])
+    chunk = int(CHUNK_SECONDS * SAMPLE_RATE)
+    for start in range(0, len(stream), chunk):
+        samples = stream[start:start + chunk]
+        writer.write(encoder.encode(samples) if encoder is not None else samples.tobytes())
+        await writer.drain()
+        if speed > 0:
+            await asyncio.sleep(CHUNK_SECONDS / speed)
+        if events_task.done():
+            break  # Хаб закрыл соединение (например, отклонил заголовок)
+    if encoder is not None and not events_task.done():
+        writer.write(encoder.end())
+        print(f"SatelliteReplay [{room}]: {codec}: отправлено {encoder.bytes_out} байт вместо {encoder.bytes_in} "
+              f"(PCM), кодирование {encoder.encode_seconds * 1000:.1f} мс.")
+    if writer.can_write_eof():
+        writer.write_eof()
+    await events_task
+    writer.close()
+    return events
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проигрывает WAV-файлы в хаб сателлитов.")
+    parser.add_argument("wav", nargs="+", type=Path)
+    parser.add_argument("--room", required=True)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--speed", type=float, default=1.0, help="Темп относительно реального времени (0 - без пауз)")
+    parser.add_argument("--codec", choices=CODECS, help="Кадрированный поток в этом кодеке (по умолчанию сырой PCM)")
+    parser.add_argument("--bitrate", type=int, default=DEFAULT_OPUS_BITRATE)
+    args = parser.parse_args(argv)
+    return asyncio.run(replay(load_pcm(args.wav), args.room, args.host, args.port, args.speed,
+                              codec=args.codec, bitrate=args.bitrate))
+
+
+if __name__ == "__main__":
+    main()
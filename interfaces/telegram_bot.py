@@ -1,10 +1,20 @@
 # interfaces/telegram_bot.py
-import os
+"""
+Telegram-бот Нокса: текст и голосовые сообщения уходят в Nox Core API.
+
+Бот целиком асинхронный: с Core и STT он говорит через два долгоживущих
+httpx.AsyncClient с пулом соединений (создаются в post_init, по одному на
+сервис, чтобы работал и transport.mode: uds), голосовые скачиваются в память
+и уходят в STT без временных файлов. Одновременно обрабатывается не больше
+telegram_bot.max_concurrent_updates сообщений (concurrent_updates приложения).
+
+С telegram_bot.mode: webhook бот не нужен: обновления принимает сам api_server
+(app/telegram_webhook.py).
+"""
 import sys
 from pathlib import Path
 import logging
-import uuid
-import requests
+from typing import Optional
 import httpx
 from telegram.ext import Application, MessageHandler, filters, ContextTypes
 from telegram import Update
@@ -23,11 +33,17 @@ except NameError:
         sys.path.insert(0, str(project_root))
 
 from app.config_loader import load_settings
+from app.service_transport import make_async_http_client, SERVICE_CORE, SERVICE_STT
+from app.telegram_webhook import transcribe_voice_note, telegram_mode, TELEGRAM_MODE_WEBHOOK
 
 # --- Конфигурация ---
 NOX_CORE_API_URL = None
 NOX_STT_API_URL = None
-TEMP_AUDIO_DIR = os.path.join(project_root, "temp_audio")
+NOX_STT_RAW_API_URL = None
+DEFAULT_MAX_CONCURRENT_UPDATES = 8
+# Core отвечает, когда команда обработана целиком (включая Ollama)
+CORE_TIMEOUT_SECONDS = 130.0
+STT_TIMEOUT_SECONDS = 60.0
 
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -44,6 +60,12 @@ def _get_history_for_nox(user_text: str) -> list:
     return [{"role": "user", "content": user_text}]
 
 
+async def transcribe_voice(stt_client: httpx.AsyncClient, audio_data: bytes,
+                           content_type: Optional[str] = None) -> Optional[str]:
+    """Голосовое из памяти в STT (см. app.telegram_webhook.transcribe_voice_note): текст, '' или None."""
+    return await transcribe_voice_note(stt_client, audio_data, content_type, NOX_STT_API_URL, NOX_STT_RAW_API_URL)
+
+
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.message.from_user.id
     allowed_user_ids = context.bot_data.get("allowed_user_ids", [])
@@ -56,75 +78,96 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     history = _get_history_for_nox(user_text)
     payload = {"history": history, "chat_id": chat_id, "is_voice": False}
-    
+
     try:
         logger.info(f"Telegram_Bot: Отправка ASYNC запроса на Nox Core API: {payload}")
-        async with httpx.AsyncClient() as client:
-            # Увеличим таймаут, чтобы дождаться ответа от Ollama
-            await client.post(NOX_CORE_API_URL, json=payload, timeout=130.0) 
-    except httpx.RequestError as e:
+        await context.bot_data["core_client"].post(NOX_CORE_API_URL, json=payload)
+    except httpx.HTTPError as e:
         logger.error(f"Telegram_Bot: Ошибка сети (httpx) при обращении к Nox Core API: {e}")
         await update.message.reply_text("Прости, Искра, я не могу связаться со своим 'мозгом'.")
 
 
 async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Эта функция остается без изменений, но будет использовать новую _get_history_for_nox
     user_id = update.message.from_user.id
     chat_id = update.message.chat_id
     allowed_user_ids = context.bot_data.get("allowed_user_ids", [])
     if allowed_user_ids and user_id not in allowed_user_ids:
         return
-        
+
     logger.info(f"Telegram_Bot: Получено ГОЛОСОВОЕ сообщение от chat_id: {chat_id}")
     voice = update.message.voice
     if not voice: return
 
-    downloaded_file_path = None
     try:
-        ogg_file = await context.bot.get_file(voice.file_id)
-        unique_filename = f"{user_id}_{uuid.uuid4()}.ogg"
-        downloaded_file_path = str(Path(TEMP_AUDIO_DIR) / unique_filename)
-        await ogg_file.download_to_drive(custom_path=downloaded_file_path)
-        
-        logger.info(f"Telegram_Bot: Отправка аудиофайла на STT API...")
-        recognized_text = None
-        with open(downloaded_file_path, "rb") as audio_file:
-            files = {"file": (os.path.basename(downloaded_file_path), audio_file)}
-            stt_response = requests.post(NOX_STT_API_URL, files=files, timeout=60)
-            
-            if stt_response.status_code == 200:
-                recognized_text = stt_response.json().get("text")
-            else:
-                logger.error(f"STT Server вернул ошибку: {stt_response.status_code} - {stt_response.text}")
-                await update.message.reply_text("Прости, мое 'ухо' сейчас барахлит.")
-
-        if recognized_text:
+        # Голосовое скачивается в память: ни temp_audio/, ни записи на диск
+        voice_file = await context.bot.get_file(voice.file_id)
+        audio_data = bytes(await voice_file.download_as_bytearray())
+
+        logger.info(f"Telegram_Bot: Отправка голосового ({len(audio_data)} байт) на STT API...")
+        recognized_text = await transcribe_voice(context.bot_data["stt_client"], audio_data, voice.mime_type)
+        if recognized_text is None:
+            await update.message.reply_text("Прости, мое 'ухо' сейчас барахлит.")
+        elif recognized_text:
             logger.info(f"Распознанный текст: '{recognized_text}'")
             history = _get_history_for_nox(recognized_text)
             payload = {"history": history, "chat_id": chat_id, "is_voice": True}
-            
+
             logger.info(f"Telegram_Bot: Отправка ASYNC запроса на Nox Core API: {payload}")
-            async with httpx.AsyncClient() as client:
-                await client.post(NOX_CORE_API_URL, json=payload, timeout=130.0)
-        elif stt_response.status_code == 200:
-             await update.message.reply_text("Прости, Искра, я не смог разобрать твое голосовое сообщение.")
+            await context.bot_data["core_client"].post(NOX_CORE_API_URL, json=payload)
+        else:
+            await update.message.reply_text("Прости, Искра, я не смог разобрать твое голосовое сообщение.")
 
     except Exception as e:
         logger.error(f"Ошибка при обработке голосового сообщения: {e}")
         await update.message.reply_text("Ой, что-то пошло не так при обработке твоего голоса.")
-    finally:
-        if downloaded_file_path and os.path.exists(downloaded_file_path):
-            os.remove(downloaded_file_path)
+
+
+def build_application(config: dict) -> Application:
+    """
+    Приложение бота: обработчики, лимит одновременно обрабатываемых сообщений
+    и общие HTTP-клиенты к Core и STT (открываются в post_init, закрываются в post_shutdown).
+    """
+    bot_config = config.get("telegram_bot", {})
+    max_concurrent = int(bot_config.get("max_concurrent_updates", DEFAULT_MAX_CONCURRENT_UPDATES))
+    # Пул соединений не больше, чем сообщений в работе
+    limits = httpx.Limits(max_connections=max_concurrent, max_keepalive_connections=max_concurrent)
+
+    async def open_clients(application: Application):
+        application.bot_data["core_client"] = make_async_http_client(
+            config, SERVICE_CORE, timeout=CORE_TIMEOUT_SECONDS, limits=limits)
+        application.bot_data["stt_client"] = make_async_http_client(
+            config, SERVICE_STT, timeout=STT_TIMEOUT_SECONDS, limits=limits)
+
+    async def close_clients(application: Application):
+        for key in ("core_client", "stt_client"):
+            client = application.bot_data.pop(key, None)
+            if client is not None:
+                await client.aclose()
+
+    application = (
+        Application.builder()
+        .token(bot_config.get("token"))
+        .concurrent_updates(max_concurrent)
+        .post_init(open_clients)
+        .post_shutdown(close_clients)
+        .build()
+    )
+    application.bot_data["allowed_user_ids"] = bot_config.get("allowed_user_ids", [])
+
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    application.add_handler(MessageHandler(filters.VOICE, handle_voice_message))
+    return application
 
 
 def main() -> None:
-    global NOX_CORE_API_URL, NOX_STT_API_URL
+    global NOX_CORE_API_URL, NOX_STT_API_URL, NOX_STT_RAW_API_URL
     try:
         config = load_settings()
         TELEGRAM_TOKEN = config.get("telegram_bot", {}).get("token")
-        ALLOWED_USER_IDS = config.get("telegram_bot", {}).get("allowed_user_ids", [])
-        NOX_CORE_API_URL = config.get("api_endpoints", {}).get("nox_core")
-        NOX_STT_API_URL = config.get("api_endpoints", {}).get("nox_stt")
+        endpoints = config.get("api_endpoints", {})
+        NOX_CORE_API_URL = endpoints.get("nox_core_telegram") or endpoints.get("nox_core")
+        NOX_STT_API_URL = endpoints.get("nox_stt")
+        NOX_STT_RAW_API_URL = endpoints.get("nox_stt_raw")
         if not TELEGRAM_TOKEN or "YOUR_TELEGRAM_BOT_TOKEN" in TELEGRAM_TOKEN:
             raise ValueError("Telegram bot token не найден или не изменен в settings.yaml")
         if not NOX_CORE_API_URL or not NOX_STT_API_URL:
@@ -133,13 +176,12 @@ def main() -> None:
         logging.critical(f"Telegram_Bot: Не удалось загрузить конфигурацию: {e}")
         return
 
-    Path(TEMP_AUDIO_DIR).mkdir(parents=True, exist_ok=True)
-    
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
-    application.bot_data["allowed_user_ids"] = ALLOWED_USER_IDS
-    
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
-    application.add_handler(MessageHandler(filters.VOICE, handle_voice_message))
+    if telegram_mode(config) == TELEGRAM_MODE_WEBHOOK:
+        # Пока webhook установлен, getUpdates у Telegram недоступен
+        logger.info("Telegram_Bot: telegram_bot.mode: webhook — обновления принимает Nox Core API, бот не запускается.")
+        return
+
+    application = build_application(config)
 
     logger.info("Nox (Telegram Bot Client) starting...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
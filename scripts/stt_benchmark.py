@@ -0,0 +1,179 @@
+"""Speech-to-text benchmark harness.
+
+Runs the STT pipeline (in-memory decoding, optional VAD, backend) over a local
+corpus and reports, per configuration: real-time factor, p50/p95 latency per
+file, peak RSS and word error rate. Results are written as JSON so runs can be
+diffed to catch regressions.
+
+Corpus layout: ``<corpus>/*.wav`` with the reference transcript of each file in
+``<corpus>/<same name>.txt`` (files without a reference are timed but get no WER).
+
+Each configuration is ``key=value`` pairs: ``backend``, ``model``, ``vad`` and any
+backend option. Every configuration runs in a fresh process, so model weights
+and peak RSS do not leak between them. Nothing is downloaded: pass
+``download_root=<dir>`` (and ``local_files_only=true`` for faster_whisper) to use
+cached weights, or benchmark the plumbing with ``backend=stub``::
+
+    python scripts/stt_benchmark.py --corpus bench/ru \\
+        --config backend=whisper,model=small,download_root=~/.cache/whisper \\
+        --config backend=faster_whisper,model=small,compute_type=int8,local_files_only=true \\
+        --output stt_bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import numpy as np
+
+from app.audio_io import SAMPLE_RATE, decode_audio
+from app.entity_registry import normalize_name
+from app.stt_backends import DEFAULT_LANGUAGE, create_backend
+from app.vad import split_speech
+
+
+def parse_config(spec: str) -> dict:
+    """'backend=whisper,model=tiny,vad=true' -> dict (values parsed as JSON where possible)."""
+    config = {}
+    for pair in filter(None, spec.split(",")):
+        key, _, value = pair.partition("=")
+        try:
+            config[key.strip()] = json.loads(value)
+        except ValueError:
+            config[key.strip()] = os.path.expanduser(value.strip())
+    config.setdefault("backend", "stub")
+    config.setdefault("model", "stub" if config["backend"] == "stub" else "small")
+    return config
+
+
+def load_corpus(corpus_dir: Path) -> list:
+    items = []
+    for wav_path in sorted(corpus_dir.glob("*.wav")):
+        reference_path = wav_path.with_suffix(".txt")
+        reference = reference_path.read_text(encoding="utf-8").strip() if reference_path.exists() else None
+        items.append({"name": wav_path.name, "data": wav_path.read_bytes(), "reference": reference})
+    return items
+
+
+def word_errors(reference: str, hypothesis: str) -> tuple:
+    """(word-level edit distance, reference word count) after normalize_name."""
+    ref = normalize_name(reference).split()
+    hyp = normalize_name(hypothesis or "").split()
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1], len(ref)
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    errors, words = word_errors(reference, hypothesis)
+    return errors / words if words else float(bool(normalize_name(hypothesis or "")))
+
+
+def _percentile(values: list, q: float):
+    return round(float(np.percentile(values, q)), 1) if values else None
+
+
+def run_configuration(config: dict, corpus: list, repeat: int = 1) -> dict:
+    """Benchmark one configuration (called in a fresh worker process)."""
+    options = {k: v for k, v in config.items() if k not in ("backend", "model", "vad", "language")}
+    started = time.perf_counter()
+    backend = create_backend(config["backend"], config["model"],
+                             language=config.get("language", DEFAULT_LANGUAGE), **options)
+    load_seconds = time.perf_counter() - started
+
+    latencies_ms, per_file = [], []
+    audio_seconds = processing_seconds = trimmed_seconds = 0.0
+    total_errors = total_words = 0
+    for item in corpus:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            audio = decode_audio(item["data"], item["name"])
+            segments, trimmed = split_speech(audio) if config.get("vad") else ([audio], 0.0)
+            texts = backend.transcribe_batch(segments) if segments else []
+            elapsed = time.perf_counter() - started
+            latencies_ms.append(elapsed * 1000)
+            audio_seconds += len(audio) / SAMPLE_RATE
+            processing_seconds += elapsed
+            trimmed_seconds += trimmed
+        text = " ".join(t for t in texts if t)
+        entry = {"file": item["name"], "text": text, "latency_ms": round(elapsed * 1000, 1)}
+        if item["reference"] is not None:
+            errors, words = word_errors(item["reference"], text)
+            total_errors += errors
+            total_words += words
+            entry["wer"] = round(errors / words, 3) if words else None
+        per_file.append(entry)
+
+    return {
+        "config": config,
+        "load_seconds": round(load_seconds, 2),
+        "audio_seconds": round(audio_seconds, 2),
+        "trimmed_seconds": round(trimmed_seconds, 2),
+        "rtf": round(processing_seconds / audio_seconds, 4) if audio_seconds else None,
+        "latency_ms": {"p50": _percentile(latencies_ms, 50), "p95": _percentile(latencies_ms, 95),
+                       "mean": round(float(np.mean(latencies_ms)), 1) if latencies_ms else None},
+        # ru_maxrss is in KiB on Linux (bytes on macOS)
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != "darwin" else 1024 ** 2), 1),
+        "wer": round(total_errors / total_words, 4) if total_words else None,
+        "files": per_file,
+    }
+
+
+def run_benchmark(corpus_dir: Path, configs: list, repeat: int = 1) -> dict:
+    corpus = load_corpus(corpus_dir)
+    if not corpus:
+        raise SystemExit(f"No *.wav files in {corpus_dir}")
+    results = []
+    for config in configs:
+        print(f"STT_Benchmark: {config} ...", file=sys.stderr)
+        # A fresh process per configuration: isolated peak RSS and no shared model state
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            try:
+                results.append(executor.submit(run_configuration, config, corpus, repeat).result())
+            except Exception as e:
+                print(f"STT_Benchmark Error: {config}: {e}", file=sys.stderr)
+                results.append({"config": config, "error": str(e)})
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "corpus": {"path": str(corpus_dir), "files": len(corpus),
+                   "with_reference": sum(item["reference"] is not None for item in corpus)},
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark STT configurations on a local WAV corpus.")
+    parser.add_argument("--corpus", type=Path, required=True, help="Directory with *.wav and matching *.txt references")
+    parser.add_argument("--config", action="append", dest="configs", type=parse_config,
+                        help="key=value,... (backend, model, vad, backend options); repeatable")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per file (latency percentiles)")
+    parser.add_argument("--output", type=Path, help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.corpus, args.configs or [parse_config("backend=stub")], args.repeat)
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(payload, encoding="utf-8")
+        print(f"STT_Benchmark: Results written to {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+    return report
+
+
+if __name__ == "__main__":
+    main()
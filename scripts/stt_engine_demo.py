@@ -1,8 +1,8 @@
-from app.stt_engine import STT_MODEL, transcribe_audio_to_text
+from app.stt_engine import STT_BACKEND, transcribe_audio_to_text
 import os
 
 print("\n--- Starting STT Engine test script ---")
-if STT_MODEL:
+if STT_BACKEND:
     test_audio_path_example = "test_voice_message.ogg"
     project_root_stt = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     actual_test_audio_path = os.path.join(project_root_stt, test_audio_path_example)
@@ -20,5 +20,5 @@ if STT_MODEL:
         print(f"save it as '{test_audio_path_example}' in the project root ({project_root_stt})")
         print("and run this script again (python3 app/stt_engine.py).")
 else:
-    print("STT_Engine_Test: Whisper model not loaded. Test cannot be performed.")
+    print("STT_Engine_Test: STT backend not loaded. Test cannot be performed.")
 print("\n--- STT Engine test script finished ---")
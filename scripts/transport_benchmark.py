@@ -0,0 +1,161 @@
+"""Service transport microbenchmark: loopback TCP vs Unix domain socket.
+
+Starts a minimal FastAPI app with the same two upload routes as stt_server
+(multipart ``/transcribe`` and raw-body ``/transcribe/raw``) that only decode the
+audio, serves it with uvicorn on a TCP port and on a Unix socket, and times the
+upload of one synthetic command per request through a long-lived httpx client.
+What is measured is the per-request transport and parsing overhead: no model is
+loaded, so the numbers isolate what ``transport.mode`` and ``nox_stt_raw`` change::
+
+    python scripts/transport_benchmark.py --requests 500 --seconds 3 --output transport_bench.json
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import httpx
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, File, Request, UploadFile
+
+from app.audio_io import SAMPLE_RATE, decode_audio, encode_wav
+from app.service_transport import TRANSPORT_TCP, TRANSPORT_UDS, raw_pcm_content_type
+
+UPLOAD_MULTIPART = "multipart"
+UPLOAD_RAW = "raw"
+DEFAULT_CASES = [(TRANSPORT_TCP, UPLOAD_MULTIPART), (TRANSPORT_TCP, UPLOAD_RAW),
+                 (TRANSPORT_UDS, UPLOAD_MULTIPART), (TRANSPORT_UDS, UPLOAD_RAW)]
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/transcribe")
+    async def transcribe(file: UploadFile = File(...)):
+        audio = decode_audio(await file.read(), file.filename, file.content_type)
+        return {"samples": len(audio)}
+
+    @app.post("/transcribe/raw")
+    async def transcribe_raw(request: Request):
+        audio = decode_audio(await request.body(), None, request.headers.get("content-type"))
+        return {"samples": len(audio)}
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app: FastAPI, **bind) -> uvicorn.Server:
+    """uvicorn in a background thread (``host``/``port`` or ``uds``); returns once it accepts requests."""
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", **bind))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"uvicorn did not start on {bind}")
+        time.sleep(0.01)
+    return server
+
+
+def synthetic_command(seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype("<i2")
+
+
+def _percentile(values: list, q: float):
+    return round(float(np.percentile(values, q)), 3) if values else None
+
+
+def run_case(client: httpx.Client, base_url: str, upload: str, samples: np.ndarray, requests: int,
+             warmup: int = 5) -> dict:
+    """Time ``requests`` uploads, encoding included (WAV for multipart, bare PCM for raw)."""
+    expected = len(samples)
+    latencies_ms = []
+    for i in range(warmup + requests):
+        started = time.perf_counter()
+        if upload == UPLOAD_RAW:
+            response = client.post(f"{base_url}/transcribe/raw", content=samples.tobytes(),
+                                   headers={"Content-Type": raw_pcm_content_type(SAMPLE_RATE)})
+        else:
+            files = {"file": ("command.wav", encode_wav(samples, SAMPLE_RATE), "audio/wav")}
+            response = client.post(f"{base_url}/transcribe", files=files)
+        elapsed = time.perf_counter() - started
+        response.raise_for_status()
+        if response.json()["samples"] != expected:
+            raise RuntimeError(f"{upload}: server decoded {response.json()['samples']} samples, sent {expected}")
+        if i >= warmup:
+            latencies_ms.append(elapsed * 1000)
+    total_seconds = sum(latencies_ms) / 1000
+    return {
+        "requests": requests,
+        "latency_ms": {"p50": _percentile(latencies_ms, 50), "p95": _percentile(latencies_ms, 95),
+                       "mean": round(float(np.mean(latencies_ms)), 3)},
+        "requests_per_second": round(requests / total_seconds, 1) if total_seconds else None,
+    }
+
+
+def run_benchmark(requests: int = 200, seconds: float = 3.0, cases=DEFAULT_CASES) -> dict:
+    app = build_app()
+    samples = synthetic_command(seconds)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        port = _free_port()
+        socket_path = os.path.join(tmp, "bench.sock")
+        servers = [start_server(app, host="127.0.0.1", port=port), start_server(app, uds=socket_path)]
+        clients = {
+            TRANSPORT_TCP: (httpx.Client(timeout=30.0), f"http://127.0.0.1:{port}"),
+            TRANSPORT_UDS: (httpx.Client(transport=httpx.HTTPTransport(uds=socket_path), timeout=30.0), "http://nox"),
+        }
+        try:
+            for mode, upload in cases:
+                print(f"Transport_Benchmark: {mode} + {upload} ...", file=sys.stderr)
+                client, base_url = clients[mode]
+                results.append({"transport": mode, "upload": upload,
+                                **run_case(client, base_url, upload, samples, requests)})
+        finally:
+            for client, _ in clients.values():
+                client.close()
+            for server in servers:
+                server.should_exit = True
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "audio_seconds": seconds,
+        "payload_bytes": {UPLOAD_RAW: len(samples) * 2, UPLOAD_MULTIPART: len(encode_wav(samples, SAMPLE_RATE))},
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare loopback TCP and Unix-socket transports for STT uploads.")
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per case")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Length of the uploaded command")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.requests, args.seconds)
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+        print(f"Transport_Benchmark: Results written to {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+    return report
+
+
+if __name__ == "__main__":
+    main()
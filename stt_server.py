@@ -1,11 +1,13 @@
 # stt_server.py
-import uvicorn
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
+from typing import List
 import os
 import sys
-import uuid
-from pathlib import Path
 
 # --- Добавляем корень проекта в sys.path, чтобы импорты работали ---
 project_root = os.path.dirname(os.path.abspath(__file__))
@@ -15,7 +17,17 @@ if project_root not in sys.path:
 
 try:
     # Импортируем нашу уже существующую логику распознавания
-    from app.stt_engine import transcribe_audio_to_text
+    from app.stt_engine import (transcribe_audio_array, transcribe_audio_batch, apply_vad, join_segment_texts,
+                                get_backend_metrics, get_vad_metrics, get_transcription_fingerprint)
+    from app.transcription_cache import TranscriptionCache, DEFAULT_MAX_ENTRIES
+    from app.audio_io import decode_audio, payload_codec, AudioDecodeError, CodecStats, SAMPLE_RATE
+    from app.audio_framing import FramedAudioDecoder
+    from app.stt_streaming import StreamingTranscriber
+    from app.stt_worker_pool import (STTWorkerPool, STTPoolBusyError,
+                                     DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE, DEFAULT_TORCH_THREADS)
+    from app.stt_batching import MicroBatcher, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS
+    from app.config_loader import load_settings
+    from app.service_transport import run_server, SERVICE_STT
 except ModuleNotFoundError:
     print("Ошибка: Не удалось импортировать stt_engine. Убедитесь, что stt_server.py находится в корне проекта.")
     sys.exit(1)
@@ -26,62 +38,282 @@ class STTResponse(BaseModel):
     """Модель ответа от STT сервера."""
     text: str | None
     error: str | None = None
+    trimmed_seconds: float | None = None  # Тишина, отрезанная VAD до распознавания
+    cached: bool = False  # Ответ взят из кэша распознавания
+
+
+class STTBatchItem(STTResponse):
+    filename: str | None = None
+
+
+class STTBatchResponse(BaseModel):
+    results: List[STTBatchItem]
+
+# --- Конфигурация ---
+
+def load_server_settings() -> dict:
+    """settings.yaml целиком (пустой словарь, если конфиг недоступен)."""
+    try:
+        return load_settings() or {}
+    except Exception as e:
+        print(f"STT_Server Warning: Не удалось загрузить настройки STT: {e}. Используются значения по умолчанию.")
+        return {}
+
+
+def load_stt_settings() -> dict:
+    """Секция stt_engine из settings.yaml (пустой словарь, если конфиг недоступен)."""
+    return SERVER_SETTINGS.get("stt_engine") or {}
+
+
+SERVER_SETTINGS = load_server_settings()
+STT_SETTINGS = load_stt_settings()
+_streaming = STT_SETTINGS.get("streaming") or {}
+STREAMING_SETTINGS = {key: float(_streaming[key]) for key in
+                      ("partial_interval", "window_seconds", "silence_seconds", "silence_threshold") if key in _streaming}
+
+# Процессы-распознаватели форкаются от этого процесса, где модель уже загружена
+STT_POOL = STTWorkerPool(
+    transcribe_audio_array,
+    transcribe_batch=transcribe_audio_batch,
+    workers=int(STT_SETTINGS.get("workers", DEFAULT_WORKERS)),
+    queue_size=int(STT_SETTINGS.get("queue_size", DEFAULT_QUEUE_SIZE)),
+    torch_threads=int(STT_SETTINGS.get("torch_threads_per_worker", DEFAULT_TORCH_THREADS)),
+)
+
+# Одновременные запросы за несколько миллисекунд декодируются одним батчем
+_batching = STT_SETTINGS.get("batching") or {}
+BATCHER = MicroBatcher(
+    STT_POOL.transcribe_many,
+    max_batch_size=int(_batching.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE)),
+    max_wait_ms=float(_batching.get("max_wait_ms", DEFAULT_MAX_WAIT_MS)),
+)
+
+# Повторно присланные (пересланные) голосовые отдаются из кэша по хэшу байтов
+_cache_settings = STT_SETTINGS.get("cache") or {}
+TRANSCRIPTION_CACHE = TranscriptionCache(
+    max_entries=int(_cache_settings.get("max_entries", DEFAULT_MAX_ENTRIES)) if _cache_settings.get("enabled", True) else 0,
+    persist_path=_cache_settings.get("persist_path"),
+)
+TRANSCRIPTION_FINGERPRINT = get_transcription_fingerprint()
+
+# Байты на входе и время декодирования по кодекам (видно, окупается ли Opus на клиентах)
+DECODE_STATS = CodecStats()
 
 # --- Инициализация FastAPI ---
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    STT_POOL.start()
+    yield
+    STT_POOL.shutdown()
+    TRANSCRIPTION_CACHE.save()
+
+
 app = FastAPI(
     title="Nox STT API",
     description="API для распознавания речи (Speech-to-Text) с помощью Whisper.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
-# Создаем временную папку для аудио, если ее нет
-TEMP_AUDIO_DIR = Path(project_root) / "temp_audio_stt"
-TEMP_AUDIO_DIR.mkdir(parents=True, exist_ok=True)
-print(f"STT_Server: Временная папка для аудио: {TEMP_AUDIO_DIR}")
+
+@app.get("/status")
+async def status_endpoint():
+    """Загрузка пула, средний размер батча и real-time factor активного бэкенда."""
+    return {
+        "backend": get_backend_metrics(),
+        "vad": get_vad_metrics(),
+        "cache": TRANSCRIPTION_CACHE.stats(),
+        "pool": STT_POOL.stats(),
+        "batching": {"batches": BATCHER.batches, "average_batch_size": BATCHER.average_batch_size},
+        "decode": DECODE_STATS.snapshot(),
+    }
 
 
 # --- API Эндпоинт для распознавания ---
 
+def _decode_speech(data: bytes, filename: str | None, content_type: str | None):
+    """Декодирование в памяти + VAD; блокирующее, выполняется в потоке."""
+    started = time.perf_counter()
+    audio = decode_audio(data, filename, content_type)
+    DECODE_STATS.record(payload_codec(data, filename, content_type), len(data),
+                        len(audio) / SAMPLE_RATE, time.perf_counter() - started)
+    segments, trimmed_seconds = apply_vad(audio)
+    return audio, segments, trimmed_seconds
+
+
+async def _recognize_segments(segments: list) -> str | None:
+    """Распознает речевые фрагменты через батчер; чистая тишина не доходит до модели."""
+    if not segments:
+        return ""
+    return join_segment_texts(await BATCHER.transcribe_many(segments))
+
+
+def _busy_response(e: STTPoolBusyError) -> HTTPException:
+    print(f"STT_Server Warning: {e}")
+    return HTTPException(status_code=503, detail="Сервер распознавания перегружен, повторите позже.",
+                         headers={"Retry-After": "1"})
+
+
 @app.post("/transcribe", response_model=STTResponse)
 async def transcribe_endpoint(file: UploadFile = File(...)):
     """
-    Принимает аудиофайл, сохраняет его временно, распознает текст
-    через stt_engine и возвращает результат.
+    Принимает аудиофайл, декодирует его прямо в памяти (без временных файлов
+    и запуска ffmpeg на каждый запрос), отрезает тишину (VAD), распознает
+    текст через stt_engine и возвращает результат.
     """
-    # Создаем уникальное имя файла, чтобы избежать конфликтов
-    file_path = TEMP_AUDIO_DIR / f"{uuid.uuid4()}_{file.filename}"
-    
-    try:
-        # Сохраняем загруженный файл на диск
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-        print(f"STT_Server: Файл '{file.filename}' временно сохранен как '{file_path}'")
+    return await _transcribe_payload(await file.read(), file.filename, file.content_type)
 
-        # Вызываем наш движок для распознавания
-        recognized_text = transcribe_audio_to_text(str(file_path))
 
-        if recognized_text is not None:
-            print(f"STT_Server: Текст успешно распознан.")
-            return STTResponse(text=recognized_text)
-        else:
-            print("STT_Server Warning: Распознавание не вернуло текст.")
-            raise HTTPException(status_code=400, detail="Не удалось распознать речь в аудиофайле.")
+@app.post("/transcribe/raw", response_model=STTResponse)
+async def transcribe_raw_endpoint(request: Request):
+    """
+    То же без multipart: тело запроса — само аудио, формат по Content-Type
+    (audio/l16; rate=16000 — сырой 16-битный PCM; audio/ogg, audio/wav, ...).
+    """
+    return await _transcribe_payload(await request.body(), None, request.headers.get("content-type"))
 
+
+async def _transcribe_payload(data: bytes, filename: str | None, content_type: str | None) -> STTResponse:
+    label = filename or content_type or "аудио"
+    cache_key = TRANSCRIPTION_CACHE.make_key(data, TRANSCRIPTION_FINGERPRINT)
+    cached_text = TRANSCRIPTION_CACHE.get(cache_key)
+    if cached_text is not None:
+        print(f"STT_Server: '{label}' уже распознавался, ответ из кэша.")
+        return STTResponse(text=cached_text, cached=True)
+
+    try:
+        audio, segments, trimmed_seconds = await asyncio.to_thread(_decode_speech, data, filename, content_type)
+    except AudioDecodeError as e:
+        print(f"STT_Server Warning: Не удалось декодировать '{label}': {e}")
+        raise HTTPException(status_code=400, detail=f"Не удалось декодировать аудио: {e}")
+
+    try:
+        recognized_text = await _recognize_segments(segments)
+    except STTPoolBusyError as e:
+        raise _busy_response(e)
     except Exception as e:
         print(f"STT_Server Error: Произошла ошибка при обработке файла: {e}")
         # В случае любой ошибки, возвращаем ее клиенту
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {e}")
+
+    if recognized_text is not None:
+        TRANSCRIPTION_CACHE.put(cache_key, recognized_text)
+        print(f"STT_Server: Текст успешно распознан ('{label}', {len(audio) / 16000:.1f} с аудио, "
+              f"отрезано тишины: {trimmed_seconds:.1f} с).")
+        return STTResponse(text=recognized_text, trimmed_seconds=trimmed_seconds)
+    print("STT_Server Warning: Распознавание не вернуло текст.")
+    raise HTTPException(status_code=400, detail="Не удалось распознать речь в аудиофайле.")
+
+
+@app.post("/transcribe/batch", response_model=STTBatchResponse)
+async def transcribe_batch_endpoint(files: List[UploadFile] = File(...)):
+    """
+    Принимает несколько аудиофайлов за один запрос и распознает их батчами.
+    Ошибка в одном файле не мешает остальным: она возвращается в его элементе.
+    """
+    results = [STTBatchItem(filename=f.filename, text=None) for f in files]
+    decoded, indices, cache_keys = [], [], {}
+    for i, file in enumerate(files):
+        data = await file.read()
+        cache_keys[i] = TRANSCRIPTION_CACHE.make_key(data, TRANSCRIPTION_FINGERPRINT)
+        cached_text = TRANSCRIPTION_CACHE.get(cache_keys[i])
+        if cached_text is not None:
+            results[i].text, results[i].cached = cached_text, True
+            continue
+        try:
+            decoded.append(await asyncio.to_thread(_decode_speech, data, file.filename, file.content_type))
+            indices.append(i)
+        except AudioDecodeError as e:
+            results[i].error = f"Не удалось декодировать аудио: {e}"
+
+    try:
+        # Фрагменты всех файлов попадают в батчер одновременно и декодируются вместе
+        texts = await asyncio.gather(*(_recognize_segments(segments) for _, segments, _ in decoded))
+    except STTPoolBusyError as e:
+        raise _busy_response(e)
+    for i, text, (_, _, trimmed_seconds) in zip(indices, texts, decoded):
+        results[i].text = text
+        results[i].trimmed_seconds = trimmed_seconds
+        TRANSCRIPTION_CACHE.put(cache_keys[i], text)
+        if text is None:
+            results[i].error = "Не удалось распознать речь в аудиофайле."
+    print(f"STT_Server: Пакетно распознано {sum(r.text is not None for r in results)} из {len(files)} файлов.")
+    return STTBatchResponse(results=results)
+
+
+@app.websocket("/transcribe/stream")
+async def transcribe_stream_endpoint(websocket: WebSocket):
+    """
+    Потоковое распознавание. Клиент шлет бинарные сообщения с 16-битным PCM
+    (моно, 16 кГц) по мере записи и текстовое "end" (или {"type": "end"}) в конце.
+    С ?framing=1 бинарные сообщения — кадры app.audio_framing (PCM или пакеты
+    Opus), а конец речи — кадр KIND_END.
+    Сервер отвечает JSON-событиями {"type": "partial", "text": ...} и одним
+    {"type": "final", "text": ..., "audio_seconds": ...}, после чего закрывает
+    соединение. Финал наступает и сам, если после речи пошла тишина.
+    """
+    await websocket.accept()
+    session = StreamingTranscriber(STT_POOL.transcribe_blocking, **STREAMING_SETTINGS)
+    framed = websocket.query_params.get("framing") == "1"
+    decoder = FramedAudioDecoder() if framed else None
+    try:
+        while not session.finished:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None and decoder is not None:
+                events = await asyncio.to_thread(_feed_framed, session, decoder, message["bytes"])
+            elif message.get("bytes") is not None:
+                # Декодирование блокирующее — уводим его из event loop
+                events = await asyncio.to_thread(session.feed, message["bytes"])
+            elif _is_end_message(message.get("text")):
+                events = [await asyncio.to_thread(session.finish)]
+            else:
+                continue
+            for event in events:
+                await websocket.send_json(event)
+        print(f"STT_Server: Потоковое распознавание завершено ({session.audio_seconds} с аудио): '{session.text}'")
+        await websocket.close()
+    except WebSocketDisconnect:
+        print("STT_Server: Клиент потокового распознавания отключился до финала.")
+    except STTPoolBusyError as e:
+        print(f"STT_Server Warning: {e}")
+        await websocket.send_json({"type": "error", "error": "busy"})
+        await websocket.close(code=1013)  # Try Again Later
+    except AudioDecodeError as e:
+        print(f"STT_Server Warning: Битый аудиопоток: {e}")
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close(code=1007)  # Invalid frame payload data
     finally:
-        # Удаляем временный файл после обработки
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"STT_Server: Временный файл '{file_path}' удален.")
+        if decoder is not None and decoder.codecs:
+            DECODE_STATS.record(f"stream_{'+'.join(sorted(decoder.codecs))}", decoder.bytes_in,
+                                session.audio_seconds, decoder.decode_seconds)
+
+
+def _feed_framed(session: StreamingTranscriber, decoder: FramedAudioDecoder, data: bytes) -> list:
+    """Кадры -> PCM -> транскрайбер; кадр конца речи финализирует сессию."""
+    events = session.feed(decoder.feed(data))
+    if decoder.ended and not session.finished:
+        events.append(session.finish())
+    return events
+
+
+def _is_end_message(text: str | None) -> bool:
+    if text is None:
+        return False
+    if text.strip() == "end":
+        return True
+    try:
+        return json.loads(text).get("type") == "end"
+    except (ValueError, AttributeError):
+        return False
 
 
 # --- Точка входа для запуска сервера ---
 
 if __name__ == "__main__":
     print("STT_Server: Запускаем сервер с помощью Uvicorn...")
-    # Запускаем на порту 8001, чтобы не конфликтовать с основным API (который будет на 8000)
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    # Запускаем на порту 8001, чтобы не конфликтовать с основным API (который будет на 8000),
+    # или на Unix-сокете, если transport.mode: uds
+    run_server(app, SERVER_SETTINGS, SERVICE_STT, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -1,7 +1,12 @@
+import importlib
 import os
 import sys
+from unittest import mock
+
 import pytest
 
+from fake_ha import FakeHomeAssistant, make_state
+
 @pytest.fixture(autouse=True, scope="session")
 def add_project_root_to_sys_path():
     """Ensure the project root is available on sys.path for imports."""
@@ -10,3 +15,39 @@ def add_project_root_to_sys_path():
         sys.path.insert(0, project_root)
     yield
     # No cleanup required; keep path for duration of session
+
+
+@pytest.fixture
+def fake_ha():
+    """A running stand-in Home Assistant with a sensor, two lights and a chandelier group."""
+    server = FakeHomeAssistant([
+        make_state("sensor.bedroom_temperature", "21.5", friendly_name="Температура в спальне", unit_of_measurement="°C"),
+        make_state("light.room_nightlight_1", "off", friendly_name="Ночник"),
+        make_state("light.backlight_1", "off", friendly_name="Подсветка"),
+        make_state("light.room_chandelier", "on", friendly_name="Люстра",
+                   entity_id=["light.room_chandelier_bulb_1", "light.room_chandelier_bulb_2"]),
+        make_state("light.room_chandelier_bulb_1", "on", friendly_name="Люстра лампа 1"),
+        make_state("light.room_chandelier_bulb_2", "off", friendly_name="Люстра лампа 2"),
+    ])
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_adapter(monkeypatch, add_project_root_to_sys_path, fake_ha):
+    """Factory for HomeAssistantAdapter instances pointed at ``fake_ha``."""
+    ha_adapter_module = importlib.import_module('app.adapters.ha_adapter')
+    monkeypatch.setattr(ha_adapter_module, "MIRROR_RECONNECT_DELAY_MIN", 0.05)
+    adapters = []
+
+    def _make(**ha_settings):
+        settings = {"base_url": fake_ha.base_url, "long_lived_access_token": "TOKEN", **ha_settings}
+        monkeypatch.setattr(ha_adapter_module, "load_settings", mock.Mock(return_value={"home_assistant": settings}))
+        adapter = ha_adapter_module.HomeAssistantAdapter()
+        adapters.append(adapter)
+        return adapter
+
+    yield _make
+    for adapter in adapters:
+        adapter.stop_state_mirror()
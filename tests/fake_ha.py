@@ -0,0 +1,280 @@
+"""Local stand-in for the Home Assistant REST and WebSocket APIs.
+
+Runs a small FastAPI app with uvicorn in a background thread on a free port and
+implements just enough of the real protocol for ``HomeAssistantAdapter``:
+``GET /api/states``, ``GET /api/states/<entity_id>``, ``turn_on``/``turn_off``
+calls on ``POST /api/services/<domain>/<service>`` and the ``/api/websocket``
+auth + ``subscribe_events`` handshake followed by ``state_changed`` events.
+
+Besides hand-written states it can generate large synthetic installs
+(:func:`synthetic_states`) and inject REST latency and errors, so scale and
+latency problems can be reproduced without a real Home Assistant. It can also
+be started on its own to point a local Nox at it::
+
+    python tests/fake_ha.py --entities 10000 --port 8123 --latency-ms 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+ROOMS = ["Кухня", "Спальня", "Гостиная", "Ванная", "Коридор", "Балкон", "Детская", "Кабинет"]
+SENSOR_KINDS = [
+    ("Температура", "temperature", "°C"),
+    ("Влажность", "humidity", "%"),
+    ("CO2", "carbon_dioxide", "ppm"),
+    ("Освещенность", "illuminance", "lx"),
+    ("Давление", "pressure", "hPa"),
+    ("Мощность", "power", "W"),
+]
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def make_state(entity_id: str, state: str, /, **attributes) -> dict:
+    return {
+        "entity_id": entity_id,
+        "state": state,
+        "attributes": attributes,
+        "last_changed": _now_iso(),
+        "last_updated": _now_iso(),
+    }
+
+
+def synthetic_states(count: int, seed: int = 0) -> list:
+    """Generate ``count`` plausible entities: ~60% sensors, the rest lights, switches and binary sensors.
+
+    Attributes are padded with the kind of metadata real integrations attach,
+    so memory measurements see realistically sized ``attributes`` blobs.
+    """
+    rng = random.Random(seed)
+    states = []
+    for i in range(count):
+        room = ROOMS[i % len(ROOMS)]
+        room_slug = f"room{ROOMS.index(room)}"
+        kind = rng.random()
+        common = {"icon": "mdi:home-automation", "integration": "zigbee2mqtt",
+                  "linkquality": rng.randint(0, 255), "update_available": False}
+        if kind < 0.6:
+            name, device_class, unit = SENSOR_KINDS[i % len(SENSOR_KINDS)]
+            states.append(make_state(f"sensor.{room_slug}_{device_class}_{i}", f"{rng.uniform(0, 100):.1f}",
+                                     friendly_name=f"{name} {room} {i}", unit_of_measurement=unit,
+                                     device_class=device_class, state_class="measurement", **common))
+        elif kind < 0.75:
+            states.append(make_state(f"light.{room_slug}_lamp_{i}", rng.choice(["on", "off"]),
+                                     friendly_name=f"Лампа {room} {i}", supported_color_modes=["color_temp", "xy"],
+                                     min_color_temp_kelvin=2000, max_color_temp_kelvin=6500, **common))
+        elif kind < 0.9:
+            states.append(make_state(f"switch.{room_slug}_socket_{i}", rng.choice(["on", "off"]),
+                                     friendly_name=f"Розетка {room} {i}", **common))
+        else:
+            states.append(make_state(f"binary_sensor.{room_slug}_motion_{i}", rng.choice(["on", "off"]),
+                                     friendly_name=f"Движение {room} {i}", device_class="motion", **common))
+    return states
+
+
+class FakeHomeAssistant:
+    def __init__(self, states: list, token: str = "TOKEN",
+                 latency_seconds: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.token = token
+        self.states = {s["entity_id"]: s for s in states}
+        # Fault injection for REST calls (the WebSocket stream is not delayed)
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.injected_errors = 0
+        self._rng = random.Random(seed)
+        self.rest_state_requests = 0
+        self.service_calls = []
+        # Entities that accept service calls but never change state
+        self.unresponsive = set()
+        self._sockets = {}
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self.base_url = None
+        self.app = self._build_app()
+
+    # --- HTTP/WS app ---
+
+    def _check_auth(self, request: Request):
+        if request.headers.get("Authorization") != f"Bearer {self.token}":
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.middleware("http")
+        async def inject_faults(request: Request, call_next):
+            if self.latency_seconds:
+                await asyncio.sleep(self.latency_seconds)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.injected_errors += 1
+                return JSONResponse({"message": "Injected error"}, status_code=500)
+            return await call_next(request)
+
+        @app.get("/api/states")
+        async def all_states(request: Request):
+            self._check_auth(request)
+            self.rest_state_requests += 1
+            return list(self.states.values())
+
+        @app.get("/api/states/{entity_id}")
+        async def one_state(entity_id: str, request: Request):
+            self._check_auth(request)
+            if entity_id not in self.states:
+                raise HTTPException(status_code=404, detail="Entity not found.")
+            return self.states[entity_id]
+
+        @app.post("/api/services/{domain}/{service}")
+        async def call_service(domain: str, service: str, request: Request):
+            self._check_auth(request)
+            body = await request.json()
+            self.service_calls.append((f"{domain}.{service}", body))
+            entity_ids = body.get("entity_id") or []
+            if isinstance(entity_ids, str):
+                entity_ids = [entity_ids]
+            new_value = {"turn_on": "on", "turn_off": "off"}.get(service)
+            changed = []
+            for entity_id in entity_ids:
+                old_state = self.states.get(entity_id)
+                if old_state is None or new_value is None or entity_id in self.unresponsive:
+                    continue
+                if old_state["state"] == new_value:
+                    continue
+                new_state = make_state(entity_id, new_value, **old_state["attributes"])
+                self.states[entity_id] = new_state
+                changed.append(new_state)
+                await self._send_all({"event_type": "state_changed", "data": {"entity_id": entity_id, "old_state": old_state, "new_state": new_state}})
+            return changed
+
+        @app.websocket("/api/websocket")
+        async def websocket_api(ws: WebSocket):
+            await ws.accept()
+            self._loop = asyncio.get_running_loop()
+            await ws.send_text(json.dumps({"type": "auth_required", "ha_version": "fake"}))
+            auth = json.loads(await ws.receive_text())
+            if auth.get("access_token") != self.token:
+                await ws.send_text(json.dumps({"type": "auth_invalid", "message": "Invalid access token"}))
+                await ws.close()
+                return
+            await ws.send_text(json.dumps({"type": "auth_ok", "ha_version": "fake"}))
+            subscriptions = {}
+            try:
+                while True:
+                    message = json.loads(await ws.receive_text())
+                    if message.get("type") == "subscribe_events":
+                        subscriptions[message.get("event_type", "*")] = message["id"]
+                        self._sockets[ws] = subscriptions
+                    await ws.send_text(json.dumps({"id": message.get("id"), "type": "result", "success": True, "result": None}))
+            except WebSocketDisconnect:
+                pass
+            finally:
+                self._sockets.pop(ws, None)
+
+        return app
+
+    # --- Test controls ---
+
+    def start(self) -> str:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        config = uvicorn.Config(self.app, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [sock]}, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 5
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake Home Assistant did not start")
+            time.sleep(0.01)
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._sockets)
+
+    def set_state(self, entity_id: str, state: str, /, **attributes):
+        """Change a state and broadcast ``state_changed`` to subscribers."""
+        old_state = self.states.get(entity_id)
+        if not attributes and old_state:
+            attributes = old_state["attributes"]
+        new_state = make_state(entity_id, state, **attributes)
+        self.states[entity_id] = new_state
+        self._broadcast({"event_type": "state_changed", "data": {"entity_id": entity_id, "old_state": old_state, "new_state": new_state}})
+
+    def set_state_silently(self, entity_id: str, state: str, /, **attributes):
+        """Change a state without an event, like a change missed while disconnected."""
+        old_state = self.states.get(entity_id)
+        if not attributes and old_state:
+            attributes = old_state["attributes"]
+        self.states[entity_id] = make_state(entity_id, state, **attributes)
+
+    def drop_connections(self):
+        if self._loop:
+            sockets = list(self._sockets)
+            asyncio.run_coroutine_threadsafe(self._close_all(sockets), self._loop).result(timeout=5)
+
+    def _broadcast(self, event: dict):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._send_all(event), self._loop).result(timeout=5)
+
+    async def _send_all(self, event: dict):
+        for ws, subscriptions in list(self._sockets.items()):
+            subscription_id = subscriptions.get(event["event_type"], subscriptions.get("*"))
+            if subscription_id is None:
+                continue
+            message = {"id": subscription_id, "type": "event", "event": {**event, "time_fired": _now_iso()}}
+            await ws.send_text(json.dumps(message))
+
+    async def _close_all(self, sockets):
+        for ws in sockets:
+            self._sockets.pop(ws, None)
+            await ws.close()
+
+    def emit_random_updates(self, count: int, domain: str = "sensor"):
+        """Broadcast ``count`` state_changed events for random entities of ``domain``."""
+        entity_ids = [entity_id for entity_id in self.states if entity_id.startswith(f"{domain}.")]
+        for _ in range(count):
+            self.set_state(self._rng.choice(entity_ids), f"{self._rng.uniform(0, 100):.1f}")
+
+    def fire_event(self, event_type: str, data: dict):
+        """Broadcast an arbitrary event (e.g. ``entity_registry_updated``)."""
+        self._broadcast({"event_type": event_type, "data": data})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a synthetic Home Assistant for local load testing.")
+    parser.add_argument("--entities", type=int, default=1000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--token", default="TOKEN")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    simulator = FakeHomeAssistant(synthetic_states(args.entities, args.seed), token=args.token,
+                                  latency_seconds=args.latency_ms / 1000, error_rate=args.error_rate, seed=args.seed)
+    print(f"Fake Home Assistant: {args.entities} entities at http://{args.host}:{args.port} (token: {args.token})")
+    uvicorn.run(simulator.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Local stand-in for the Telegram Bot API.
+
+Runs a small FastAPI app with uvicorn in a background thread on a free port and
+implements the part of the Bot API Nox uses: ``setWebhook``, ``getFile``,
+``sendMessage`` and file downloads from ``/file/bot<token>/<file_path>``.
+It can also play Telegram's side of a webhook: :meth:`FakeTelegram.deliver`
+POSTs an update to the registered URL with the ``X-Telegram-Bot-Api-Secret-Token``
+header, the way Telegram does.
+"""
+import itertools
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _message(chat_id: int, user_id: int = None, **fields) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": user_id if user_id is not None else chat_id, "is_bot": False, "first_name": "Искра"},
+            **fields,
+        },
+    }
+
+
+def text_update(chat_id: int, text: str, user_id: int = None) -> dict:
+    return _message(chat_id, user_id, text=text)
+
+
+def voice_update(chat_id: int, file_id: str, duration: int = 2, user_id: int = None) -> dict:
+    return _message(chat_id, user_id, voice={"file_id": file_id, "file_unique_id": f"u-{file_id}",
+                                              "duration": duration, "mime_type": "audio/ogg"})
+
+
+class FakeTelegram:
+    def __init__(self, token: str = "123456:TEST"):
+        self.token = token
+        self.files = {}
+        self.sent_messages = []
+        self.webhook = None
+        self.downloads = 0
+        self._server = None
+        self._thread = None
+        self.base_url = None
+        self.app = self._build_app()
+
+    # --- HTTP app ---
+
+    def _check_token(self, token: str):
+        if token != self.token:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/bot{token}/{method}")
+        async def bot_method(token: str, method: str, request: Request):
+            self._check_token(token)
+            params = await request.json()
+            if method == "setWebhook":
+                self.webhook = params
+                return {"ok": True, "result": True, "description": "Webhook was set"}
+            if method == "getFile":
+                file_id = params.get("file_id")
+                if file_id not in self.files:
+                    return {"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"}
+                return {"ok": True, "result": {"file_id": file_id, "file_unique_id": f"u-{file_id}",
+                                               "file_size": len(self.files[file_id]), "file_path": f"voice/{file_id}.oga"}}
+            if method == "sendMessage":
+                self.sent_messages.append(params)
+                return {"ok": True, "result": {"message_id": len(self.sent_messages), "chat": {"id": params["chat_id"]},
+                                               "text": params["text"], "date": int(time.time())}}
+            return {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+
+        @app.get("/file/bot{token}/voice/{name}")
+        async def download(token: str, name: str):
+            self._check_token(token)
+            file_id = name.rsplit(".", 1)[0]
+            if file_id not in self.files:
+                raise HTTPException(status_code=404)
+            self.downloads += 1
+            return Response(self.files[file_id], media_type="audio/ogg")
+
+        return app
+
+    # --- Test controls ---
+
+    def start(self) -> str:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        config = uvicorn.Config(self.app, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [sock]}, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 5
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake Telegram did not start")
+            time.sleep(0.01)
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+    def add_file(self, file_id: str, data: bytes):
+        self.files[file_id] = data
+
+    def deliver(self, update: dict, client=None, secret_token: str = None) -> httpx.Response:
+        """POST ``update`` to the registered webhook, with its secret unless ``secret_token`` overrides it.
+
+        ``client`` is any object with an httpx-style ``post`` (e.g. FastAPI's TestClient).
+        """
+        if self.webhook is None:
+            raise RuntimeError("No webhook registered")
+        secret = secret_token if secret_token is not None else self.webhook.get("secret_token")
+        headers = {SECRET_TOKEN_HEADER: secret} if secret else {}
+        return (client or httpx).post(self.webhook["url"], json=update, headers=headers)
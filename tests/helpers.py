@@ -0,0 +1,11 @@
+"""Small helpers shared by the tests and the local fakes (fake_ha, fake_telegram)."""
+import time
+
+
+def wait_until(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
@@ -0,0 +1,119 @@
+import importlib
+import shutil
+
+import numpy as np
+import pytest
+
+RATE = 16000
+
+
+def tone(seconds: float, amplitude: int = 8000) -> np.ndarray:
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+
+@pytest.fixture(scope="module")
+def audio_io(add_project_root_to_sys_path):
+    return importlib.import_module('app.audio_io')
+
+
+@pytest.fixture(scope="module")
+def framing(add_project_root_to_sys_path):
+    return importlib.import_module('app.audio_framing')
+
+
+def opus_available(audio_io) -> bool:
+    return audio_io.av is not None or shutil.which("ffmpeg") is not None
+
+
+def test_parser_reassembles_frames_split_anywhere(framing):
+    stream = (framing.pack_frame(framing.KIND_AUDIO, "pcm16", b"\x01\x02" * 10)
+              + framing.pack_frame(framing.KIND_AUDIO, "opus", b"packet")
+              + framing.pack_end())
+    parser = framing.FrameParser()
+    frames = []
+    for i in range(0, len(stream), 3):
+        frames.extend(parser.feed(stream[i:i + 3]))
+    assert frames == [(framing.KIND_AUDIO, "pcm16", b"\x01\x02" * 10),
+                      (framing.KIND_AUDIO, "opus", b"packet"),
+                      (framing.KIND_END, "pcm16", b"")]
+
+
+def test_header_is_four_bytes(framing):
+    assert len(framing.pack_frame(framing.KIND_AUDIO, "pcm16", b"ab")) == 6
+    with pytest.raises(ValueError):
+        framing.pack_frame(framing.KIND_AUDIO, "pcm16", bytes(framing.MAX_PAYLOAD + 1))
+
+
+def test_unknown_codec_id_is_a_decode_error(framing, audio_io):
+    with pytest.raises(audio_io.AudioDecodeError):
+        framing.FrameParser().feed(b"\x01\x09\x00\x00")
+
+
+def test_pcm16_framed_round_trip(framing):
+    encoder = framing.FramedAudioEncoder("pcm16")
+    decoder = framing.FramedAudioDecoder()
+    audio = tone(0.5)
+    stream = b"".join(encoder.encode(audio[i:i + 512]) for i in range(0, len(audio), 512)) + encoder.end()
+    pcm = b"".join(decoder.feed(stream[i:i + 1000]) for i in range(0, len(stream), 1000))
+    np.testing.assert_array_equal(np.frombuffer(pcm, np.int16), audio)
+    assert decoder.ended and decoder.codecs == {"pcm16"}
+    assert encoder.bytes_in == len(audio) * 2
+    assert encoder.bytes_out == len(stream)
+
+
+def test_encode_wav_round_trips_through_decode(audio_io):
+    audio = tone(0.3)
+    data = audio_io.encode_audio(audio, RATE, "pcm16")
+    assert audio_io.payload_codec(data) == "wav"
+    decoded = audio_io.decode_audio(data, "command.wav")
+    np.testing.assert_allclose(decoded, audio / 32768.0, atol=1e-6)
+    with pytest.raises(audio_io.AudioEncodeError):
+        audio_io.encode_audio(audio, RATE, "mp3")
+
+
+def test_codec_stats(audio_io):
+    stats = audio_io.CodecStats()
+    stats.record("ogg", 3000, 1.0, 0.002)
+    stats.record("ogg", 3000, 1.0, 0.004)
+    assert stats.snapshot() == {"ogg": {"payloads": 2, "bytes": 6000, "audio_seconds": 2.0,
+                                        "kbps": 24.0, "avg_ms": 3.0}}
+
+
+def test_upload_encoder_falls_back_to_wav_without_opus(audio_io, monkeypatch):
+    pipeline = importlib.import_module('interfaces.audio_pipeline')
+
+    def no_encoder(*args, **kwargs):
+        raise audio_io.AudioEncodeError("neither PyAV nor ffmpeg is available to encode Opus")
+
+    monkeypatch.setattr(pipeline, "encode_audio", no_encoder)
+    encoder = pipeline.UploadEncoder("opus", 24000)
+    data, filename, content_type = encoder.encode(tone(0.2), RATE)
+    assert data.startswith(b"RIFF")
+    assert (filename, content_type) == ("command.wav", "audio/wav")
+    assert encoder.codec == "pcm16"
+    assert encoder.stats.snapshot()["pcm16"]["payloads"] == 1
+
+
+def test_opus_upload_is_much_smaller_and_decodes(audio_io):
+    if not opus_available(audio_io):
+        pytest.skip("no Opus encoder (PyAV or ffmpeg) installed")
+    audio = tone(2.0)
+    data = audio_io.encode_audio(audio, RATE, "opus", 24000)
+    assert audio_io.payload_codec(data) == "ogg"
+    assert len(data) < len(audio) * 2 / 5
+    decoded = audio_io.decode_audio(data, "command.ogg", "audio/ogg")
+    assert abs(len(decoded) - len(audio)) < RATE * 0.1
+
+
+def test_opus_framed_round_trip(framing, audio_io):
+    if audio_io.av is None:
+        pytest.skip("PyAV is required for streamed Opus")
+    encoder = framing.FramedAudioEncoder("opus", RATE, 24000)
+    decoder = framing.FramedAudioDecoder()
+    audio = tone(1.0)
+    stream = b"".join(encoder.encode(audio[i:i + 512]) for i in range(0, len(audio), 512)) + encoder.end()
+    pcm = decoder.feed(stream)
+    assert encoder.bytes_out < encoder.bytes_in / 5
+    assert decoder.ended and decoder.codecs == {"opus"}
+    assert abs(len(pcm) // 2 - len(audio)) < RATE * 0.1
@@ -0,0 +1,76 @@
+import importlib
+import io
+import wave
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def audio_io(add_project_root_to_sys_path):
+    return importlib.import_module('app.audio_io')
+
+
+def wav_bytes(samples: np.ndarray, rate: int = 16000, channels: int = 1) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(samples.astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def test_pcm16_wav_is_parsed_in_memory(audio_io):
+    samples = np.array([0, 16384, -16384, 32767, -32768], dtype=np.int16)
+    audio = audio_io.decode_audio(wav_bytes(samples), "voice.wav")
+    assert audio.dtype == np.float32
+    assert audio.tolist() == pytest.approx([0.0, 0.5, -0.5, 32767 / 32768, -1.0])
+
+
+def test_stereo_44k_wav_is_downmixed_and_resampled(audio_io):
+    left = np.full(44100, 8000, dtype=np.int16)
+    right = np.zeros(44100, dtype=np.int16)
+    interleaved = np.column_stack((left, right)).reshape(-1)
+    audio = audio_io.decode_audio(wav_bytes(interleaved, rate=44100, channels=2))
+    assert len(audio) == 16000
+    assert audio == pytest.approx(np.full(16000, 4000 / 32768), abs=1e-6)
+
+
+def test_float32_wav_with_extra_chunks(audio_io):
+    samples = np.array([0.25, -0.75], dtype="<f4")
+    fmt = np.array([3, 1], dtype="<u2").tobytes() + np.array([16000, 64000], dtype="<u4").tobytes() + np.array([4, 32], dtype="<u2").tobytes()
+    body = b"WAVE" + b"fmt " + len(fmt).to_bytes(4, "little") + fmt
+    body += b"LIST" + (3).to_bytes(4, "little") + b"abc\x00"  # odd-sized chunk is padded
+    body += b"data" + len(samples.tobytes()).to_bytes(4, "little") + samples.tobytes()
+    audio = audio_io.decode_audio(b"RIFF" + len(body).to_bytes(4, "little") + body)
+    assert audio.tolist() == [0.25, -0.75]
+
+
+def test_raw_pcm_is_recognised_by_name_or_content_type(audio_io):
+    pcm = np.array([16384, -16384], dtype="<i2").tobytes()
+    assert audio_io.decode_audio(pcm, "chunk.pcm").tolist() == [0.5, -0.5]
+    assert audio_io.decode_audio(pcm, "blob", "audio/L16; rate=16000").tolist() == [0.5, -0.5]
+
+
+def test_undecodable_payload_raises(audio_io):
+    with pytest.raises(audio_io.AudioDecodeError):
+        audio_io.decode_audio(b"")
+    with pytest.raises(audio_io.AudioDecodeError):
+        audio_io.decode_audio(b"RIFF\x00\x00\x00\x00WAVE")
+    with pytest.raises(audio_io.AudioDecodeError):
+        audio_io.decode_audio(b"definitely not audio", "voice.ogg")
+
+
+@pytest.mark.parametrize("cut", [22, 30, 40])
+def test_truncated_wav_header_raises_decode_error(audio_io, cut):
+    samples = np.zeros(160, dtype=np.int16)
+    with pytest.raises(audio_io.AudioDecodeError):
+        audio_io.decode_audio(wav_bytes(samples)[:cut], "voice.wav")
+
+
+def test_wav_with_zero_rate_raises_decode_error(audio_io):
+    data = bytearray(wav_bytes(np.zeros(160, dtype=np.int16)))
+    data[24:28] = (0).to_bytes(4, "little")  # fmt sample rate
+    with pytest.raises(audio_io.AudioDecodeError):
+        audio_io.decode_audio(bytes(data), "voice.wav")
@@ -0,0 +1,286 @@
+import importlib
+import io
+import threading
+import time
+import wave
+
+import numpy as np
+import pytest
+
+from helpers import wait_until
+
+RATE = 16000
+FRAME = 512
+
+
+def tone(seconds: float, amplitude: int = 6000) -> np.ndarray:
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 200 * t)).astype(np.int16)
+
+
+def noise(seconds: float, level: int = 60, seed: int = 0) -> np.ndarray:
+    return (level * np.random.default_rng(seed).standard_normal(int(seconds * RATE))).astype(np.int16)
+
+
+def run(endpointer, audio: np.ndarray):
+    """Feeds frame by frame like the listener; returns (reason, seconds consumed)."""
+    endpointer.reset()
+    for i in range(0, len(audio) - FRAME + 1, FRAME):
+        reason = endpointer.process(audio[i:i + FRAME].tobytes())
+        if reason:
+            return reason, (i + FRAME) / RATE
+    return None, len(audio) / RATE
+
+
+@pytest.fixture(scope="module")
+def pipeline(add_project_root_to_sys_path):
+    return importlib.import_module('interfaces.audio_pipeline')
+
+
+@pytest.fixture
+def endpointer(pipeline):
+    endpointer = pipeline.Endpointer(RATE, FRAME, silence_seconds=0.5, min_seconds=0.8, max_seconds=5.0,
+                                     no_speech_seconds=2.0, min_threshold=100)
+    endpointer.calibrate(noise(1.0).tobytes())
+    return endpointer
+
+
+def test_frame_energies_are_per_frame_rms(pipeline):
+    audio = np.concatenate([np.full(FRAME, 1000, np.int16), np.zeros(FRAME, np.int16), np.full(100, 5, np.int16)])
+    energies = pipeline.frame_energies(audio.tobytes(), FRAME)
+    np.testing.assert_allclose(energies, [1000.0, 0.0])
+
+
+def test_calibration_sets_threshold_from_noise_floor(pipeline, endpointer):
+    assert 50 < endpointer.noise_floor < 70
+    assert endpointer.threshold == pytest.approx(endpointer.noise_floor * 3.0)
+    # A single loud click during calibration does not raise the floor
+    quiet = pipeline.Endpointer(RATE, FRAME)
+    audio = noise(1.0)
+    audio[:FRAME] = tone(FRAME / RATE, 20000)
+    quiet.calibrate(audio)
+    assert quiet.noise_floor < 70
+
+
+def test_short_command_ends_soon_after_speech(pipeline, endpointer):
+    audio = np.concatenate([noise(0.2), tone(1.0), noise(3.0, seed=1)])
+    reason, seconds = run(endpointer, audio)
+    assert reason == pipeline.END_SILENCE
+    # 1.2 s of audio + 0.5 s of trailing silence, within one frame
+    assert 1.7 <= seconds <= 1.7 + 2 * FRAME / RATE
+    assert endpointer.speech_detected
+
+
+def test_pauses_between_words_do_not_end_recording(pipeline, endpointer):
+    audio = np.concatenate([tone(0.5), noise(0.3), tone(0.5), noise(2.0, seed=2)])
+    reason, seconds = run(endpointer, audio)
+    assert reason == pipeline.END_SILENCE
+    assert seconds > 1.3 + 0.5
+
+
+def test_min_duration_is_respected(pipeline, endpointer):
+    reason, seconds = run(endpointer, np.concatenate([tone(0.1), noise(2.0)]))
+    assert reason == pipeline.END_SILENCE
+    assert seconds >= 0.8
+
+
+def test_max_duration_caps_continuous_speech(pipeline, endpointer):
+    reason, seconds = run(endpointer, tone(10.0))
+    assert reason == pipeline.END_MAX_DURATION
+    assert seconds == pytest.approx(5.0, abs=FRAME / RATE)
+
+
+def test_no_speech_gives_up(pipeline, endpointer):
+    reason, seconds = run(endpointer, noise(5.0, seed=3))
+    assert reason == pipeline.END_NO_SPEECH
+    assert seconds == pytest.approx(2.0, abs=FRAME / RATE)
+    assert not endpointer.speech_detected
+
+
+def test_trailing_silence_is_trimmed_to_a_little_context(pipeline, endpointer):
+    audio = np.concatenate([tone(1.0), noise(3.0, seed=6)])
+    frames = [audio[i:i + FRAME] for i in range(0, len(audio) - FRAME + 1, FRAME)]
+    reason, seconds = run(endpointer, audio)
+    assert reason == pipeline.END_SILENCE
+    kept = endpointer.trim_trailing(frames[:int(seconds * RATE) // FRAME])
+    kept_seconds = len(kept) * FRAME / RATE
+    assert 1.0 + 0.2 - FRAME / RATE <= kept_seconds <= 1.0 + 0.2 + 2 * FRAME / RATE
+    assert endpointer.trim_trailing(kept, keep_seconds=10.0) is kept
+
+
+def test_ring_buffer_wraps_and_reads_by_absolute_position(pipeline):
+    ring = pipeline.RingBuffer(1000)
+    data = np.arange(2500, dtype=np.int16)
+    for i in range(0, len(data), 300):
+        ring.write(data[i:i + 300])
+    assert ring.written == 2500
+    samples, position = ring.read(1800, 500)
+    np.testing.assert_array_equal(samples, data[1800:2300])
+    assert position == 2300
+    # Audio that has already been overwritten: reading resumes at the oldest sample
+    samples, position = ring.read(100, 200)
+    np.testing.assert_array_equal(samples, data[1500:1700])
+    assert ring.lost_samples == 1400
+
+
+def test_ring_buffer_read_waits_for_data(pipeline):
+    ring = pipeline.RingBuffer(1000)
+    samples, position = ring.read(0, 10, timeout=0.01)
+    assert samples is None and position == 0
+    writer = threading.Timer(0.05, ring.write, args=(np.ones(10, np.int16),))
+    writer.start()
+    samples, position = ring.read(0, 10, timeout=2.0)
+    assert samples.tolist() == [1] * 10 and position == 10
+
+
+def record_after_beep(ring, trigger, endpointer, after_beep):
+    """The microphone listener's recording loop: from the trigger on, the beep window kept out of endpointing."""
+    # play_beep has just returned: everything captured since the trigger is the beep window
+    endpointer.reset(ignore_samples=ring.written - trigger + FRAME)
+    ring.write(after_beep)
+    frames, position, reason = [], trigger, None
+    while reason is None:
+        pcm, position = ring.read(position, FRAME, timeout=1.0)
+        assert pcm is not None
+        frames.append(pcm)
+        reason = endpointer.process(pcm)
+    return reason, np.concatenate(frames)
+
+
+def test_beep_followed_by_silence_is_no_speech(pipeline, endpointer):
+    ring = pipeline.RingBuffer(10 * RATE)
+    ring.write(noise(1.0, seed=4))
+    trigger = ring.written
+    # play_beep blocks while capture keeps writing: the beep itself, then a silent room
+    ring.write(tone(0.15, 20000))
+
+    reason, _ = record_after_beep(ring, trigger, endpointer, noise(3.0, seed=5))
+    assert reason == pipeline.END_NO_SPEECH
+    assert not endpointer.speech_detected
+
+
+def test_speech_overlapping_the_beep_is_kept(pipeline, endpointer):
+    ring = pipeline.RingBuffer(10 * RATE)
+    ring.write(noise(1.0, seed=4))
+    trigger = ring.written
+    # "Hey Nox, включи свет" in one breath: the command starts while the beep is still playing
+    beep_and_speech = tone(0.15, 20000)
+    ring.write(beep_and_speech)
+
+    reason, pcm = record_after_beep(ring, trigger, endpointer, np.concatenate([tone(0.6), noise(3.0, seed=7)]))
+    assert reason == pipeline.END_SILENCE
+    assert endpointer.speech_detected
+    # Nothing after the trigger is thrown away, and nothing before it (the wake word) is added
+    np.testing.assert_array_equal(pcm[:len(beep_and_speech)], beep_and_speech)
+
+
+def test_capture_thread_fills_ring_and_counts_overflows(pipeline):
+    ring = pipeline.RingBuffer(RATE)
+    reads = iter([tone(FRAME / RATE).tobytes(), OSError("Input overflowed"), tone(FRAME / RATE).tobytes()])
+
+    def read_frame():
+        item = next(reads, None)
+        if item is None:
+            time.sleep(0.01)
+            return b""
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    capture = pipeline.CaptureThread(read_frame, ring)
+    capture.start()
+    samples, _ = ring.read(0, 2 * FRAME, timeout=2.0)
+    capture.stop(timeout=2.0)
+    assert samples is not None
+    assert capture.overflows == 1
+    assert not capture.is_alive()
+
+
+def test_command_worker_does_not_block_and_drops_when_full(pipeline):
+    release = threading.Event()
+    handled = []
+
+    def handler(command):
+        release.wait(2.0)
+        handled.append(command)
+
+    worker = pipeline.CommandWorker(handler, max_pending=2)
+    worker.start()
+    assert worker.submit(1)
+    wait_until(lambda: worker._queue.qsize() == 0)  # 1 is being handled
+    assert worker.submit(2) and worker.submit(3)
+    assert not worker.submit(4)
+    release.set()
+    worker.join_pending()
+    worker.stop(timeout=2.0)
+    assert handled == [1, 2, 3]
+    assert worker.dropped == 1
+
+
+def test_pcm_to_wav_bytes_round_trips(pipeline):
+    audio = tone(0.25)
+    data = pipeline.pcm_to_wav_bytes(audio, RATE)
+    with wave.open(io.BytesIO(data)) as wf:
+        assert (wf.getnchannels(), wf.getsampwidth(), wf.getframerate()) == (1, 2, RATE)
+        np.testing.assert_array_equal(np.frombuffer(wf.readframes(wf.getnframes()), np.int16), audio)
+
+
+@pytest.fixture
+def stream_server():
+    """Stand-in for stt_server's /transcribe/stream: a partial per 0.25 s of audio, the final on "end"."""
+    import socket
+    import uvicorn
+    from fastapi import FastAPI, WebSocket
+
+    app = FastAPI()
+    received = []
+
+    @app.websocket("/transcribe/stream")
+    async def stream(websocket: WebSocket):
+        await websocket.accept()
+        words, audio_bytes = ["включи", "включи свет"], 0
+        while True:
+            message = await websocket.receive()
+            if message.get("bytes") is not None:
+                audio_bytes += len(message["bytes"])
+                if words and audio_bytes >= 8000:
+                    await websocket.send_json({"type": "partial", "text": words.pop(0)})
+                    audio_bytes = 0
+            elif message.get("text") == "end" or message["type"] == "websocket.disconnect":
+                received.append(message.get("text"))
+                break
+        if received[-1] == "end":
+            await websocket.send_json({"type": "final", "text": "включи свет", "audio_seconds": 1.0})
+            await websocket.close()
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    assert wait_until(lambda: server.started)
+    yield f"ws://127.0.0.1:{sock.getsockname()[1]}/transcribe/stream", received
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+def test_streaming_session_forwards_partials_and_returns_final(pipeline, stream_server):
+    url, received = stream_server
+    partials = []
+    session = pipeline.StreamingSTTSession(url, lambda session_id, text: partials.append((session_id, text))).start()
+    for _ in range(40):
+        session.send(tone(FRAME / RATE))
+    assert wait_until(lambda: len(partials) == 2)
+    assert session.finish(timeout=5) == "включи свет"
+    assert partials == [(session.session_id, "включи"), (session.session_id, "включи свет")]
+    assert received == ["end"]
+
+
+def test_streaming_session_is_configured_and_fails_over(pipeline):
+    config = {"api_endpoints": {"nox_stt_stream": "ws://127.0.0.1:9/transcribe/stream"}}
+    assert pipeline.StreamingSTTSession.from_config(config, print) is None
+    session = pipeline.StreamingSTTSession.from_config({**config, "microphone": {"streaming": True}}, print)
+    session.start().send(tone(0.1))
+    # Nothing listens there: finish() reports no text, the command is uploaded instead
+    assert session.finish(timeout=5) is None
+    assert session.error
@@ -0,0 +1,159 @@
+import importlib
+import time
+from unittest import mock
+
+import pytest
+
+
+SENSORS = [
+    {"entity_id": "sensor.bedroom_temperature", "domain": "sensor", "friendly_name": "Температура в спальне", "state": "21.5", "attributes": {}},
+    {"entity_id": "sensor.kitchen_humidity", "domain": "sensor", "friendly_name": "Влажность на кухне", "state": "40", "attributes": {}},
+    {"entity_id": "sensor.outdoor_temperature", "domain": "sensor", "friendly_name": "Температура на улице", "state": "3", "attributes": {}},
+    {"entity_id": "sensor.printer_toner", "domain": "sensor", "friendly_name": "Тонер принтера", "state": "80", "attributes": {}},
+]
+
+
+@pytest.fixture(scope="module")
+def capability_module(add_project_root_to_sys_path):
+    return importlib.import_module('app.capability_manager')
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return tmp_path / "entity_snapshot.json"
+
+
+@pytest.fixture
+def make_manager(monkeypatch, capability_module, snapshot_path):
+    monkeypatch.setattr(capability_module, "load_settings", mock.Mock(return_value={
+        "home_assistant": {"prompt_sensor_top_k": 2, "prompt_min_score": 0.25, "snapshot_path": str(snapshot_path)}
+    }))
+
+    def _make(entities=SENSORS):
+        adapter = mock.Mock()
+        adapter.get_all_entities.return_value = None if entities is None else [dict(e) for e in entities]
+        return capability_module.CapabilityManager(ha_adapter=adapter)
+    return _make
+
+
+@pytest.fixture
+def manager(make_manager):
+    return make_manager()
+
+
+def test_settings_are_read_from_config(manager):
+    assert manager.prompt_top_k == 2
+    assert manager.prompt_min_score == 0.25
+
+
+def test_relevant_sensor_selected_despite_word_form(manager):
+    selected = manager.select_relevant_entities(manager.get_entities_by_domain(["sensor"]), "какая влажность на кухне?")
+    assert [e.entity_id for e in selected] == ["sensor.kitchen_humidity"]
+
+
+def test_selection_is_capped_by_top_k(manager):
+    selected = manager.select_relevant_entities(manager.get_entities_by_domain(["sensor"]), "какая температура в спальне и на улице")
+    assert len(selected) == 2
+    assert selected[0].entity_id == "sensor.bedroom_temperature"
+    assert "sensor.printer_toner" not in [e.entity_id for e in selected]
+
+
+def test_pruned_prompt_keeps_fixed_groups(manager):
+    prompt = manager.generate_device_list_string("включи люстру")
+    assert "ГРУППА: ЛЮСТРА" in prompt
+    assert "sensor." not in prompt
+
+
+def test_prompt_without_command_lists_all_sensors(manager):
+    prompt = manager.generate_device_list_string()
+    for sensor in SENSORS:
+        assert sensor["entity_id"] in prompt
+
+
+def test_zero_top_k_disables_pruning(manager):
+    manager.prompt_top_k = 0
+    prompt = manager.generate_device_list_string("включи люстру")
+    for sensor in SENSORS:
+        assert sensor["entity_id"] in prompt
+
+
+def test_refresh_applies_only_changes_and_bumps_version(manager):
+    unchanged = manager.get_entity("sensor.bedroom_temperature")
+    renamed = dict(SENSORS[1], friendly_name="Влажность в ванной")
+    added = {"entity_id": "sensor.balcony_temperature", "domain": "sensor", "friendly_name": "Температура на балконе", "state": "5", "attributes": {}}
+    manager.ha_adapter.get_all_entities.return_value = [SENSORS[0], renamed, SENSORS[2], added]
+
+    assert manager.refresh() is True
+    assert manager.version == 1
+    assert manager.get_entity("sensor.bedroom_temperature") is unchanged
+    assert manager.get_entity("sensor.kitchen_humidity").friendly_name == "Влажность в ванной"
+    assert manager.get_entity("sensor.printer_toner") is None
+    assert manager.get_entity("sensor.balcony_temperature") is not None
+
+    assert manager.refresh() is False
+    assert manager.version == 1
+
+
+def test_refresh_keeps_registry_when_ha_unavailable(manager):
+    manager.ha_adapter.get_all_entities.return_value = None
+    assert manager.refresh() is False
+    assert len(manager.registry) == len(SENSORS)
+
+
+def test_refresh_invalidates_cached_device_list(manager):
+    before = manager.generate_device_list_string()
+    assert manager.generate_device_list_string() is before
+    manager.ha_adapter.get_all_entities.return_value = SENSORS[:1]
+    manager.refresh()
+    after = manager.generate_device_list_string()
+    assert "sensor.printer_toner" in before
+    assert "sensor.printer_toner" not in after
+
+
+def test_background_refresh_runs_on_request(manager):
+    manager.refresh_interval = 0
+    manager.ha_adapter.get_all_entities.return_value = SENSORS[:2]
+    manager.start_background_refresh()
+    try:
+        listener = manager.ha_adapter.add_event_listener.call_args.args[1]
+        listener({"event_type": "entity_registry_updated"})
+        deadline = time.monotonic() + 5
+        while manager.version == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        manager.stop_background_refresh()
+    assert manager.version == 1
+    assert len(manager.registry) == 2
+
+
+def test_snapshot_written_after_initial_load(manager, snapshot_path):
+    assert snapshot_path.exists()
+    assert manager.snapshot_age_seconds < 5
+
+
+def test_cold_start_serves_from_snapshot_without_blocking_on_ha(make_manager):
+    make_manager()
+    offline = make_manager(entities=None)
+    offline.ha_adapter.get_all_entities.assert_not_called()
+    assert len(offline.registry) == len(SENSORS)
+    assert offline.get_entity("sensor.kitchen_humidity").friendly_name == "Влажность на кухне"
+    assert "sensor.printer_toner" in offline.generate_device_list_string()
+    assert offline.snapshot_age_seconds is not None
+
+
+@pytest.mark.parametrize("content", [
+    "{not json",
+    "[]",  # Valid JSON, but not a snapshot object
+    '{"format": FORMAT, "entities": [], "version": "v2"}',
+])
+def test_corrupted_snapshot_falls_back_to_ha(make_manager, capability_module, snapshot_path, content):
+    snapshot_path.write_text(content.replace("FORMAT", str(capability_module.SNAPSHOT_FORMAT)), encoding="utf-8")
+    manager = make_manager()
+    manager.ha_adapter.get_all_entities.assert_called_once()
+    assert len(manager.registry) == len(SENSORS)
+
+
+def test_no_snapshot_and_ha_down_leaves_age_unknown(make_manager):
+    manager = make_manager(entities=None)
+    assert len(manager.registry) == 0
+    assert manager.snapshot_age_seconds is None
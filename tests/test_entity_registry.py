@@ -0,0 +1,56 @@
+import importlib
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def registry_module(add_project_root_to_sys_path):
+    return importlib.import_module('app.entity_registry')
+
+
+@pytest.fixture
+def registry(registry_module):
+    return registry_module.EntityRegistry.from_entities([
+        {"entity_id": "light.room_chandelier", "friendly_name": "Люстра", "attributes": {
+            "friendly_name": "Люстра", "entity_id": ["light.room_chandelier_bulb_1", "light.room_chandelier_bulb_2"],
+            "supported_color_modes": ["color_temp"], "icon": "mdi:ceiling-light"}},
+        {"entity_id": "sensor.bedroom_temperature", "friendly_name": "Температура в спальне", "attributes": {
+            "friendly_name": "Температура в спальне", "unit_of_measurement": "°C", "device_class": "temperature"}},
+        {"entity_id": "switch.d666_socket_1", "friendly_name": "D666 Розетка 1", "attributes": {}},
+    ])
+
+
+def test_lookup_by_id_and_domain(registry):
+    assert registry.get("sensor.bedroom_temperature").unit == "°C"
+    assert [r.entity_id for r in registry.by_domain(["light", "switch"])] == ["light.room_chandelier", "switch.d666_socket_1"]
+    assert registry.by_domain(["climate"]) == []
+    assert len(registry) == 3
+
+
+def test_only_used_attributes_are_kept(registry):
+    record = registry.get("light.room_chandelier")
+    assert record.members == ("light.room_chandelier_bulb_1", "light.room_chandelier_bulb_2")
+    assert not hasattr(record, "__dict__")
+    assert not hasattr(record, "attributes")
+
+
+def test_alias_lookup_is_normalized(registry):
+    assert [r.entity_id for r in registry.find_by_alias("d666 розетка 1!")] == ["switch.d666_socket_1"]
+    assert [r.entity_id for r in registry.find_by_alias("bedroom_temperature")] == ["sensor.bedroom_temperature"]
+
+
+def test_strings_are_interned(registry_module):
+    first = registry_module.EntityRecord("sensor." + "kitchen_humidity".upper().lower())
+    second = registry_module.EntityRecord("sensor.kitchen_humidity")
+    assert first.entity_id is second.entity_id
+    assert first.domain is second.domain
+
+
+def test_replace_and_remove_keep_indices_consistent(registry, registry_module):
+    registry.add(registry_module.EntityRecord("switch.d666_socket_1", friendly_name="Розетка у окна"))
+    assert registry.find_by_alias("d666 розетка 1") == []
+    assert [r.entity_id for r in registry.find_by_alias("розетка у окна")] == ["switch.d666_socket_1"]
+    registry.remove("switch.d666_socket_1")
+    assert "switch.d666_socket_1" not in registry
+    assert registry.by_domain(["switch"]) == []
+    assert registry.find_by_alias("розетка у окна") == []
@@ -0,0 +1,112 @@
+"""Scale tests against the synthetic Home Assistant.
+
+Bounds are deliberately loose (an order of magnitude above what a laptop
+measures) so they catch algorithmic regressions, not noise. Run with ``-s``
+to see the measured numbers.
+"""
+import importlib
+import time
+import tracemalloc
+from unittest import mock
+
+import pytest
+
+from fake_ha import FakeHomeAssistant, synthetic_states
+from helpers import wait_until
+
+ENTITY_COUNTS = [100, 1000, 10000]
+
+
+@pytest.fixture(scope="module")
+def modules(add_project_root_to_sys_path):
+    return (importlib.import_module('app.adapters.ha_adapter'),
+            importlib.import_module('app.capability_manager'),
+            importlib.import_module('app.entity_registry'))
+
+
+@pytest.fixture
+def fake_ha(request):
+    """Overrides conftest's hand-written install: a synthetic one with ``request.param`` entities."""
+    server = FakeHomeAssistant(synthetic_states(request.param))
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.mark.parametrize("fake_ha", ENTITY_COUNTS, indirect=True)
+def test_prompt_build_memory_and_lookup_scale(monkeypatch, tmp_path, modules, make_adapter, fake_ha):
+    _, capability_module, registry_module = modules
+    count = len(fake_ha.states)
+    adapter = make_adapter()
+
+    started = time.perf_counter()
+    entities = adapter.get_all_entities()
+    fetch_s = time.perf_counter() - started
+    assert len(entities) == count
+
+    tracemalloc.start()
+    registry = registry_module.EntityRegistry.from_entities(entities)
+    registry_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    monkeypatch.setattr(capability_module, "load_settings", mock.Mock(return_value={
+        "home_assistant": {"prompt_sensor_top_k": 15, "snapshot_path": str(tmp_path / "snapshot.json")}
+    }))
+    manager = capability_module.CapabilityManager(ha_adapter=adapter)
+    started = time.perf_counter()
+    prompt = manager.generate_device_list_string("какая температура на кухне")
+    prompt_s = time.perf_counter() - started
+    sensor_lines = [line for line in prompt.splitlines() if line.startswith("- Датчик")]
+
+    sample_ids = [e["entity_id"] for e in entities[::max(1, count // 100)]]
+    started = time.perf_counter()
+    for _ in range(10):
+        for entity_id in sample_ids:
+            registry.get(entity_id)
+            registry.find_by_alias(entity_id.split(".", 1)[1])
+    lookup_us = (time.perf_counter() - started) / (10 * len(sample_ids)) * 1e6
+
+    print(f"\n[{count} entities] fetch {fetch_s * 1000:.0f} ms, registry {registry_bytes / count:.0f} B/entity, "
+          f"prompt {prompt_s * 1000:.1f} ms ({len(sensor_lines)} sensors, {len(prompt)} chars), lookup {lookup_us:.2f} us")
+
+    assert len(sensor_lines) <= 15
+    assert "Температура Кухня" in sensor_lines[0]
+    assert registry_bytes / count < 4096
+    assert prompt_s < 2.0
+    assert lookup_us < 100
+
+
+@pytest.mark.parametrize("fake_ha", [10000], indirect=True)
+def test_state_mirror_keeps_up_with_event_stream(make_adapter, fake_ha):
+    adapter = make_adapter(state_mirror=True)
+    adapter.start_state_mirror()
+    try:
+        assert adapter.wait_for_state_mirror(timeout=30)
+        assert wait_until(lambda: fake_ha.subscriber_count == 1)
+        started = time.perf_counter()
+        fake_ha.emit_random_updates(200)
+        last_id = max((s for s in fake_ha.states.values()), key=lambda s: s["last_updated"])["entity_id"]
+        expected = fake_ha.states[last_id]["state"]
+        assert wait_until(lambda: adapter.get_entity_state(last_id)["state"] == expected, timeout=10)
+        print(f"\n[10000 entities] 200 state_changed events mirrored in {(time.perf_counter() - started) * 1000:.0f} ms")
+    finally:
+        adapter.stop_state_mirror()
+
+
+@pytest.mark.parametrize("fake_ha", [100], indirect=True)
+def test_injected_latency_and_errors(make_adapter, fake_ha):
+    adapter = make_adapter()
+    entity_id = next(iter(fake_ha.states))
+
+    fake_ha.latency_seconds = 0.2
+    started = time.perf_counter()
+    assert adapter.get_entity_state(entity_id) is not None
+    assert time.perf_counter() - started >= 0.2
+
+    fake_ha.latency_seconds = 0.0
+    fake_ha.error_rate = 1.0
+    assert adapter.get_all_entities() is None
+    result = adapter.call_service({"service": "light.turn_on", "target": {"entity_id": entity_id}})
+    assert result["success"] is False
+    assert result["error"] == "Ошибка HTTP: 500"
+    assert fake_ha.injected_errors == 2
@@ -0,0 +1,69 @@
+import importlib
+
+import pytest
+
+from helpers import wait_until
+
+
+@pytest.fixture
+def adapter(make_adapter):
+    return make_adapter(state_mirror=True)
+
+
+def test_websocket_url_is_derived_from_base_url(adapter, fake_ha):
+    assert adapter.websocket_url == fake_ha.base_url.replace("http://", "ws://") + "/api/websocket"
+
+
+def test_entity_state_falls_back_to_rest_without_mirror(adapter):
+    state = adapter.get_entity_state("sensor.bedroom_temperature")
+    assert state["state"] == "21.5"
+    assert state["friendly_name"] == "Температура в спальне"
+    assert adapter.get_entity_state("sensor.missing") is None
+
+
+def test_mirror_serves_states_from_memory(adapter, fake_ha):
+    adapter.start_state_mirror()
+    assert adapter.wait_for_state_mirror(timeout=5)
+    requests_after_sync = fake_ha.rest_state_requests
+    for _ in range(10):
+        assert adapter.get_entity_state("sensor.bedroom_temperature")["state"] == "21.5"
+    assert fake_ha.rest_state_requests == requests_after_sync
+
+
+def test_mirror_applies_state_changed_events(adapter, fake_ha):
+    adapter.start_state_mirror()
+    assert adapter.wait_for_state_mirror(timeout=5)
+    assert wait_until(lambda: fake_ha.subscriber_count == 1)
+    fake_ha.set_state("light.room_nightlight_1", "on")
+    assert wait_until(lambda: adapter.get_entity_state("light.room_nightlight_1")["state"] == "on")
+
+
+def test_mirror_resyncs_over_rest_after_reconnect(adapter, fake_ha):
+    adapter.start_state_mirror()
+    assert adapter.wait_for_state_mirror(timeout=5)
+    assert wait_until(lambda: fake_ha.subscriber_count == 1)
+    fake_ha.set_state_silently("sensor.bedroom_temperature", "19.0")
+    fake_ha.drop_connections()
+    assert wait_until(lambda: fake_ha.rest_state_requests >= 2 and adapter.state_mirror_ready)
+    assert adapter.get_entity_state("sensor.bedroom_temperature")["state"] == "19.0"
+
+
+def test_handler_reports_sensor_from_mirror(adapter, fake_ha):
+    handler_module = importlib.import_module('app.intent_handlers.ha_service_handler')
+    adapter.start_state_mirror()
+    assert adapter.wait_for_state_mirror(timeout=5)
+    handler = handler_module.HomeAssistantServiceHandler(ha_adapter=adapter)
+    result = handler.handle({"service": "sensor.report_state", "target": {"entity_id": ["sensor.bedroom_temperature"]}})
+    assert result["success"] is True
+    assert "Температура в спальне: 21.5°C" in result["message_for_user"]
+
+
+def test_event_listeners_receive_subscribed_events(adapter, fake_ha):
+    received = []
+    adapter.add_event_listener("entity_registry_updated", received.append)
+    adapter.start_state_mirror()
+    assert adapter.wait_for_state_mirror(timeout=5)
+    assert wait_until(lambda: fake_ha.subscriber_count == 1)
+    fake_ha.fire_event("entity_registry_updated", {"action": "update", "entity_id": "light.room_nightlight_1"})
+    assert wait_until(lambda: len(received) == 1)
+    assert received[0]["data"]["entity_id"] == "light.room_nightlight_1"
@@ -0,0 +1,47 @@
+import pytest
+
+
+@pytest.fixture
+def adapter(make_adapter):
+    adapter = make_adapter(state_mirror=True, elide_noop_calls=True)
+    adapter.start_state_mirror()
+    assert adapter.wait_for_state_mirror(timeout=5)
+    return adapter
+
+
+def call(adapter, service, entity_id, **service_data):
+    return adapter.call_service({"service": service, "target": {"entity_id": entity_id}, "service_data": service_data})
+
+
+def test_call_for_entity_already_in_state_is_skipped(adapter, fake_ha):
+    result = call(adapter, "light.turn_off", "light.room_nightlight_1")
+    assert result["success"] is True
+    assert result["elided"] is True
+    assert result["elided_entities"] == ["light.room_nightlight_1"]
+    assert result["message"] == "Уже выключено: Ночник."
+    assert fake_ha.service_calls == []
+
+
+def test_group_is_expanded_and_only_changing_members_are_sent(adapter, fake_ha):
+    result = call(adapter, "light.turn_on", "light.room_chandelier")
+    assert result["success"] is True
+    assert "elided" not in result
+    assert result["elided_entities"] == ["light.room_chandelier_bulb_1"]
+    assert fake_ha.service_calls == [("light.turn_on", {"entity_id": ["light.room_chandelier_bulb_2"]})]
+
+
+def test_turn_on_with_attributes_is_never_skipped(adapter, fake_ha):
+    call(adapter, "light.turn_on", "light.room_chandelier_bulb_1", brightness_pct=30)
+    assert fake_ha.service_calls == [("light.turn_on", {"entity_id": "light.room_chandelier_bulb_1", "brightness_pct": 30})]
+
+
+def test_unknown_entities_are_passed_through(adapter, fake_ha):
+    call(adapter, "switch.turn_off", ["switch.unknown", "light.backlight_1"])
+    assert fake_ha.service_calls == [("switch.turn_off", {"entity_id": ["switch.unknown"]})]
+
+
+def test_elision_disabled_without_mirror(make_adapter, fake_ha):
+    adapter = make_adapter(elide_noop_calls=True)
+    result = call(adapter, "light.turn_off", "light.room_nightlight_1")
+    assert "elided" not in result
+    assert len(fake_ha.service_calls) == 1
@@ -0,0 +1,75 @@
+import importlib
+from unittest import mock
+
+import pytest
+
+from helpers import wait_until
+
+
+@pytest.fixture
+def adapter(make_adapter):
+    adapter = make_adapter(state_mirror=True, optimistic_execution=True, confirmation_timeout_seconds=0.3)
+    adapter.start_state_mirror()
+    assert adapter.wait_for_state_mirror(timeout=5)
+    return adapter
+
+
+def turn_on(entity_id):
+    return {"service": "light.turn_on", "target": {"entity_id": entity_id}}
+
+
+def test_call_is_accepted_and_confirmed_by_state_changed(adapter, fake_ha):
+    correction = mock.Mock()
+    result = adapter.call_service(turn_on("light.room_nightlight_1"), on_correction=correction)
+    assert result["success"] is True
+    assert result["optimistic"] is True
+    assert result["pending_confirmation"] == ["light.room_nightlight_1"]
+    assert wait_until(lambda: adapter.confirmations.latency_stats().get("light.room_nightlight_1", {}).get("confirmed") == 1)
+    assert fake_ha.states["light.room_nightlight_1"]["state"] == "on"
+    correction.assert_not_called()
+
+
+def test_unresponsive_device_triggers_correction(adapter, fake_ha):
+    fake_ha.unresponsive.add("light.backlight_1")
+    correction = mock.Mock()
+    result = adapter.call_service(turn_on("light.backlight_1"), on_correction=correction)
+    assert result["success"] is True
+    assert wait_until(lambda: correction.called)
+    assert "Подсветка" in correction.call_args.args[0]
+    assert adapter.confirmations.latency_stats()["light.backlight_1"]["timeouts"] == 1
+
+
+def test_device_already_in_target_state_is_confirmed_immediately(adapter, fake_ha):
+    correction = mock.Mock()
+    adapter.call_service({"service": "light.turn_off", "target": {"entity_id": ["light.room_nightlight_1"]}}, on_correction=correction)
+    assert not adapter.confirmations.is_pending("light.room_nightlight_1")
+    assert wait_until(lambda: len(fake_ha.service_calls) == 1)
+    correction.assert_not_called()
+
+
+def test_toggle_targets_opposite_of_mirrored_state(adapter):
+    assert adapter._expected_states("toggle", {"entity_id": "light.room_nightlight_1"}) == {"light.room_nightlight_1": "on"}
+
+
+def test_unpredictable_calls_stay_synchronous(adapter, fake_ha):
+    result = adapter.call_service({"service": "light.turn_on", "target": {"entity_id": "sensor.bedroom_temperature"}})
+    assert result["success"] is True
+    assert "optimistic" not in result
+    assert len(fake_ha.service_calls) == 1
+
+
+def test_failed_call_sends_correction(adapter, monkeypatch):
+    correction = mock.Mock()
+    monkeypatch.setattr(adapter, "_post_service", mock.Mock(return_value={"success": False, "error": "Ошибка HTTP: 500"}))
+    adapter.call_service(turn_on("light.room_nightlight_1"), on_correction=correction)
+    assert wait_until(lambda: correction.called)
+    assert "Ошибка HTTP: 500" in correction.call_args.args[0]
+
+
+def test_handler_passes_correction_callback(adapter):
+    handler_module = importlib.import_module('app.intent_handlers.ha_service_handler')
+    handler = handler_module.HomeAssistantServiceHandler(ha_adapter=adapter)
+    correction = mock.Mock()
+    with mock.patch.object(adapter, "call_service", return_value={"success": True, "message": "ok"}) as call_service:
+        handler.handle(turn_on("light.room_nightlight_1"), on_correction=correction)
+    call_service.assert_called_once_with(turn_on("light.room_nightlight_1"), on_correction=correction)
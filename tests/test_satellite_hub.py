@@ -0,0 +1,192 @@
+import asyncio
+import importlib
+import json
+
+import numpy as np
+import pytest
+
+from helpers import wait_until
+
+RATE = 16000
+FRAME = 512
+
+
+def tone(seconds: float, frequency: float, amplitude: int) -> np.ndarray:
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+
+
+def noise(seconds: float, level: int = 50, seed: int = 0) -> np.ndarray:
+    return (level * np.random.default_rng(seed).standard_normal(int(seconds * RATE))).astype(np.int16)
+
+
+def utterance(volume: float = 1.0, command_seconds: float = 1.0) -> np.ndarray:
+    """Noise for calibration, a 1 kHz "wake word", a 200 Hz "command", then silence."""
+    return np.concatenate([
+        noise(1.0),
+        tone(0.2, 1000, int(8000 * volume)),
+        noise(0.1, seed=1),
+        tone(command_seconds, 200, int(6000 * volume)),
+        noise(1.5, seed=2),
+    ])
+
+
+class FakeWakeWord:
+    """Porcupine stand-in: fires when a run of 5+ loud high-pitched (1 kHz) frames ends, i.e. after the "keyword"."""
+
+    sample_rate = RATE
+    frame_length = FRAME
+
+    def __init__(self):
+        self.run = 0
+        self.deleted = False
+
+    def process(self, frame) -> int:
+        frame = np.asarray(frame, dtype=np.float32)
+        crossings = np.count_nonzero(np.signbit(frame[1:]) != np.signbit(frame[:-1]))
+        loud_and_high = np.sqrt(np.mean(frame * frame)) > 500 and crossings > 40
+        if loud_and_high:
+            self.run += 1
+            return -1
+        detected, self.run = self.run >= 5, 0
+        return 0 if detected else -1
+
+    def delete(self):
+        self.deleted = True
+
+
+@pytest.fixture(scope="module")
+def hub_module(add_project_root_to_sys_path):
+    return importlib.import_module('interfaces.satellite_hub')
+
+
+@pytest.fixture(scope="module")
+def replay_module(add_project_root_to_sys_path):
+    return importlib.import_module('interfaces.satellite_replay')
+
+
+def make_session(hub_module, **endpointing):
+    endpointing = {"silence_seconds": 0.5, "min_seconds": 0.5, "no_speech_seconds": 1.0,
+                   "min_threshold": 100, "calibration_seconds": 0.5, **endpointing}
+    return hub_module.SatelliteSession("kitchen", FakeWakeWord(), endpointing)
+
+
+def feed_all(session, pcm: np.ndarray, chunk: int = 3000) -> list:
+    data = pcm.tobytes()
+    events = []
+    for i in range(0, len(data), chunk):
+        events.extend(session.feed(data[i:i + chunk]))
+    return events
+
+
+def test_session_records_command_after_wake_word(hub_module):
+    session = make_session(hub_module)
+    events = feed_all(session, utterance())
+    assert [event["type"] for event in events] == ["wake", "command"]
+    assert session.calibrated
+    assert events[0]["score"] > 10
+    command = events[1]
+    assert command["reason"] == "silence"
+    # Pre-roll + the rest of the wake tone + the 1 s command + at most 0.2 s of kept silence
+    assert 1.0 < len(command["pcm"]) / RATE < 1.8
+
+
+def test_session_reports_no_speech_and_listens_again(hub_module):
+    session = make_session(hub_module)
+    pcm = np.concatenate([noise(1.0), tone(0.2, 1000, 8000), noise(1.5, seed=3), utterance()])
+    events = feed_all(session, pcm)
+    assert [event["type"] for event in events] == ["wake", "no_speech", "wake", "command"]
+
+
+def test_session_flushes_command_when_stream_closes(hub_module):
+    session = make_session(hub_module)
+    events = feed_all(session, np.concatenate([noise(1.0), tone(0.2, 1000, 8000), tone(0.8, 200, 6000)]))
+    assert [event["type"] for event in events] == ["wake"]
+    assert session.finish()["reason"] == "stream_closed"
+    session.close()
+    assert session.detector.deleted
+
+
+def test_arbiter_groups_close_triggers_and_picks_loudest(hub_module):
+    now = [0.0]
+    arbiter = hub_module.TriggerArbiter(window_seconds=0.5, clock=lambda: now[0])
+    kitchen = arbiter.claim("kitchen", 40.0)
+    now[0] = 0.2
+    hall = arbiter.claim("hall", 12.0)
+    assert kitchen == hall
+    assert arbiter.is_winner("kitchen", kitchen)
+    assert not arbiter.is_winner("hall", hall)
+    now[0] = 2.0
+    later = arbiter.claim("hall", 5.0)
+    assert later != kitchen
+    assert arbiter.is_winner("hall", later)
+
+
+def test_hub_deduplicates_rooms_and_routes_command_with_room(hub_module, replay_module):
+    submitted = []
+
+    async def scenario():
+        hub = hub_module.SatelliteHub(FakeWakeWord, submitted.append,
+                                      endpointing={"silence_seconds": 0.5, "min_threshold": 100,
+                                                   "calibration_seconds": 0.5},
+                                      dedupe_window_seconds=0.5)
+        server = await hub.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            results = await asyncio.gather(
+                replay_module.replay(utterance(volume=1.0), "kitchen", port=port, speed=4, tail_seconds=0.5),
+                replay_module.replay(utterance(volume=0.3), "hall", port=port, speed=4, tail_seconds=0.5),
+            )
+            assert wait_until(lambda: len(submitted) >= 1)
+            return hub, results
+        finally:
+            await hub.stop()
+
+    hub, (kitchen_events, hall_events) = asyncio.run(scenario())
+    assert [event["event"] for event in kitchen_events] == ["ready", "wake", "command"]
+    assert kitchen_events[-1]["accepted"] is True
+    assert [event["event"] for event in hall_events] == ["ready", "wake", "duplicate"]
+    assert [command["room"] for command in submitted] == ["kitchen"]
+    assert submitted[0]["sample_rate"] == RATE and len(submitted[0]["pcm"]) > RATE
+    assert hub.duplicates == 1 and hub.commands == 1
+    assert hub.sessions == {}
+
+
+def test_hub_accepts_framed_stream(hub_module, replay_module):
+    submitted = []
+
+    async def scenario():
+        hub = hub_module.SatelliteHub(FakeWakeWord, submitted.append,
+                                      endpointing={"silence_seconds": 0.5, "min_threshold": 100,
+                                                   "calibration_seconds": 0.5})
+        server = await hub.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            events = await replay_module.replay(utterance(), "kitchen", port=port, speed=0, codec="pcm16")
+            assert wait_until(lambda: len(submitted) >= 1)
+            return events
+        finally:
+            await hub.stop()
+
+    events = asyncio.run(scenario())
+    assert [event["event"] for event in events] == ["ready", "wake", "command"]
+    assert submitted[0]["room"] == "kitchen"
+
+
+def test_hub_rejects_header_without_room(hub_module):
+    async def scenario():
+        hub = hub_module.SatelliteHub(FakeWakeWord, lambda command: None)
+        server = await hub.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b'{"sample_rate": 16000}\n')
+            reply = json.loads(await reader.readline())
+            writer.close()
+            return reply
+        finally:
+            await hub.stop()
+
+    reply = asyncio.run(scenario())
+    assert reply["event"] == "error"
+    assert "room" in reply["message"]
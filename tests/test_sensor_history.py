@@ -0,0 +1,97 @@
+import importlib
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def history_module(add_project_root_to_sys_path):
+    return importlib.import_module('app.sensor_history')
+
+
+def state_event(entity_id, state, timestamp):
+    updated = datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+    return {"event_type": "state_changed", "data": {"entity_id": entity_id, "new_state": {"state": state, "last_updated": updated}}}
+
+
+def test_stats_over_window_from_raw_samples(history_module):
+    store = history_module.SensorHistoryStore()
+    for i, value in enumerate([20.0, 18.5, 22.0, 21.0]):
+        store.record("sensor.t", 1000.0 + i * 10, value)
+    stats = store.stats("sensor.t", 1000.0, 1040.0)
+    assert stats["min"] == 18.5
+    assert stats["max"] == 22.0
+    assert stats["avg"] == pytest.approx(20.375)
+    assert stats["count"] == 4
+    assert stats["resolution_seconds"] == 0
+    assert store.stats("sensor.t", 1015.0, 1040.0)["count"] == 2
+    assert store.stats("sensor.unknown", 0, 1) is None
+
+
+def test_wrapped_raw_buffer_falls_back_to_downsampled_tier(history_module):
+    store = history_module.SensorHistoryStore(raw_capacity=8, tiers=((60, 100),))
+    for i in range(600):
+        store.record("sensor.t", 60_000.0 + i, float(i % 60))
+    recent = store.stats("sensor.t", 60_595.0, 60_600.0)
+    assert recent["resolution_seconds"] == 0
+    assert recent["count"] == 5
+    whole = store.stats("sensor.t", 60_000.0, 60_600.0)
+    assert whole["resolution_seconds"] == 60
+    assert whole["count"] == 600
+    assert whole["min"] == 0.0
+    assert whole["max"] == 59.0
+    assert whole["avg"] == pytest.approx(29.5)
+
+
+def test_state_changed_listener_filters_and_parses(history_module):
+    store = history_module.SensorHistoryStore(entity_filter=lambda entity_id: entity_id.startswith("sensor."))
+    store.handle_state_changed(state_event("sensor.t", "21.5", 5000.0))
+    store.handle_state_changed(state_event("sensor.t", "unavailable", 5001.0))
+    store.handle_state_changed(state_event("light.l", "1", 5002.0))
+    assert store.stats("sensor.t", 4000.0, 6000.0)["count"] == 1
+    assert store.stats("light.l", 4000.0, 6000.0) is None
+
+
+def test_out_of_order_samples_are_dropped(history_module):
+    store = history_module.SensorHistoryStore()
+    store.record("sensor.t", 100.0, 1.0)
+    store.record("sensor.t", 50.0, 100.0)
+    assert store.stats("sensor.t", 0.0, 200.0)["max"] == 1.0
+
+
+def test_memmap_persistence_survives_restart(history_module, tmp_path):
+    store = history_module.SensorHistoryStore(raw_capacity=16, tiers=((60, 10),), persist_dir=tmp_path)
+    for i in range(20):
+        store.record("sensor.t", 1000.0 + i, float(i))
+    store.flush()
+    restored = history_module.SensorHistoryStore(raw_capacity=16, tiers=((60, 10),), persist_dir=tmp_path)
+    stats = restored.stats("sensor.t", 1004.0, 1020.0)
+    assert stats["count"] == 16
+    assert stats["max"] == 19.0
+    restored.record("sensor.t", 1010.0, 500.0)
+    assert restored.stats("sensor.t", 1004.0, 1020.0)["max"] == 19.0
+
+
+def test_period_window_resolves_to_last_night(history_module):
+    now = datetime(2026, 10, 19, 9, 30).timestamp()
+    start, end = history_module.resolve_time_window({"period": "night"}, now=now)
+    assert datetime.fromtimestamp(start) == datetime(2026, 10, 19, 0, 0)
+    assert datetime.fromtimestamp(end) == datetime(2026, 10, 19, 6, 0)
+    start, end = history_module.resolve_time_window({"period": "evening"}, now=now)
+    assert datetime.fromtimestamp(start) == datetime(2026, 10, 18, 18, 0)
+    assert history_module.resolve_time_window({"window_minutes": 30}, now=now) == (now - 1800, now)
+
+
+def test_handler_answers_history_from_store(history_module):
+    handler_module = importlib.import_module('app.intent_handlers.ha_service_handler')
+    store = history_module.SensorHistoryStore()
+    store.stats = mock.Mock(return_value={"min": 18.0, "max": 22.0, "avg": 20.0, "count": 42, "resolution_seconds": 60})
+    adapter = mock.Mock(base_url="http://ha.test")
+    adapter.get_entity_state.return_value = {"friendly_name": "Температура в спальне", "attributes": {"unit_of_measurement": "°C"}}
+    handler = handler_module.HomeAssistantServiceHandler(ha_adapter=adapter, sensor_history=store)
+    result = handler.handle({"service": "sensor.history_stats", "target": {"entity_id": "sensor.bedroom_temperature"},
+                             "service_data": {"period": "night", "stat": "min"}})
+    assert result["success"] is True
+    assert "Температура в спальне: минимум 18.0°C" in result["message_for_user"]
+    adapter.call_service.assert_not_called()
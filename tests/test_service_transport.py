@@ -0,0 +1,116 @@
+import importlib
+import importlib.util
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BENCHMARK_SCRIPT = PROJECT_ROOT / "scripts" / "transport_benchmark.py"
+RATE = 16000
+
+
+@pytest.fixture(scope="module")
+def transport(add_project_root_to_sys_path):
+    return importlib.import_module('app.service_transport')
+
+
+@pytest.fixture(scope="module")
+def benchmark():
+    spec = importlib.util.spec_from_file_location("transport_benchmark", BENCHMARK_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def uds_server(benchmark, tmp_path):
+    """The benchmark's decode-only STT app served on a Unix socket under tmp_path."""
+    path = str(tmp_path / "stt.sock")
+    server = benchmark.start_server(benchmark.build_app(), uds=path)
+    yield path
+    server.should_exit = True
+
+
+def uds_config(path: str, **endpoints) -> dict:
+    return {"transport": {"mode": "uds", "sockets": {"nox_stt": path}},
+            "api_endpoints": {"nox_stt": "http://nox/transcribe", **endpoints}}
+
+
+def test_socket_path_follows_transport_mode(transport, monkeypatch):
+    assert transport.socket_path({}, transport.SERVICE_STT) is None
+    assert transport.socket_path({"transport": {"mode": "tcp"}}, transport.SERVICE_CORE) is None
+    uds = {"transport": {"mode": "uds"}}
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert transport.socket_path(uds, transport.SERVICE_CORE) == "/run/user/1000/nox/core.sock"
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert transport.socket_path(uds, transport.SERVICE_CORE) == str(PROJECT_ROOT / "run" / "core.sock")
+    config = {"transport": {"mode": "uds", "sockets": {"nox_stt": "/run/nox/stt.sock", "nox_core": "run/core.sock"}}}
+    assert transport.socket_path(config, transport.SERVICE_STT) == "/run/nox/stt.sock"
+    assert transport.socket_path(config, transport.SERVICE_CORE) == str(PROJECT_ROOT / "run" / "core.sock")
+    with pytest.raises(ValueError):
+        transport.transport_mode({"transport": {"mode": "pipe"}})
+
+
+def test_socket_dir_is_private_and_foreign_dirs_are_refused(transport, tmp_path):
+    path = tmp_path / "nox" / "core.sock"
+    transport.prepare_socket(str(path))
+    assert (path.parent.stat().st_mode & 0o777) == 0o700
+
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError, match="на запись"):
+        transport.prepare_socket(str(shared / "core.sock"))
+    config = {"transport": {"mode": "uds", "sockets": {"nox_core": str(shared / "core.sock")}}}
+    with pytest.raises(PermissionError):
+        transport.make_http_client(config, transport.SERVICE_CORE)
+
+    if os.getuid() == 0:  # Only root can hand a directory to another user
+        foreign = tmp_path / "foreign"
+        foreign.mkdir(mode=0o700)
+        os.chown(foreign, 12345, -1)
+        with pytest.raises(PermissionError, match="другому пользователю"):
+            transport.prepare_socket(str(foreign / "core.sock"))
+
+
+def test_raw_pcm_honours_rate_and_channels(add_project_root_to_sys_path):
+    audio_io = importlib.import_module('app.audio_io')
+    stereo_8k = np.full(8000 * 2, 16384, dtype="<i2").tobytes()
+    audio = audio_io.decode_audio(stereo_8k, None, "audio/l16; rate=8000; channels=2")
+    assert len(audio) == RATE
+    assert np.allclose(audio[100:-100], 0.5, atol=0.01)
+    with pytest.raises(audio_io.AudioDecodeError):
+        audio_io.decode_audio(stereo_8k, None, "audio/l16; rate=fast")
+
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_uploader_over_unix_socket(transport, uds_server, raw):
+    audio_pipeline = importlib.import_module('interfaces.audio_pipeline')
+    config = uds_config(uds_server, **({"nox_stt_raw": "http://nox/transcribe/raw"} if raw else {}))
+    client = transport.make_http_client(config, transport.SERVICE_STT)
+    samples = np.zeros(RATE // 2, dtype=np.int16)
+    try:
+        files = None if raw else {"file": ("command.wav", audio_pipeline.encode_wav(samples, RATE), "audio/wav")}
+        response = (client.post("http://nox/transcribe/raw", content=samples.tobytes(),
+                                headers={"Content-Type": transport.raw_pcm_content_type(RATE)})
+                    if raw else client.post("http://nox/transcribe", files=files))
+        assert response.json() == {"samples": RATE // 2}
+    finally:
+        client.close()
+
+    uploader = audio_pipeline.STTUploader(config)
+    try:
+        # The decode-only app answers without "text": no speech, not an error
+        assert uploader.transcribe(samples, RATE) == ""
+        assert list(uploader.encoder.stats.snapshot()) == (["l16"] if raw else ["pcm16"])
+    finally:
+        uploader.close()
+
+
+def test_benchmark_compares_all_cases(benchmark):
+    report = benchmark.run_benchmark(requests=3, seconds=0.5)
+    assert [(r["transport"], r["upload"]) for r in report["results"]] == benchmark.DEFAULT_CASES
+    assert report["payload_bytes"]["raw"] == RATE
+    assert all(r["latency_ms"]["p50"] > 0 and r["requests_per_second"] > 0 for r in report["results"])
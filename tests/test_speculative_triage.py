@@ -0,0 +1,203 @@
+import importlib
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from helpers import wait_until
+
+
+@pytest.fixture(scope="module")
+def speculative_module(add_project_root_to_sys_path):
+    return importlib.import_module('app.speculative_triage')
+
+
+@pytest.fixture
+def speculation(speculative_module):
+    """Triage answers home_assistant_action; tests swap .triage, .version or .take_timeout as needed."""
+    spec = speculative_module.SpeculativeTriage(
+        triage=mock.Mock(return_value={"intent": "home_assistant_action"}),
+        prepare_ha_prompt=mock.Mock(side_effect=lambda text: f"PROMPT[{text}]"),
+        version=lambda: 1,
+    )
+    yield spec
+    spec.shutdown()
+
+
+def test_matching_final_commits_speculation(speculation):
+    speculation.speculate("s1", "Включи свет в спальне")
+    prepared = speculation.take("s1", "включи свет в спальне.")
+    assert prepared["triage_result"] == {"intent": "home_assistant_action"}
+    assert prepared["ha_prompt"] == "PROMPT[Включи свет в спальне]"
+    assert speculation.stats()["committed"] == 1
+    assert speculation.take("s1", "включи свет в спальне") is None
+
+
+def test_changed_final_is_redone(speculation):
+    speculation.speculate("s1", "включи свет")
+    assert speculation.take("s1", "включи свет в спальне") is None
+    assert speculation.stats()["redone"] == 1
+
+
+def test_newer_partial_replaces_older(speculation):
+    speculation.speculate("s1", "включи")
+    speculation.speculate("s1", "включи свет")
+    speculation.speculate("s1", "Включи свет!")  # Same normalized text: not triaged again
+    assert speculation.take("s1", "включи свет")["text"] == "включи свет"
+    assert speculation.triage.call_count <= 2
+
+
+def test_superseded_partials_are_not_triaged(speculation):
+    triaged, release = [], threading.Event()
+
+    def slow_triage(text):
+        triaged.append(text)
+        release.wait(5)
+        return {"intent": "home_assistant_action"}
+
+    speculation.triage = slow_triage
+    speculation.speculate("s1", "включи")
+    assert wait_until(lambda: triaged == ["включи"])
+    # Partials keep coming while the first triage is still on the LLM
+    for text in ["включи свет", "включи свет в", "включи свет в спальне"]:
+        speculation.speculate("s1", text)
+    release.set()
+    assert wait_until(lambda: speculation._sessions["s1"].future.done())
+    # Only the one already running and the newest partial reached the LLM
+    assert triaged == ["включи", "включи свет в спальне"]
+    assert speculation.take("s1", "включи свет в спальне")["text"] == "включи свет в спальне"
+
+
+def test_final_does_not_queue_behind_a_stale_speculation(speculation):
+    triaged, release = [], threading.Event()
+
+    def slow_triage(text):
+        triaged.append(text)
+        release.wait(5)
+        return {"intent": "home_assistant_action"}
+
+    speculation.triage = slow_triage
+    speculation.speculate("s1", "включи")
+    assert wait_until(lambda: triaged == ["включи"])
+    speculation.speculate("s1", "включи свет")
+    try:
+        started = time.perf_counter()
+        assert speculation.take("s1", "включи свет") is None
+        assert time.perf_counter() - started < 0.5
+        assert speculation.stats()["redone"] == 1
+    finally:
+        release.set()
+    time.sleep(0.1)
+    assert triaged == ["включи"]
+
+
+def test_chat_intent_skips_ha_prompt(speculation):
+    speculation.triage.return_value = {"intent": "general_chat"}
+    speculation.speculate("s1", "как дела")
+    assert speculation.take("s1", "как дела")["ha_prompt"] is None
+    speculation.prepare_ha_prompt.assert_not_called()
+
+
+def test_prompt_from_stale_registry_is_dropped(speculation):
+    version = [1]
+    speculation.version = lambda: version[0]
+    speculation.speculate("s1", "включи свет")
+    speculation._sessions["s1"].future.result()
+    version[0] = 2
+    prepared = speculation.take("s1", "включи свет")
+    assert prepared["triage_result"]["intent"] == "home_assistant_action"
+    assert prepared["ha_prompt"] is None
+
+
+def test_final_waits_for_running_speculation(speculation):
+    release = threading.Event()
+
+    def slow_triage(text):
+        release.wait(5)
+        return {"intent": "home_assistant_action"}
+
+    speculation.triage = slow_triage
+    speculation.speculate("s1", "включи свет")
+    threading.Timer(0.1, release.set).start()
+    assert speculation.take("s1", "включи свет")["triage_result"]["intent"] == "home_assistant_action"
+
+
+def test_latency_is_reported_per_path(speculation):
+    speculation.record_latency(True, 0.2)
+    speculation.record_latency(False, 1.5)
+    latency = speculation.stats()["speech_end_to_action"]
+    assert latency["speculative"] == {"count": 1, "p50_ms": 200.0, "max_ms": 200.0}
+    assert latency["regular"]["p50_ms"] == 1500.0
+
+
+def test_final_does_not_wait_forever_for_speculation(speculation):
+    release = threading.Event()
+    speculation.triage = lambda text: release.wait(5) and {"intent": "home_assistant_action"}
+    speculation.take_timeout = 0.1
+    try:
+        speculation.speculate("s1", "включи свет")
+        assert speculation.take("s1", "включи свет") is None
+        assert speculation.stats()["redone"] == 1
+    finally:
+        release.set()
+
+
+@pytest.fixture
+def engine(add_project_root_to_sys_path, speculative_module, monkeypatch):
+    """CoreEngine without Home Assistant/Ollama: LLM calls and the dispatcher are recorded."""
+    core_module = importlib.import_module('app.core_engine')
+    llm_calls = []
+
+    def get_json_from_llm(system_prompt, history):
+        llm_calls.append(system_prompt)
+        if system_prompt == "TRIAGE":
+            return {"intent": "home_assistant_action"}
+        return {"service": "light.turn_on", "target": {"entity_id": "light.room_chandelier"}}
+
+    monkeypatch.setattr(core_module.nlu_engine, "get_json_from_llm", get_json_from_llm)
+    monkeypatch.setattr(core_module.nlu_engine, "generate_natural_response", lambda action_result, history: "Готово")
+    monkeypatch.setattr(core_module.dispatcher, "dispatch", mock.Mock(return_value={"success": True}))
+
+    core = object.__new__(core_module.CoreEngine)
+    core.triage_prompt = "TRIAGE"
+    core.ha_adapter = mock.Mock()
+    core.ha_service_handler_instance = mock.Mock()
+    core.rooms = {}
+    core.capability_manager = mock.Mock(version=1)
+    core._build_ha_prompt = mock.Mock(side_effect=lambda text=None, room=None: f"HA[{text}]")
+    core.speculative_triage = speculative_module.SpeculativeTriage(
+        triage=core._triage, prepare_ha_prompt=core._build_ha_prompt, version=lambda: core.capability_manager.version)
+    core.llm_calls = llm_calls
+    yield core
+    core.speculative_triage.shutdown()
+
+
+def test_engine_commits_speculation_for_matching_final(engine):
+    engine.prepare_partial_command("s1", "включи люстру")
+    engine.speculative_triage._sessions["s1"].future.result(timeout=5)
+    engine.llm_calls.clear()
+    engine._build_ha_prompt.reset_mock()
+
+    result = engine.process_user_command([{"role": "user", "content": "Включи люстру."}],
+                                         is_voice_command=True, session_id="s1")
+
+    assert result["final_status_response"] == "Готово"
+    assert engine.llm_calls == ["HA[включи люстру]"]  # No second triage, speculative prompt reused
+    engine._build_ha_prompt.assert_not_called()
+    stats = engine.speculative_triage.stats()
+    assert stats["committed"] == 1
+    assert stats["speech_end_to_action"]["speculative"]["count"] == 1
+
+
+def test_engine_redoes_triage_when_final_differs(engine):
+    engine.prepare_partial_command("s1", "включи")
+    engine.speculative_triage._sessions["s1"].future.result(timeout=5)
+    engine.llm_calls.clear()
+
+    engine.process_user_command([{"role": "user", "content": "включи ночник"}], is_voice_command=True, session_id="s1")
+
+    assert engine.llm_calls == ["TRIAGE", "HA[включи ночник]"]
+    stats = engine.speculative_triage.stats()
+    assert (stats["committed"], stats["redone"]) == (0, 1)
+    assert stats["speech_end_to_action"]["regular"]["count"] == 1
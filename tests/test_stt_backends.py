@@ -0,0 +1,78 @@
+import importlib
+import multiprocessing
+import time
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def backends(add_project_root_to_sys_path):
+    return importlib.import_module('app.stt_backends')
+
+
+@pytest.fixture
+def fake_backend(backends):
+    class FakeBackend(backends.STTBackend):
+        name = "fake"
+
+        def _transcribe(self, audio):
+            time.sleep(len(audio) / 16000 * 0.1)  # RTF 0.1
+            if not audio.any():
+                raise RuntimeError("silence")
+            return f" {len(audio)} "
+
+        def _transcribe_batch(self, audios):
+            return [f"batch {len(a)}" for a in audios]
+
+    return FakeBackend("tiny")
+
+
+def tone(seconds: float) -> np.ndarray:
+    return np.full(int(seconds * 16000), 0.1, dtype=np.float32)
+
+
+def test_transcribe_strips_text_and_measures_rtf(fake_backend):
+    assert fake_backend.transcribe(tone(0.5)) == "8000"
+    metrics = fake_backend.metrics()
+    assert metrics["backend"] == "fake"
+    assert metrics["requests"] == 1
+    assert metrics["audio_seconds"] == 0.5
+    assert 0.1 <= metrics["rtf"] < 0.5
+
+
+def test_backend_errors_become_none_and_are_not_counted(fake_backend):
+    assert fake_backend.transcribe(np.zeros(1600, dtype=np.float32)) is None
+    assert fake_backend.metrics()["requests"] == 0
+
+
+def test_batch_time_is_split_by_clip_length(fake_backend):
+    assert fake_backend.transcribe_batch([tone(1), tone(3)]) == ["batch 16000", "batch 48000"]
+    metrics = fake_backend.metrics()
+    assert metrics["requests"] == 2
+    assert metrics["audio_seconds"] == 4.0
+
+
+def test_stats_are_shared_with_forked_workers(fake_backend):
+    worker = multiprocessing.get_context("fork").Process(target=fake_backend.transcribe, args=(tone(1),))
+    worker.start()
+    worker.join(10)
+    assert fake_backend.metrics()["requests"] == 1
+    assert fake_backend.metrics()["rtf_p50"] is not None
+
+
+def test_model_id_includes_model_and_language(fake_backend):
+    assert fake_backend.model_id == "fake:tiny:ru"
+
+
+def test_backend_without_transcribe_fails_at_construction(backends):
+    class Incomplete(backends.STTBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError, match="_transcribe"):
+        Incomplete("tiny")
+
+
+def test_unknown_backend_is_rejected(backends):
+    with pytest.raises(ValueError, match="whisper"):
+        backends.create_backend("nope", "small")
@@ -0,0 +1,81 @@
+import asyncio
+import importlib
+import time
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def batching(add_project_root_to_sys_path):
+    return importlib.import_module('app.stt_batching')
+
+
+def clip(n: int) -> np.ndarray:
+    return np.zeros(n, dtype=np.float32)
+
+
+@pytest.fixture
+def batches():
+    return []
+
+
+@pytest.fixture
+def make_batcher(batching, batches):
+    async def run_batch(audios):
+        batches.append([len(a) for a in audios])
+        await asyncio.sleep(0.01)
+        return [f"clip {len(a)}" for a in audios]
+
+    def _make(**options):
+        return batching.MicroBatcher(run_batch, **options)
+    return _make
+
+
+def test_concurrent_requests_share_one_batch(make_batcher, batches):
+    async def run():
+        batcher = make_batcher(max_batch_size=8, max_wait_ms=20)
+        texts = await asyncio.gather(*(batcher.transcribe(clip(n)) for n in (1, 2, 3)))
+        return batcher, texts
+
+    batcher, texts = asyncio.run(run())
+    assert texts == ["clip 1", "clip 2", "clip 3"]
+    assert batches == [[1, 2, 3]]
+    assert batcher.average_batch_size == 3
+
+
+def test_full_batch_is_dispatched_without_waiting(make_batcher, batches):
+    async def run():
+        batcher = make_batcher(max_batch_size=2, max_wait_ms=5000)
+        started = time.perf_counter()
+        texts = await batcher.transcribe_many([clip(n) for n in (1, 2, 3, 4)])
+        return texts, time.perf_counter() - started
+
+    texts, elapsed = asyncio.run(run())
+    assert texts == ["clip 1", "clip 2", "clip 3", "clip 4"]
+    assert batches == [[1, 2], [3, 4]]
+    assert elapsed < 1
+
+
+def test_lone_request_waits_only_max_wait(make_batcher, batches):
+    async def run():
+        batcher = make_batcher(max_batch_size=4, max_wait_ms=30)
+        started = time.perf_counter()
+        await batcher.transcribe(clip(1))
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(run())
+    assert 0.03 <= elapsed < 0.5
+    assert batches == [[1]]
+
+
+def test_batch_failure_reaches_every_caller(batching):
+    async def failing(audios):
+        raise RuntimeError("model crashed")
+
+    async def run():
+        batcher = batching.MicroBatcher(failing, max_batch_size=2)
+        return await asyncio.gather(batcher.transcribe(clip(1)), batcher.transcribe(clip(2)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
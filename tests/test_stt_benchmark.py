@@ -0,0 +1,67 @@
+import importlib.util
+import json
+import subprocess
+import sys
+import wave
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = PROJECT_ROOT / "scripts" / "stt_benchmark.py"
+
+
+@pytest.fixture(scope="module")
+def benchmark():
+    spec = importlib.util.spec_from_file_location("stt_benchmark", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_wav(path: Path, seconds: float):
+    t = np.arange(int(seconds * 16000)) / 16000
+    samples = np.concatenate((np.zeros(8000), 0.3 * np.sin(2 * np.pi * 200 * t), np.zeros(16000)))
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes((samples * 32767).astype("<i2").tobytes())
+
+
+def test_word_error_rate(benchmark):
+    assert benchmark.word_error_rate("Включи свет в спальне", "включи свет в спальне.") == 0
+    assert benchmark.word_error_rate("включи свет", "включи весь свет") == 0.5
+    assert benchmark.word_error_rate("включи свет", "") == 1.0
+
+
+def test_config_parsing(benchmark):
+    assert benchmark.parse_config("backend=faster_whisper,model=small,local_files_only=true,beam_size=1") == {
+        "backend": "faster_whisper", "model": "small", "local_files_only": True, "beam_size": 1}
+    assert benchmark.parse_config("")["backend"] == "stub"
+
+
+def test_benchmark_cli_writes_json_report(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    write_wav(corpus / "light_on.wav", 1.0)
+    (corpus / "light_on.txt").write_text("включи свет", encoding="utf-8")
+    write_wav(corpus / "no_reference.wav", 0.5)
+    output = tmp_path / "report.json"
+
+    subprocess.run([sys.executable, str(SCRIPT), "--corpus", str(corpus),
+                    "--config", "backend=stub,text=включи свет,rtf=0.05",
+                    "--config", "backend=stub,vad=true",
+                    "--output", str(output)], check=True, cwd=PROJECT_ROOT, timeout=120)
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert report["corpus"] == {"path": str(corpus), "files": 2, "with_reference": 1}
+    exact, vad = report["results"]
+    assert exact["wer"] == 0
+    assert exact["rtf"] >= 0.05
+    assert set(exact["latency_ms"]) == {"p50", "p95", "mean"}
+    assert exact["peak_rss_mb"] > 0
+    assert vad["wer"] == 1.0
+    assert vad["trimmed_seconds"] > 1.0
+    assert [f["file"] for f in vad["files"]] == ["light_on.wav", "no_reference.wav"]
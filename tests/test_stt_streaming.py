@@ -0,0 +1,99 @@
+import importlib
+
+import numpy as np
+import pytest
+
+RATE = 16000
+
+
+def tone(seconds: float, amplitude: int = 8000) -> bytes:
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype("<i2").tobytes()
+
+
+def silence(seconds: float) -> bytes:
+    return bytes(2 * int(seconds * RATE))
+
+
+def chunks(pcm: bytes, size: int = 3200):
+    for i in range(0, len(pcm), size):
+        yield pcm[i:i + size]
+
+
+@pytest.fixture(scope="module")
+def streaming(add_project_root_to_sys_path):
+    return importlib.import_module('app.stt_streaming')
+
+
+@pytest.fixture
+def decoded():
+    return []
+
+
+@pytest.fixture
+def make_session(streaming, decoded):
+    def transcribe(audio):
+        decoded.append(len(audio) / RATE)
+        return f"слова {len(decoded)}"
+
+    def _make(**options):
+        return streaming.StreamingTranscriber(transcribe, **options)
+    return _make
+
+
+def feed_all(session, pcm, size=3200):
+    events = []
+    for chunk in chunks(pcm, size):
+        events.extend(session.feed(chunk))
+    return events
+
+
+def test_partials_are_emitted_while_speaking(make_session, decoded):
+    session = make_session(partial_interval=0.5)
+    # 0.15 s chunks: a partial after every 4th chunk
+    events = feed_all(session, tone(2.1), size=4800)
+    assert [e["type"] for e in events] == ["partial"] * 3
+    assert not session.finished
+    # Each partial re-decodes the whole uncommitted window
+    assert decoded == pytest.approx([0.6, 1.2, 1.8])
+
+
+def test_trailing_silence_finalizes(make_session):
+    session = make_session(partial_interval=10, silence_seconds=0.5)
+    events = feed_all(session, tone(1.0) + silence(1.0))
+    assert events[-1]["type"] == "final"
+    assert events[-1]["text"] == "слова 1"
+    assert session.finished
+    # Stopped right after 0.5 s of silence instead of consuming the whole tail
+    assert session.audio_seconds <= 1.65
+    assert session.feed(tone(0.5)) == []
+
+
+def test_end_of_stream_finalizes_with_chunk_remainder(make_session, decoded):
+    session = make_session(partial_interval=10)
+    feed_all(session, tone(0.7), size=1001)
+    final = session.finish()
+    assert final == {"type": "final", "text": "слова 1", "audio_seconds": 0.7}
+    assert decoded == [pytest.approx(0.7, abs=0.001)]
+
+
+def test_leading_silence_does_not_finalize_or_decode(make_session, decoded):
+    session = make_session(silence_seconds=0.3)
+    assert feed_all(session, silence(2.0)) == []
+    assert session.finish()["text"] == ""
+    assert decoded == []
+
+
+def test_long_speech_commits_sliding_window(make_session, decoded):
+    session = make_session(partial_interval=100, window_seconds=1.0)
+    events = feed_all(session, tone(2.5))
+    assert [e["text"] for e in events] == ["слова 1", "слова 1 слова 2"]
+    assert session.finish()["text"] == "слова 1 слова 2 слова 3"
+    # The window never grows much past window_seconds (one chunk of overshoot)
+    assert max(decoded) <= 1.0 + 0.1
+
+
+def test_failed_final_decode_reports_error(streaming):
+    session = streaming.StreamingTranscriber(lambda audio: None, partial_interval=10)
+    feed_all(session, tone(0.5))
+    assert session.finish()["type"] == "error"
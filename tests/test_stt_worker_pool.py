@@ -0,0 +1,140 @@
+import asyncio
+import importlib
+import os
+import time
+
+import numpy as np
+import pytest
+
+from helpers import wait_until
+
+# Stands in for the model loaded by stt_engine before the workers are forked
+LOADED_MODEL = {"name": None}
+
+
+def slow_transcribe(audio):
+    time.sleep(0.3)
+    return f"{LOADED_MODEL['name']}:{len(audio)}:{os.getpid()}"
+
+
+def slow_transcribe_batch(audios):
+    time.sleep(0.3)
+    return [f"batch:{len(audio)}:{os.getpid()}" for audio in audios]
+
+
+@pytest.fixture(scope="module")
+def pool_module(add_project_root_to_sys_path):
+    return importlib.import_module('app.stt_worker_pool')
+
+
+@pytest.fixture
+def make_pool(pool_module):
+    pools = []
+
+    def _make(**options):
+        pool = pool_module.STTWorkerPool(slow_transcribe, **options)
+        pools.append(pool)
+        return pool
+    yield _make
+    for pool in pools:
+        pool.shutdown()
+
+
+def test_workers_are_forked_upfront_and_inherit_loaded_model(make_pool, monkeypatch):
+    monkeypatch.setitem(LOADED_MODEL, "name", "small")
+    pool = make_pool(workers=2, queue_size=0)
+    pool.start()
+    assert len(pool.worker_pids) == 2
+    assert os.getpid() not in pool.worker_pids
+
+    text = pool.transcribe_blocking(np.zeros(16000, dtype=np.float32))
+    model, samples, pid = text.split(":")
+    assert (model, samples) == ("small", "16000")
+    assert int(pid) != os.getpid()
+
+
+def test_requests_run_in_parallel_without_blocking_loop(make_pool):
+    pool = make_pool(workers=2, queue_size=0)
+    pool.start()
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        tick_task = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        results = await asyncio.gather(*(pool.transcribe(np.zeros(10, dtype=np.float32)) for _ in range(2)))
+        elapsed = time.perf_counter() - started
+        tick_task.cancel()
+        return results, elapsed, ticks
+
+    results, elapsed, ticks = asyncio.run(run())
+    assert len({r.split(":")[2] for r in results}) == 2
+    assert elapsed < 0.55
+    assert ticks >= 10
+
+
+def test_full_queue_is_rejected(make_pool, pool_module):
+    pool = make_pool(workers=0, queue_size=1)
+    audio = np.zeros(10, dtype=np.float32)
+    futures = [pool.submit(audio), pool.submit(audio)]
+    with pytest.raises(pool_module.STTPoolBusyError):
+        pool.submit(audio)
+    assert pool.stats()["rejected"] == 1
+    for future in futures:
+        future.result()
+    assert wait_until(lambda: pool.stats()["in_flight"] == 0)
+    assert pool.submit(audio).result().endswith(f":{os.getpid()}")
+
+
+def test_batch_without_batch_function_is_decoded_one_by_one(make_pool):
+    pool = make_pool(workers=0, queue_size=0)
+    texts = pool.submit_batch([np.zeros(1, dtype=np.float32), np.zeros(2, dtype=np.float32)]).result()
+    assert [t.split(":")[1] for t in texts] == ["1", "2"]
+    assert wait_until(lambda: pool.stats()["in_flight"] == 0)
+
+
+def test_micro_batch_burst_is_split_across_workers(make_pool, add_project_root_to_sys_path):
+    batching = importlib.import_module('app.stt_batching')
+    pool = make_pool(workers=2, queue_size=4, transcribe_batch=slow_transcribe_batch)
+    pool.start()
+
+    async def burst():
+        batcher = batching.MicroBatcher(pool.transcribe_many, max_batch_size=4, max_wait_ms=20)
+        started = time.perf_counter()
+        texts = await asyncio.gather(*(batcher.transcribe(np.zeros(n, dtype=np.float32)) for n in (1, 2, 3, 4)))
+        return texts, time.perf_counter() - started, batcher.batches
+
+    texts, elapsed, batches = asyncio.run(burst())
+    assert batches == 1
+    assert [t.split(":")[1] for t in texts] == ["1", "2", "3", "4"]
+    assert len({t.split(":")[2] for t in texts}) == 2
+    assert elapsed < 0.55
+
+
+def test_micro_batch_never_leaves_chunks_queued_when_pool_is_busy(make_pool, pool_module):
+    pool = make_pool(workers=2, queue_size=0, transcribe_batch=slow_transcribe_batch)
+    pool.start()
+    audios = [np.zeros(n, dtype=np.float32) for n in (1, 2, 3, 4)]
+
+    # One slot left: the burst goes to it as a single chunk instead of half of it being rejected
+    busy = pool.submit(np.zeros(5, dtype=np.float32))
+    texts = asyncio.run(pool.transcribe_many(audios))
+    assert [t.split(":")[1] for t in texts] == ["1", "2", "3", "4"]
+    assert len({t.split(":")[2] for t in texts}) == 1
+    busy.result()
+    assert wait_until(lambda: pool.stats()["in_flight"] == 0)
+
+    # No slot left: nothing is submitted at all
+    futures = [pool.submit(np.zeros(1, dtype=np.float32)) for _ in range(2)]
+    with pytest.raises(pool_module.STTPoolBusyError):
+        asyncio.run(pool.transcribe_many(audios))
+    assert pool.stats()["in_flight"] == 2
+    for future in futures:
+        future.result()
+    assert wait_until(lambda: pool.stats()["in_flight"] == 0)
@@ -0,0 +1,131 @@
+import asyncio
+import importlib
+import json
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+pytest.importorskip("telegram")
+
+VOICE_BYTES = b"OggS" + b"\x00" * 60
+
+
+@pytest.fixture
+def bot(add_project_root_to_sys_path, monkeypatch):
+    module = importlib.import_module('interfaces.telegram_bot')
+    monkeypatch.setattr(module, "NOX_CORE_API_URL", "http://core/command/telegram")
+    monkeypatch.setattr(module, "NOX_STT_API_URL", "http://stt/transcribe")
+    monkeypatch.setattr(module, "NOX_STT_RAW_API_URL", None)
+    return module
+
+
+class FakeMessage:
+    def __init__(self, chat_id: int, text: str = None, voice=None):
+        self.from_user = SimpleNamespace(id=chat_id)
+        self.chat_id = chat_id
+        self.text = text
+        self.voice = voice
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+
+
+class FakeVoiceFile:
+    async def download_as_bytearray(self):
+        return bytearray(VOICE_BYTES)
+
+
+def make_context(stt_handler, core_requests: list):
+    async def core_handler(request):
+        core_requests.append(json.loads(request.content))
+        return httpx.Response(200, json={"status": "ok"})
+
+    async def get_file(file_id):
+        assert file_id == "voice-1"
+        return FakeVoiceFile()
+
+    bot_data = {
+        "allowed_user_ids": [],
+        "stt_client": httpx.AsyncClient(transport=httpx.MockTransport(stt_handler)),
+        "core_client": httpx.AsyncClient(transport=httpx.MockTransport(core_handler)),
+    }
+    return SimpleNamespace(bot_data=bot_data, bot=SimpleNamespace(get_file=get_file))
+
+
+def voice_update(chat_id: int = 42):
+    voice = SimpleNamespace(file_id="voice-1", mime_type="audio/ogg")
+    return SimpleNamespace(message=FakeMessage(chat_id, voice=voice))
+
+
+def test_voice_note_goes_from_memory_to_stt_and_core(bot, monkeypatch):
+    monkeypatch.setattr(bot, "NOX_STT_RAW_API_URL", "http://stt/transcribe/raw")
+    stt_requests, core_requests = [], []
+
+    async def stt_handler(request):
+        stt_requests.append(request)
+        return httpx.Response(200, json={"text": "включи свет"})
+
+    context = make_context(stt_handler, core_requests)
+    update = voice_update()
+    asyncio.run(bot.handle_voice_message(update, context))
+
+    assert str(stt_requests[0].url) == "http://stt/transcribe/raw"
+    assert stt_requests[0].headers["content-type"] == "audio/ogg"
+    assert stt_requests[0].content == VOICE_BYTES
+    assert core_requests == [{"history": [{"role": "user", "content": "включи свет"}], "chat_id": 42, "is_voice": True}]
+    assert update.message.replies == []
+
+
+def test_unrecognised_voice_and_stt_errors_are_reported(bot):
+    answers = iter([httpx.Response(200, json={"text": ""}), httpx.Response(500, text="boom")])
+
+    async def stt_handler(request):
+        assert request.headers["content-type"].startswith("multipart/form-data")
+        return next(answers)
+
+    core_requests = []
+    context = make_context(stt_handler, core_requests)
+    first, second = voice_update(), voice_update()
+    asyncio.run(bot.handle_voice_message(first, context))
+    asyncio.run(bot.handle_voice_message(second, context))
+
+    assert core_requests == []
+    assert first.message.replies == ["Прости, Искра, я не смог разобрать твое голосовое сообщение."]
+    assert second.message.replies == ["Прости, мое 'ухо' сейчас барахлит."]
+
+
+def test_voice_messages_do_not_block_each_other(bot):
+    async def slow_stt(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"text": "привет"})
+
+    core_requests = []
+    context = make_context(slow_stt, core_requests)
+
+    async def run():
+        started = time.perf_counter()
+        await asyncio.gather(*(bot.handle_voice_message(voice_update(chat_id), context) for chat_id in range(5)))
+        return time.perf_counter() - started
+
+    assert asyncio.run(run()) < 0.6
+    assert sorted(request["chat_id"] for request in core_requests) == list(range(5))
+
+
+def test_application_caps_concurrency_and_shares_clients(bot):
+    config = {"telegram_bot": {"token": "123456:TEST", "max_concurrent_updates": 3}}
+    application = bot.build_application(config)
+    assert application.update_processor.max_concurrent_updates == 3
+
+    async def lifecycle():
+        await application.post_init(application)
+        clients = application.bot_data["core_client"], application.bot_data["stt_client"]
+        assert all(isinstance(client, httpx.AsyncClient) for client in clients)
+        await application.post_shutdown(application)
+        return clients
+
+    core_client, stt_client = asyncio.run(lifecycle())
+    assert core_client.is_closed and stt_client.is_closed
+    assert "core_client" not in application.bot_data
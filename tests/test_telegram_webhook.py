@@ -0,0 +1,159 @@
+import importlib
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+from fastapi import FastAPI
+
+from fake_telegram import FakeTelegram, text_update, voice_update
+from helpers import wait_until
+
+SECRET = "s3cret-token"
+VOICE_BYTES = b"OggS" + b"\x01" * 120
+
+
+@pytest.fixture
+def fake_telegram():
+    server = FakeTelegram()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def webhook_module(add_project_root_to_sys_path):
+    return importlib.import_module('app.telegram_webhook')
+
+
+class CoreAPI:
+    """What api_server passes as handle_command: blocks like the synchronous CoreEngine, records commands."""
+
+    def __init__(self, delay: float = 0.0, reply: str = None):
+        self.delay = delay
+        self.reply = reply
+        self.commands = []
+
+    def __call__(self, history, is_voice, chat_id):
+        time.sleep(self.delay)
+        self.commands.append((history[-1]["content"], is_voice, chat_id))
+        return self.reply
+
+
+@pytest.fixture
+def serve_webhook(webhook_module, fake_telegram):
+    """Runs a Core-API-like app with the webhook router under uvicorn; returns the TelegramWebhook."""
+    servers = []
+
+    def _serve(core, stt_handler=None, **bot_settings):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        config = {
+            "telegram_bot": {"token": fake_telegram.token, "mode": "webhook", "api_base_url": fake_telegram.base_url,
+                             "webhook": {"url": f"http://127.0.0.1:{port}/telegram/webhook", "secret_token": SECRET},
+                             **bot_settings},
+            "api_endpoints": {"nox_stt": "http://stt/transcribe", "nox_stt_raw": "http://stt/transcribe/raw"},
+        }
+        webhook = webhook_module.TelegramWebhook(config, core)
+        if stt_handler is not None:
+            webhook._stt_client = httpx.AsyncClient(transport=httpx.MockTransport(stt_handler))
+        app = FastAPI()
+        app.include_router(webhook_module.make_webhook_router(webhook))
+        server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+        thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+        thread.start()
+        assert wait_until(lambda: server.started)
+        servers.append((server, thread))
+        return webhook
+
+    yield _serve
+    for server, thread in servers:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def test_registers_webhook_with_secret(serve_webhook, fake_telegram):
+    webhook = serve_webhook(CoreAPI())
+    assert fake_telegram.webhook == {"url": webhook.webhook_url, "secret_token": SECRET, "allowed_updates": ["message"]}
+
+
+def test_answers_immediately_and_processes_in_background(serve_webhook, fake_telegram):
+    core = CoreAPI(delay=0.5, reply="Готово, свет включен.")
+    serve_webhook(core)
+
+    # The second delivery arrives while the engine is still blocked on the first
+    started = time.perf_counter()
+    first = fake_telegram.deliver(text_update(42, "включи свет"))
+    second = fake_telegram.deliver(text_update(43, "выключи свет"))
+    elapsed = time.perf_counter() - started
+
+    assert first.status_code == second.status_code == 200 and second.json() == {"ok": True}
+    assert elapsed < 0.4
+    assert core.commands == []
+    assert wait_until(lambda: len(fake_telegram.sent_messages) == 2)
+    # The engine ran off the event loop: both commands were in flight at once
+    assert time.perf_counter() - started < 0.9
+    assert sorted(core.commands) == [("включи свет", False, 42), ("выключи свет", False, 43)]
+    assert sorted(m["chat_id"] for m in fake_telegram.sent_messages) == [42, 43]
+    assert {m["text"] for m in fake_telegram.sent_messages} == {"Готово, свет включен."}
+
+
+def test_rejects_missing_or_wrong_secret(serve_webhook, fake_telegram):
+    core = CoreAPI()
+    serve_webhook(core)
+    update = text_update(42, "выключи свет")
+    assert fake_telegram.deliver(update, secret_token="wrong").status_code == 403
+    assert httpx.post(fake_telegram.webhook["url"], json=update).status_code == 403
+    time.sleep(0.1)
+    assert core.commands == []
+
+
+def test_voice_is_downloaded_into_memory_and_transcribed(serve_webhook, fake_telegram):
+    stt_requests = []
+
+    async def stt_handler(request):
+        stt_requests.append(request)
+        return httpx.Response(200, json={"text": "какая температура в спальне"})
+
+    core = CoreAPI()
+    serve_webhook(core, stt_handler)
+    fake_telegram.add_file("voice-7", VOICE_BYTES)
+
+    assert fake_telegram.deliver(voice_update(42, "voice-7")).status_code == 200
+    assert wait_until(lambda: core.commands == [("какая температура в спальне", True, 42)])
+    assert fake_telegram.downloads == 1
+    assert str(stt_requests[0].url) == "http://stt/transcribe/raw"
+    assert stt_requests[0].content == VOICE_BYTES
+
+
+def test_unrecognised_voice_is_answered_without_core(serve_webhook, fake_telegram):
+    async def stt_handler(request):
+        return httpx.Response(200, json={"text": ""})
+
+    core = CoreAPI()
+    serve_webhook(core, stt_handler)
+    fake_telegram.add_file("voice-8", VOICE_BYTES)
+
+    fake_telegram.deliver(voice_update(42, "voice-8"))
+    assert wait_until(lambda: fake_telegram.sent_messages)
+    assert fake_telegram.sent_messages == [
+        {"chat_id": 42, "text": "Прости, Искра, я не смог разобрать твое голосовое сообщение."}]
+    assert core.commands == []
+
+
+def test_filters_users_commands_and_redeliveries(serve_webhook, fake_telegram):
+    core = CoreAPI()
+    serve_webhook(core, allowed_user_ids=[42])
+    update = text_update(42, "привет")
+
+    fake_telegram.deliver(text_update(7, "чужой"))
+    fake_telegram.deliver(text_update(42, "/start"))
+    fake_telegram.deliver(update)
+    fake_telegram.deliver(update)  # Telegram retried: same update_id
+
+    assert wait_until(lambda: core.commands)
+    time.sleep(0.1)
+    assert core.commands == [("привет", False, 42)]
@@ -0,0 +1,67 @@
+import importlib
+import time
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def cache_module(add_project_root_to_sys_path):
+    return importlib.import_module('app.transcription_cache')
+
+
+def test_key_covers_bytes_and_model_settings(cache_module):
+    make_key = cache_module.TranscriptionCache.make_key
+    assert make_key(b"voice", "whisper:small:ru") == make_key(b"voice", "whisper:small:ru")
+    assert make_key(b"voice", "whisper:small:ru") != make_key(b"voice!", "whisper:small:ru")
+    assert make_key(b"voice", "whisper:small:ru") != make_key(b"voice", "whisper:small:en")
+
+
+def test_lru_eviction_and_hit_ratio(cache_module):
+    cache = cache_module.TranscriptionCache(max_entries=2)
+    cache.put("a", "включи свет")
+    cache.put("b", "выключи свет")
+    assert cache.get("a") == "включи свет"  # "a" becomes most recent
+    cache.put("c", "какая температура")
+    assert cache.get("b") is None
+    assert cache.get("c") == "какая температура"
+    assert cache.stats() == {"entries": 2, "max_entries": 2, "hits": 2, "misses": 1, "hit_ratio": 0.667}
+
+
+def test_failed_transcripts_are_not_cached(cache_module):
+    cache = cache_module.TranscriptionCache()
+    cache.put("a", None)
+    assert len(cache) == 0
+    cache.put("silence", "")
+    assert cache.get("silence") == ""
+
+
+def test_hit_is_fast(cache_module):
+    cache = cache_module.TranscriptionCache()
+    key = cache.make_key(b"\x00" * 64000, "whisper:small:ru")
+    cache.put(key, "включи свет")
+    started = time.perf_counter()
+    for _ in range(1000):
+        cache.get(key)
+    assert (time.perf_counter() - started) / 1000 < 50e-6
+
+
+def test_persisted_cache_survives_restart(cache_module, tmp_path):
+    path = tmp_path / "stt_cache.json"
+    cache = cache_module.TranscriptionCache(persist_path=path, save_every=2)
+    cache.put("a", "включи свет")
+    assert not path.exists()
+    cache.put("b", "выключи свет")
+    assert path.exists()
+
+    restored = cache_module.TranscriptionCache(max_entries=1, persist_path=path)
+    assert len(restored) == 1
+    assert restored.get("b") == "выключи свет"
+
+
+def test_corrupted_cache_file_starts_empty(cache_module, tmp_path):
+    path = tmp_path / "stt_cache.json"
+    path.write_text("{broken", encoding="utf-8")
+    cache = cache_module.TranscriptionCache(persist_path=path)
+    assert len(cache) == 0
+    cache.put("a", "ok")
+    assert cache.save()
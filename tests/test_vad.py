@@ -0,0 +1,80 @@
+import importlib
+from unittest import mock
+
+import numpy as np
+import pytest
+
+RATE = 16000
+
+
+def speech(seconds: float, amplitude: float = 0.3) -> np.ndarray:
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 180 * t) * (1 + 0.5 * np.sin(2 * np.pi * 4 * t))).astype(np.float32)
+
+
+def noise(seconds: float, level: float = 0.001, seed: int = 0) -> np.ndarray:
+    return (level * np.random.default_rng(seed).standard_normal(int(seconds * RATE))).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def vad(add_project_root_to_sys_path):
+    return importlib.import_module('app.vad')
+
+
+def test_all_silence_has_no_segments(vad):
+    segments, removed = vad.split_speech(noise(3.0))
+    assert segments == []
+    assert removed == 3.0
+
+
+def test_leading_and_trailing_silence_is_trimmed(vad):
+    audio = np.concatenate((noise(1.0), speech(1.0), noise(4.0, seed=1)))
+    (start, end), = vad.speech_segments(audio, padding_ms=200)
+    assert start / RATE == pytest.approx(0.8, abs=0.05)
+    assert end / RATE == pytest.approx(2.2, abs=0.05)
+    _, removed = vad.split_speech(audio)
+    assert removed == pytest.approx(6.0 - 1.4, abs=0.1)
+
+
+def test_long_pause_splits_and_short_pause_merges(vad):
+    audio = np.concatenate((speech(0.8), noise(0.3), speech(0.5), noise(2.0, seed=1), speech(0.6)))
+    segments, _ = vad.split_speech(audio, max_pause_seconds=1.0, padding_ms=0)
+    assert [round(len(s) / RATE, 1) for s in segments] == [1.6, 0.6]
+
+
+def test_quiet_fricative_is_kept_by_zero_crossing_rate(vad):
+    hiss = noise(0.3, level=0.03, seed=2)  # Quiet but noisy, like "с"
+    audio = np.concatenate((noise(1.0), hiss, speech(0.5), noise(1.0, seed=1)))
+    (start, _), = vad.speech_segments(audio, padding_ms=0)
+    assert start / RATE == pytest.approx(1.0, abs=0.05)
+
+
+def test_clip_without_pauses_is_kept_whole(vad):
+    audio = speech(2.0)
+    segments, removed = vad.split_speech(audio)
+    assert len(segments) == 1
+    assert removed == 0.0
+
+
+@pytest.fixture
+def stt_engine(add_project_root_to_sys_path, monkeypatch):
+    # Import without loading a real model: an unknown backend name fails fast
+    config_loader = importlib.import_module('app.config_loader')
+    monkeypatch.setattr(config_loader, "load_settings", mock.Mock(return_value={"stt_engine": {"backend": "none"}}))
+    return importlib.import_module('app.stt_engine')
+
+
+def test_engine_skips_decoding_silence_and_reports_trim(stt_engine, monkeypatch):
+    backend = mock.Mock()
+    backend.transcribe_batch.side_effect = lambda segments: ["включи", "свет"][:len(segments)]
+    monkeypatch.setattr(stt_engine, "STT_BACKEND", backend)
+    monkeypatch.setattr(stt_engine, "VAD_ENABLED", True)
+
+    silent = stt_engine.transcribe_speech(noise(5.0))
+    assert silent == {"text": "", "audio_seconds": 5.0, "trimmed_seconds": 5.0}
+    backend.transcribe_batch.assert_not_called()
+
+    result = stt_engine.transcribe_speech(np.concatenate((speech(0.5), noise(2.0), speech(0.5), noise(2.0, seed=1))))
+    assert result["text"] == "включи свет"
+    assert result["trimmed_seconds"] > 2.5
+    assert len(backend.transcribe_batch.call_args.args[0]) == 2